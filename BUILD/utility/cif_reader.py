@@ -0,0 +1,271 @@
+import re
+import sys
+
+''' Single pass reader for *.cif files. The file is tokenized once and the
+cell parameters and loops are cached for the other BUILD utilities. The
+rows of the atom site table are streamed from the file when they are
+used, so large cells are never held in memory.
+ '''
+
+class CifLoop(object):
+    ''' Holds one loop_ block of the cif file
+    Attributes:
+        offset: int, file offset of the loop_ line
+        tags: list of string, tags in the order of the columns
+        columns: dict, tag -> column index
+        rows: list of list of string, one list of values per row, None if
+            the rows are streamed from the file
+        nrow: int, number of rows
+        '''
+
+    def __init__(self, offset):
+        self.offset = offset
+        self.tags = []
+        self.columns = {}
+        self.rows = []
+        self.nrow = 0
+        self.nvalue = 0
+        self.values = []
+
+    def AddTag(self, tag):
+        self.columns[tag] = len(self.tags)
+        self.tags.append(tag)
+
+    def AddValue(self, value):
+        self.nvalue += 1
+        if self.rows is not None:
+            self.values.append(value)
+
+    def Close(self):
+        ncol = len(self.tags)
+        self.nrow = self.nvalue // ncol
+        if self.rows is not None:
+            self.rows = [self.values[i:i + ncol] for i in range(0, self.nrow * ncol, ncol)]
+        self.values = []
+
+    def HasTag(self, tag):
+        return tag in self.columns
+
+    def GetColumn(self, tag):
+        ''' Return the values of the tag column as a list of string'''
+        index = self.columns[tag]
+        return [row[index] for row in self.rows]
+
+
+class CifData(object):
+    ''' Read the cif file once and cache its content
+    Attributes:
+        cif_file: string, cif file name
+        items: dict, tag -> value of the tags outside loops
+        loops: list of CifLoop
+        atomLoop: CifLoop, loop holding _atom_site_fract_x/y/z, its rows
+            are read by AtomSites()
+        hasCharge: boolean, if atom site table has _atom_site_charge
+        natom: int, number of atoms in the atom site table
+        '''
+
+    tag_label = "_atom_site_label"
+    tag_symbol = "_atom_site_type_symbol"
+    tag_x = "_atom_site_fract_x"
+    tag_y = "_atom_site_fract_y"
+    tag_z = "_atom_site_fract_z"
+    tag_charge = "_atom_site_charge"
+
+    def __init__(self, cif_file):
+        self.cif_file = cif_file
+        self.items = {}
+        self.loops = []
+        self.atomLoop = None
+        self.hasCharge = False
+        self.natom = 0
+        self.Read()
+        self.SetAtomSite()
+
+    @staticmethod
+    def Tokenize(line):
+        ''' Split a line on white space, keeping quoted strings together'''
+        tokens = re.findall(r"'[^']*'(?=\s|$)|\"[^\"]*\"(?=\s|$)|\S+", line)
+        return [t[1:-1] if t[0] in "'\"" and len(t) > 1 else t for t in tokens]
+
+    def Scan(self, infile):
+        ''' Tokenize the cif file, opened in binary mode, from its current
+        position. Yields (kind, tag, value) events: ('item', tag, value)
+        for the tags outside loops, ('loop', offset, None) at a loop_ line
+        starting at that file offset, ('tag', tag, None) and
+        ('value', None, value) inside the loop and ('end', None, None)
+        when the loop ends'''
+        offset = infile.tell()
+        inLoop = False
+        nvalue = 0
+        pendingTag = None
+        inText = False
+        textValue = []
+
+        for raw in infile:
+            start = offset
+            offset += len(raw)
+            line = raw.decode('utf-8', 'replace')
+            #multi line text field between two ';' lines
+            if line.startswith(';'):
+                if inText:
+                    inText = False
+                    value = "\n".join(textValue)
+                    if pendingTag is not None:
+                        yield ('item', pendingTag, value)
+                        pendingTag = None
+                    elif inLoop:
+                        nvalue += 1
+                        yield ('value', None, value)
+                else:
+                    inText = True
+                    textValue = [line[1:].rstrip("\r\n")]
+                continue
+            if inText:
+                textValue.append(line.rstrip("\r\n"))
+                continue
+
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+
+            tokens = CifData.Tokenize(line)
+            if tokens[0] == "loop_":
+                if inLoop:
+                    yield ('end', None, None)
+                inLoop = True
+                nvalue = 0
+                pendingTag = None
+                yield ('loop', start, None)
+            elif tokens[0].startswith("_"):
+                if inLoop and nvalue == 0:
+                    for t in tokens:
+                        if t.startswith("_"):
+                            yield ('tag', t, None)
+                    for t in tokens:
+                        if not t.startswith("_"):
+                            nvalue += 1
+                            yield ('value', None, t)
+                    continue
+                #a tag after the loop values ends the loop
+                if inLoop:
+                    yield ('end', None, None)
+                inLoop = False
+                if len(tokens) > 1:
+                    yield ('item', tokens[0], tokens[1])
+                    pendingTag = None
+                else:
+                    pendingTag = tokens[0]
+            elif tokens[0].startswith("data_"):
+                if inLoop:
+                    yield ('end', None, None)
+                inLoop = False
+                pendingTag = None
+            elif pendingTag is not None:
+                yield ('item', pendingTag, tokens[0])
+                pendingTag = None
+            elif inLoop:
+                for t in tokens:
+                    nvalue += 1
+                    yield ('value', None, t)
+
+        if inLoop:
+            yield ('end', None, None)
+
+    def Read(self):
+        ''' Tokenize the cif file in a single pass. The values of the
+        first loop holding _atom_site_fract_x are only counted'''
+        loop = None
+        streamed = False
+        with open(self.cif_file, 'rb') as infile:
+            for kind, tag, value in self.Scan(infile):
+                if kind == 'item':
+                    self.items.setdefault(tag, value)
+                elif kind == 'loop':
+                    loop = CifLoop(tag)
+                elif kind == 'tag':
+                    loop.AddTag(tag)
+                elif kind == 'value':
+                    if loop.nvalue == 0 and not streamed and loop.HasTag(self.tag_x):
+                        loop.rows = None
+                        streamed = True
+                    loop.AddValue(value)
+                elif kind == 'end':
+                    self.CloseLoop(loop)
+
+    def CloseLoop(self, loop):
+        if loop.tags:
+            loop.Close()
+            self.loops.append(loop)
+
+    def Rows(self, loop):
+        ''' Yield the rows of the loop, reading them from the file if they
+        are not kept'''
+        if loop.rows is not None:
+            for row in loop.rows:
+                yield row
+            return
+        ncol = len(loop.tags)
+        row = []
+        with open(self.cif_file, 'rb') as infile:
+            infile.seek(loop.offset)
+            for kind, tag, value in self.Scan(infile):
+                if kind == 'value':
+                    row.append(value)
+                    if len(row) == ncol:
+                        yield row
+                        row = []
+                elif kind == 'end':
+                    return
+
+    def GetLoop(self, tag):
+        ''' Return the first loop that holds the tag, None if no such loop'''
+        for loop in self.loops:
+            if loop.HasTag(tag):
+                return loop
+        return None
+
+    def GetValue(self, tag):
+        ''' Return the value of the tag outside loops, None if not found'''
+        return self.items.get(tag)
+
+    def GetFloat(self, tag):
+        ''' Return the numerical value of the tag, dropping the standard
+        uncertainty in parentheses, e.g. 10.52(3)'''
+        value = self.GetValue(tag)
+        if value is None:
+            print("ERROR: No %s tag detected in %s" % (tag, self.cif_file))
+            sys.exit(-1)
+        return CifData.ToFloat(value)
+
+    @staticmethod
+    def ToFloat(value):
+        return float(value.split('(')[0])
+
+    def SetAtomSite(self):
+        ''' Find the atom site table'''
+        self.atomLoop = self.GetLoop(self.tag_x)
+        if not self.HasAtomSite():
+            return
+        self.hasCharge = self.atomLoop.HasTag(self.tag_charge)
+        self.natom = self.atomLoop.nrow
+
+    def AtomSites(self):
+        ''' Yield the symbol, fractional coordinates and charge of every
+        atom in the atom site table. The charge is zero if hasCharge is
+        False'''
+        if not self.HasAtomSite():
+            return
+        loop = self.atomLoop
+        #fall back to the atom label, then the first column, if there is
+        #no type symbol
+        symbol = loop.columns.get(self.tag_symbol, loop.columns.get(self.tag_label, 0))
+        xyz = [loop.columns[tag] for tag in (self.tag_x, self.tag_y, self.tag_z)]
+        charge = loop.columns.get(self.tag_charge)
+        for row in self.Rows(loop):
+            frac = [CifData.ToFloat(row[i]) for i in xyz]
+            q = 0.0 if charge is None else CifData.ToFloat(row[charge])
+            yield row[symbol], frac, q
+
+    def HasAtomSite(self):
+        return (self.atomLoop is not None and self.atomLoop.HasTag(self.tag_y)
+                and self.atomLoop.HasTag(self.tag_z))
@@ -30,11 +30,12 @@ class System(object):
         self.model = e.find('model').text
         self.par_file = "Parameters_" + self.model + ".par"
 
-    def Write_Conf(self, file):
-        uf.replace_text(file, "ADSBNAME", self.adsorbate_name)
-        uf.replace_text(file, "FFIELD", self.model)
-        uf.replace_text(file, "DDD0", self.reservoir_dim)
-        uf.replace_text(file, "ADSBSET", self.adsorbate_resname)
+    def Write_Conf(self, conf):
+        ''' Replace the keywords in conf, a utility_functions.ConfigFile'''
+        conf.Replace("ADSBNAME", self.adsorbate_name)
+        conf.Replace("FFIELD", self.model)
+        conf.Replace("DDD0", self.reservoir_dim)
+        conf.Replace("ADSBSET", self.adsorbate_resname)
 
     def Print_summary(self):
         print("%-20s: %-s" %("MODEL", self.model))
@@ -96,10 +97,10 @@ class Simulation(object):
                 temp = [self.simData[i][1], self.simData[i][2]]
                 return temp
 
-    def Write_Conf(self, file):
-        ''' Replace the keyword with value in config file'''
+    def Write_Conf(self, conf):
+        ''' Replace the keyword with value in conf, a utility_functions.ConfigFile'''
         for i in range(len(self.simData)):
-            uf.replace_text(file, self.simData[i][1], self.simData[i][2])
+            conf.Replace(self.simData[i][1], self.simData[i][2])
 
     def Print_summary(self):
         for i in range(len(self.simData)):
@@ -164,10 +165,10 @@ class Run_Simulation(object):
                 temp = [self.runSimData[idx][1][j][1], self.runSimData[idx][1][j][2]]
                 return temp
 
-    def Write_Conf(self, file, idx):
-        ''' Replace the keyword with value in config file'''
+    def Write_Conf(self, conf, idx):
+        ''' Replace the keyword with value in conf, a utility_functions.ConfigFile'''
         for j in range(len(self.runSimData[idx][1])):
-            uf.replace_text(file, self.runSimData[idx][1][j][1], self.runSimData[idx][1][j][2])
+            conf.Replace(self.runSimData[idx][1][j][1], self.runSimData[idx][1][j][2])
 
     def Print_summary(self):
         for i in range(len(self.runSimData)):
@@ -230,20 +231,27 @@ class ConfigBuilder(object):
         print("CELL BASIS VECTOR 2: " + self.box_0_vector3)
 
     def Write_SimData(self, file):
-        uf.replace_text(file, "MOFNAME", self.mof_name)
-        uf.replace_text(file, "DDD1", self.box_0_vector1)
-        uf.replace_text(file, "DDD2", self.box_0_vector2)
-        uf.replace_text(file, "DDD3", self.box_0_vector3)
-        uf.replace_text(file, "BASEFUGACITY", self.mof_name[:4] + "   0.0")
-        self.sys.Write_Conf(file)
-        self.sim.Write_Conf(file)
+        #apply every keyword in memory and write the config file once
+        conf = uf.ConfigFile(file)
+        conf.Replace("MOFNAME", self.mof_name)
+        conf.Replace("DDD1", self.box_0_vector1)
+        conf.Replace("DDD2", self.box_0_vector2)
+        conf.Replace("DDD3", self.box_0_vector3)
+        conf.Replace("BASEFUGACITY", self.mof_name[:4] + "   0.0")
+        self.sys.Write_Conf(conf)
+        self.sim.Write_Conf(conf)
+        conf.Write()
 
     def Write_runData(self, file, runID, dir):
-        self.runSim.Write_Conf(file, runID)
-        uf.replace_text("gcmc_cluster.cmd", "RUN-DIR", dir)
-        uf.replace_text("gcmc_cluster.cmd", "MOFNAME", self.mof_name)
-        uf.replace_text("gcmc_cluster.cmd", "ADSBNAME", self.sys.adsorbate_name)
-        uf.replace_text("gcmc_cluster.cmd", "FFF", self.runSim.FindVal(runID, 'fugacity'))
+        conf = uf.ConfigFile(file)
+        self.runSim.Write_Conf(conf, runID)
+        conf.Write()
+        cmd = uf.ConfigFile("gcmc_cluster.cmd")
+        cmd.Replace("RUN-DIR", dir)
+        cmd.Replace("MOFNAME", self.mof_name)
+        cmd.Replace("ADSBNAME", self.sys.adsorbate_name)
+        cmd.Replace("FFF", self.runSim.FindVal(runID, 'fugacity'))
+        cmd.Write()
 
     def HasElect(self):
         return (self.sim.FindVal('electrostatic').lower() == 'true')
@@ -4,6 +4,7 @@ import math
 import re
 import numpy as np
 import top_generator as topGen
+import cif_reader
 import utility_functions as uf 
 
 ''' This python code will extend and generate XYZ file for 
@@ -65,6 +66,16 @@ class Cell(object):
         slantScaled = np.matmul(coordExtended, cell_b)
         return slantScaled
 
+    def ExtendAll(self, frac_coords, extend):
+        ''' Generate every periodic image of the (natom x 3) fractional
+        coordinates in one matrix product. Rows are ordered per atom and
+        then by extend_x, extend_y, extend_z, same as looping over Extend'''
+        len_array = np.array([self.cell_length_a, self.cell_length_b, self.cell_length_c])
+        cell_b = self.cell_basis * len_array
+        offsets = np.indices(extend).reshape(3, -1).T.astype(float)
+        coordExtended = frac_coords[:, np.newaxis, :] + offsets[np.newaxis, :, :]
+        return np.matmul(coordExtended.reshape(-1, 3), cell_b)
+
 
 
 class MOF_Data(object):
@@ -78,18 +89,21 @@ class MOF_Data(object):
         self.rcut2 = float(maxCutoff) * 2.0 + 0.1
         self.cell_length = np.zeros(3, dtype=float)
         self.cell_angle = np.zeros(3, dtype=float)
+        self.blockSize = 4096
+        #read the cif file once, every step below uses the cached data
+        self.cif = cif_reader.CifData(mof_file)
         self.SetCellData()
         self.cellBasis = Cell(self.cell_angle, self.cell_length)
         self.CalcMinCellExtend()
 
     def SetCellData(self):
         ''' Setting cell length and angle'''
-        cell_length_a = float(uf.FindParameter(self.cif_file, '_cell_length_a'))
-        cell_length_b = float(uf.FindParameter(self.cif_file, '_cell_length_b'))
-        cell_length_c = float(uf.FindParameter(self.cif_file, '_cell_length_c'))
-        cell_angle_alpha = float(uf.FindParameter(self.cif_file, '_cell_angle_alpha')) 
-        cell_angle_beta = float(uf.FindParameter(self.cif_file, '_cell_angle_beta'))
-        cell_angle_gamma = float(uf.FindParameter(self.cif_file, '_cell_angle_gamma'))
+        cell_length_a = self.cif.GetFloat('_cell_length_a')
+        cell_length_b = self.cif.GetFloat('_cell_length_b')
+        cell_length_c = self.cif.GetFloat('_cell_length_c')
+        cell_angle_alpha = self.cif.GetFloat('_cell_angle_alpha')
+        cell_angle_beta = self.cif.GetFloat('_cell_angle_beta')
+        cell_angle_gamma = self.cif.GetFloat('_cell_angle_gamma')
         self.cell_length = np.array([cell_length_a, cell_length_b, cell_length_c])
         self.cell_angle = np.array([cell_angle_alpha, cell_angle_beta, cell_angle_gamma])
         self.cell_angle = self.cell_angle * math.pi / 180.0
@@ -114,49 +128,35 @@ class MOF_Data(object):
     def WriteXYZ(self, top_file):
         ''' Writing XYZ data calculated extension. and create Topology file'''
         # detect the tag in cif file
-        cif_data = topGen.TopGenerate(self.cif_file)
+        cif_data = topGen.TopGenerate(self.cif_file, self.cif)
         cif_data.DetectTag()
         cif_data.ReadCharges()
         #create the topology with extension
         topGen.MakeTopology(cif_data, top_file, self.extend[0] * self.extend[1] * self.extend[2])
 
-        #Reading cif file
-        reachedAtom = False
-        molCount = 0
+        images = int(np.prod(self.extend))
 
         with open(self.output_file, 'w') as outfile:
-            outfile.write("TOTALATOM\n")
+            outfile.write("%d\n" % (self.cif.natom * images))
             outfile.write(self.mof_name + "\n")
-            with open(self.cif_file, 'r') as infile:
-                for line in infile:
-                    line = re.sub(' +', ' ', line).strip()
-                    if line.startswith(cif_data.startTag):
-                        reachedAtom = True
-                        continue
-                    
-                    if(reachedAtom):
-                        if(line.startswith(cif_data.endTag)):
-                            break
-
-                        atom_name = line.split(' ')[cif_data.tag_symbol_indx]
-                        x = float(line.split(' ')[cif_data.tag_x_indx])
-                        y = float(line.split(' ')[cif_data.tag_y_indx])
-                        z = float(line.split(' ')[cif_data.tag_z_indx])
-
-                        if(cif_data.hasCharge):
-                            charge = float(line.split(' ')[cif_data.tag_charge_indx])
-                        else:
-                            charge = 0.0
-
-                        atom_name = cif_data.GetAtomName(atom_name, charge)
-                        frac_coord = np.array([x, y, z])
-                        for i in range(self.extend[0]):
-                            for j in range(self.extend[1]):
-                                for k in range(self.extend[2]):
-                                    coord = self.cellBasis.Extend(frac_coord, i, j, k)
-                                    to_print = "%4s %15.6f %15.6f %15.6f\n" % (atom_name, coord[0], coord[1], coord[2])
-                                    outfile.write(to_print)
-                                    molCount += 1
-
-
-        uf.replace_text(self.output_file, "TOTALATOM", str(molCount))
\ No newline at end of file
+            #expand a block of atoms at a time to bound memory for large supercells
+            for names, frac_coords in self.ReadAtoms(cif_data):
+                coords = self.cellBasis.ExtendAll(frac_coords, self.extend)
+                block = np.repeat(names, images)
+                outfile.write("".join(["%4s %15.6f %15.6f %15.6f\n" % (name, x, y, z)
+                                       for name, (x, y, z) in zip(block, coords)]))
+
+    def ReadAtoms(self, cif_data):
+        ''' Yield the atom names used in the topology and the fractional
+        coordinates of the cif atom site table, blockSize atoms at a time'''
+        names = []
+        frac_coords = []
+        for symbol, frac, charge in self.cif.AtomSites():
+            names.append(cif_data.GetAtomName(symbol, charge))
+            frac_coords.append(frac)
+            if len(names) == self.blockSize:
+                yield np.array(names), np.array(frac_coords, dtype=float)
+                names = []
+                frac_coords = []
+        if len(names) > 0:
+            yield np.array(names), np.array(frac_coords, dtype=float)
@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import glob
+import shutil
+import hashlib
+import argparse
+import traceback
+import contextlib
+import multiprocessing
+import config_builder as cb
+import extend_unit_cell as euc
+import utility_functions as uf
+
+''' High throughput build of MOF adsorption simulations. Every *.cif file
+in a directory is expanded to a supercell, its topology is generated and
+the config files for every run id in the setup file are written:
+
+    output/MOFNAME/MOFNAME.xyz, Topology.top and build.log
+    output/MOFNAME/RUN<id>-<name>-<value>.../ template files with
+        keywords replaced
+
+MOFs are built in parallel in a process pool. A MOF is skipped when the
+stamp of its inputs (cif file, setup file and templates) did not change
+since its last successful build.
+ '''
+
+STAMP_FILE = ".build_stamp"
+LOG_FILE = "build.log"
+TOP_FILE = "Topology.top"
+
+
+def GetStamp(cif_file, confSetup, template_dir):
+    ''' Hash of every input that affects the build of one MOF'''
+    digest = hashlib.sha256()
+    files = [cif_file, confSetup] + sorted(glob.glob(os.path.join(template_dir, "*")))
+    for filename in files:
+        if os.path.isfile(filename):
+            digest.update(os.path.basename(filename).encode())
+            with open(filename, 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def IsUpToDate(mof_dir, stamp):
+    stamp_file = os.path.join(mof_dir, STAMP_FILE)
+    if not os.path.isfile(stamp_file):
+        return False
+    with open(stamp_file, 'r') as file:
+        return file.read().strip() == stamp
+
+
+def CopyTemplates(template_dir, dest):
+    ''' Copy the run templates, the topology is built once per MOF'''
+    for filename in glob.glob(os.path.join(template_dir, "*")):
+        if os.path.isfile(filename) and os.path.basename(filename) != TOP_FILE:
+            shutil.copy(filename, dest)
+
+
+def BuildMOF(task):
+    ''' Build one MOF and all of its runs. Runs in a worker process, any
+    error (including sys.exit in the utilities) is returned instead of
+    raised so the other structures keep going.
+    Return [mof_name, status, message]'''
+    cif_file, confSetup, template_dir, output_dir, conf_file, force = task
+    mof_name = os.path.splitext(os.path.basename(cif_file))[0]
+    mof_dir = os.path.join(output_dir, mof_name)
+    stamp = GetStamp(cif_file, confSetup, template_dir)
+    if not force and IsUpToDate(mof_dir, stamp):
+        return [mof_name, "skipped", ""]
+
+    cwd = os.getcwd()
+    try:
+        if os.path.isdir(mof_dir):
+            shutil.rmtree(mof_dir)
+        os.makedirs(mof_dir)
+        shutil.copy(cif_file, mof_dir)
+        os.chdir(mof_dir)
+        with open(LOG_FILE, 'w') as log, contextlib.redirect_stdout(log):
+            builder = cb.ConfigBuilder(confSetup)
+            builder.mof_name = mof_name
+            #the MOF residue is appended to the adsorbate topology
+            if os.path.isfile(os.path.join(template_dir, TOP_FILE)):
+                shutil.copy(os.path.join(template_dir, TOP_FILE), TOP_FILE)
+
+            mof = euc.MOF_Data(os.path.basename(cif_file), mof_name, builder.GetRcut())
+            mof.WriteXYZ(TOP_FILE)
+            builder.Print_cellData(mof)
+
+            for runID in range(len(builder.runSim.runSimData)):
+                run_dir = builder.runSim.Summary_Str(runID)
+                uf.MakeDir(run_dir)
+                CopyTemplates(template_dir, run_dir)
+                os.chdir(run_dir)
+                builder.Write_SimData(conf_file)
+                if os.path.isfile("gcmc_cluster.cmd"):
+                    builder.Write_runData(conf_file, runID, os.getcwd())
+                else:
+                    conf = uf.ConfigFile(conf_file)
+                    builder.runSim.Write_Conf(conf, runID)
+                    conf.Write()
+                os.chdir(mof_dir)
+
+        with open(STAMP_FILE, 'w') as file:
+            file.write(stamp + "\n")
+        return [mof_name, "built", ""]
+    except (Exception, SystemExit):
+        message = traceback.format_exc().strip().split("\n")[-1]
+        log_file = os.path.join(mof_dir, LOG_FILE)
+        if os.path.isdir(mof_dir):
+            with open(log_file, 'a') as log:
+                log.write(traceback.format_exc())
+            message += " (see %s)" % log_file
+        return [mof_name, "failed", message]
+    finally:
+        os.chdir(cwd)
+
+
+def FindCIFs(confSetup, cif_dir):
+    ''' All cif files in cif_dir, or only the <mofname> of the setup file
+    if HTS is not active'''
+    system = cb.System(confSetup)
+    if system.build_all:
+        return sorted(glob.glob(os.path.join(cif_dir, "*.cif")))
+    cif_file = system.mof_file
+    if not cif_file.endswith(".cif"):
+        cif_file += ".cif"
+    return [os.path.join(cif_dir, cif_file)]
+
+
+def Build(confSetup, cif_dir, template_dir, output_dir, conf_file="in.conf",
+          processes=None, force=False):
+    ''' Build every MOF in cif_dir with a pool of processes, report the
+    progress and return the list of [mof_name, status, message]'''
+    confSetup = os.path.abspath(confSetup)
+    template_dir = os.path.abspath(template_dir)
+    output_dir = os.path.abspath(output_dir)
+    uf.MakeDir(output_dir)
+    cif_files = [os.path.abspath(f) for f in FindCIFs(confSetup, cif_dir)]
+    tasks = [(f, confSetup, template_dir, output_dir, conf_file, force) for f in cif_files]
+
+    results = []
+    start = time.time()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(BuildMOF, tasks):
+            results.append(result)
+            done = len(results)
+            elapsed = time.time() - start
+            eta = elapsed / done * (len(tasks) - done)
+            print("[%d/%d] %-30s %-8s elapsed %.1fs, eta %.1fs %s" %
+                  (done, len(tasks), result[0], result[1], elapsed, eta, result[2]))
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+    for status in ["built", "skipped", "failed"]:
+        print("%-8s: %d" % (status.upper(), len([r for r in results if r[1] == status])))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build MOF adsorption simulations in parallel")
+    parser.add_argument("setup", help="xml file with system, simulation and run_simulation")
+    parser.add_argument("cif_dir", help="directory holding the *.cif files")
+    parser.add_argument("template_dir", help="directory with the config templates, e.g. in.conf")
+    parser.add_argument("output_dir", help="directory where every MOF is built")
+    parser.add_argument("--conf", default="in.conf", help="config template to fill (default in.conf)")
+    parser.add_argument("-n", "--processes", type=int, default=None,
+                        help="number of worker processes (default all cores)")
+    parser.add_argument("--force", action="store_true", help="rebuild up to date MOFs")
+    args = parser.parse_args()
+
+    results = Build(args.setup, args.cif_dir, args.template_dir, args.output_dir,
+                    args.conf, args.processes, args.force)
+    sys.exit(1 if any(r[1] == "failed" for r in results) else 0)
@@ -24,11 +24,41 @@ def FindParameter(filename, keyword):
 def replace_textWithFile(filename, text_to_search, replacement_file):
     '''This function will replace <text_to_search> text with
     <replacement_file> file in <filename>'''
-    with open(replacement_file, 'r') as file:
-        for line in file:
-            replace_text(filename, text_to_search, line.upper() + text_to_search)
+    conf = ConfigFile(filename)
+    conf.ReplaceWithFile(text_to_search, replacement_file)
+    conf.Write()
+
+
+class ConfigFile(object):
+    ''' Hold a text file in memory so any number of keyword
+    replacements and file inclusions cost a single read and write.
+    Replacements are applied in the order they are called, the same as
+    repeated replace_text calls.
+    Attributes:
+        filename = string, file to read and write
+        text = string, current content of the file
+        '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'r') as file:
+            self.text = file.read()
+
+    def Replace(self, text_to_search, replacement_text):
+        self.text = self.text.replace(text_to_search, replacement_text)
+
+    def ReplaceWithFile(self, text_to_search, replacement_file):
+        ''' Replace <text_to_search> with the upper case content of
+        <replacement_file>'''
+        with open(replacement_file, 'r') as file:
+            replacement_text = "".join([line.upper() for line in file])
+        self.Replace(text_to_search, replacement_text)
 
-    replace_text(filename, text_to_search, '')
+    def Write(self, filename=None):
+        if filename is None:
+            filename = self.filename
+        with open(filename, 'w') as file:
+            file.write(self.text)
 
 # clean all files except the ones with filepattern
 def CleanDir(filepattern):
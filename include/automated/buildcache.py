@@ -0,0 +1,65 @@
+import hashlib
+import os
+import shutil
+
+
+class CacheParameters:
+    def __init__(self, root):
+        self.enabled = True
+        self.directory = 'BuildCache'
+        self.equilibration = False
+        cache = root.find('cache')
+        if cache is not None:
+            if cache.find('enabled') is not None:
+                self.enabled = cache.find('enabled').text.strip() == 'true'
+            if cache.find('directory') is not None:
+                self.directory = cache.find('directory').text.strip()
+            if cache.find('equilibration') is not None:
+                self.equilibration = (cache.find('equilibration').text.strip()
+                                      == 'true')
+
+
+# Content-addressed store of build artifacts. The key is the hash of every
+# input file after pattern substitution, so an entry is reused only when
+# nothing that went into it has changed.
+class BuildCache:
+    def __init__(self, cacheparameters, kind):
+        self.settings = cacheparameters
+        # absolute, since the build steps change the working directory
+        self.directory = os.path.abspath(
+            os.path.join(cacheparameters.directory, kind))
+
+    @staticmethod
+    def Key(filenames):
+        digest = hashlib.sha256()
+        for filename in filenames:
+            digest.update(os.path.basename(filename).encode())
+            with open(filename, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def Restore(self, key, directory):
+        entry = os.path.join(self.directory, key)
+        if not self.settings.enabled or not os.path.isdir(entry):
+            return False
+        for filename in os.listdir(entry):
+            shutil.copy(os.path.join(entry, filename), directory)
+        return True
+
+    def Store(self, key, directory, filenames):
+        if not self.settings.enabled:
+            return
+        entry = os.path.join(self.directory, key)
+        if os.path.isdir(entry):
+            return
+        # Fill a private directory first so a crashed or concurrent writer
+        # never leaves a partial entry behind
+        temporary = entry + '.tmp{}'.format(os.getpid())
+        os.makedirs(temporary)
+        for filename in filenames:
+            shutil.copy(os.path.join(directory, filename), temporary)
+        try:
+            os.rename(temporary, entry)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
@@ -1,30 +1,33 @@
-import xml.etree.ElementTree
-
 class Charge:
     def __init__(self, charge):
         self.pattern = charge['pattern']
+        self.reference = float(charge['reference'])
+        # Charges are searched as continuous dimensions named by pattern
+        self.name = self.pattern
+        self.kind = 'continuous'
+        self.count = int(charge['count'])
         if charge['dependent'] == 'true':
             self.dependent = True
         else:
             self.dependent = False
-            self.count = int(charge['count'])
             self.start = float(charge['start'])
             self.end = float(charge['end'])
-            self.reference = float(charge['reference'])
     
     def __str__(self):
         if self.dependent:
-            return '{} {}'.format(self.pattern, self.dependent)
+            return '{} {} {} {}'.format(self.pattern, self.dependent, self.reference, str(self.count))
         else:
             return '{} {} {} {} {}'.format(self.pattern, self.reference, str(self.count), str(self.start), str(self.end))
 
 class Charges:
-    def __init__(self, inputfile):
+    def __init__(self, root):
         self.charges = []
 
-        e = xml.etree.ElementTree.parse(inputfile).getroot()
+        # charges are optional
+        if root.find('charges') is None:
+            return
 
-        for ch in e.find('charges').findall('charge'):
+        for ch in root.find('charges').findall('charge'):
             charge = {}
             charge['pattern'] = ch.find('pattern').text
             charge['reference'] = ch.find('reference').text
@@ -33,8 +36,37 @@ class Charges:
                 charge['count'] = ch.find('count').text
                 charge['start'] = ch.find('start').text
                 charge['end'] = ch.find('end').text
+            elif ch.find('count') is not None:
+                charge['count'] = ch.find('count').text
+            else:
+                charge['count'] = '1'
             
             self.charges.append(Charge(charge))
 
     def GetDim(self):
-        return len(self.charges)
\ No newline at end of file
+        return len(self.charges)
+
+    def GetIndependent(self):
+        return [ch for ch in self.charges if not ch.dependent]
+
+    def GetIndependentDim(self):
+        return len(self.GetIndependent())
+
+    # Returns (pattern, value) for every charge given the values of the
+    # independent ones. The dependent charge keeps the molecule neutral:
+    # sum(count * charge) = 0.
+    def GetValues(self, values):
+        result = []
+        net = 0.0
+        independent = self.GetIndependent()
+        for index in range(len(independent)):
+            charge = independent[index]
+            result.append((charge.pattern, values[index]))
+            net += charge.count * values[index]
+        for charge in self.charges:
+            if charge.dependent:
+                result.append((charge.pattern, -net / charge.count))
+        return result
+
+    def GetReferenceValues(self):
+        return self.GetValues([ch.reference for ch in self.GetIndependent()])
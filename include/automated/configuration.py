@@ -0,0 +1,121 @@
+import xml.etree.ElementTree
+
+from parameter import Parameters
+from temperature import Temperatures
+from system import System
+from particleswarm import ParticleSwarmParameters
+from charges import Charges
+from buildcache import CacheParameters
+from optimizer import OptimizerParameters
+from convergence import ConvergenceParameters
+from initializer import InitializerParameters
+from metrics import MetricsParameters
+from reweighting import ReweightingParameters
+from scheduler import SchedulerParameters
+from accounting import AccountingParameters
+from islands import IslandParameters
+from noise import NoiseParameters
+from feasibility import FeasibilityParameters
+from refinement import RefinementParameters
+from validation import Validator, ConfigurationError
+
+
+# par.xml is parsed and validated once on rank 0; the resulting object is
+# broadcast to the other ranks.
+class Configuration:
+    def __init__(self, inputfile):
+        try:
+            root = xml.etree.ElementTree.parse(inputfile).getroot()
+        except (IOError, xml.etree.ElementTree.ParseError) as err:
+            raise ConfigurationError('Cannot read {}: {}'.format(inputfile,
+                                                                 err))
+        Configuration.Validate(root)
+
+        self.parameters = Parameters(root)
+        self.temperatures = Temperatures(root)
+        self.system = System(root)
+        self.psoparameters = ParticleSwarmParameters(root)
+        self.optparameters = OptimizerParameters(root)
+        self.convparameters = ConvergenceParameters(root)
+        self.initparameters = InitializerParameters(root)
+        self.metrics = MetricsParameters(root)
+        self.reweighting = ReweightingParameters(root)
+        self.scheduler = SchedulerParameters(root)
+        self.accounting = AccountingParameters(root)
+        self.islands = IslandParameters(root)
+        self.noise = NoiseParameters(root)
+        self.feasibility = FeasibilityParameters(root)
+        self.refinement = RefinementParameters(root)
+        self.charges = Charges(root)
+        self.cache = CacheParameters(root)
+
+    @staticmethod
+    def Validate(root):
+        validator = Validator()
+        validator.ValidateParameters(root, [('reference', float)])
+        validator.ValidateSearch(root)
+        validator.ValidateMetrics(root)
+        validator.ValidateReweighting(root)
+        validator.ValidateScheduler(root)
+        validator.ValidateAccounting(root)
+        validator.ValidateIslands(root)
+        validator.ValidateNoise(root)
+        validator.ValidateFeasibility(root)
+        validator.ValidateRefinement(root)
+
+        data = root.find('data')
+        if data is None or len(data.findall('temperature')) == 0:
+            validator.Check(False, 'missing <data> with at least one '
+                                   '<temperature>')
+        else:
+            for i, temp in enumerate(data.findall('temperature')):
+                context = 'temperature {}: '.format(i + 1)
+                validator.Require(temp, 'temp', float, 'pattern', context)
+                validator.Require(temp, 'molnumber_liq', int, 'pattern',
+                                  context)
+                validator.Require(temp, 'boxsize_liq', float, 'pattern',
+                                  context)
+                validator.Require(temp, 'eq_step', int, 'pattern', context)
+                validator.Require(temp, 'run_step', int, 'pattern', context)
+                validator.Require(temp, 'pressure', float, 'pattern', context)
+                validator.Require(temp, 'expt_liq', float, context=context)
+
+        system = root.find('system')
+        validator.Require(system, 'molname', attribute='pattern',
+                          context='system: ')
+        validator.Require(system, 'resname', attribute='pattern',
+                          context='system: ')
+        validator.Choice(system, 'builder', ['native', 'vmd'], 'system: ')
+        validator.Choice(system, 'packer', ['lattice', 'random', 'packmol'],
+                         'system: ')
+
+        charges = root.find('charges')
+        if charges is not None:
+            dependent = 0
+            for i, ch in enumerate(charges.findall('charge')):
+                context = 'charge {}: '.format(i + 1)
+                validator.Require(ch, 'pattern', context=context)
+                validator.Require(ch, 'reference', float, context=context)
+                kind = validator.Require(ch, 'dependent', context=context)
+                if kind == 'true':
+                    dependent += 1
+                    validator.Optional(ch, 'count', int, context)
+                elif kind == 'false':
+                    validator.Require(ch, 'count', int, context=context)
+                    validator.Require(ch, 'start', float, context=context)
+                    validator.Require(ch, 'end', float, context=context)
+                else:
+                    validator.Check(kind is None,
+                                    context + '<dependent> must be true or '
+                                              'false')
+            if len(charges.findall('charge')) > 0:
+                validator.Check(dependent == 1, 'charges: exactly one charge '
+                                                'must be dependent to keep '
+                                                'the molecule neutral')
+
+        cache = root.find('cache')
+        validator.Choice(cache, 'enabled', ['true', 'false'], 'cache: ')
+        validator.Choice(cache, 'equilibration', ['true', 'false'],
+                         'cache: ')
+
+        validator.Raise()
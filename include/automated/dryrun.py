@@ -0,0 +1,140 @@
+import os
+import shutil
+
+from configuration import Configuration
+from validation import ConfigurationError, DryRunReport
+from psfbuilder import Topology
+
+
+# Pre-flight check run with --dry-run: renders every template for a sample
+# particle at the reference values without building or simulating anything.
+class DryRun:
+    @staticmethod
+    def Run(numIt, nPop, filename):
+        try:
+            config = Configuration(filename)
+        except ConfigurationError as err:
+            print(err)
+            return 1
+        if config.convparameters.max_iterations is not None:
+            numIt = config.convparameters.max_iterations
+
+        report = DryRunReport()
+        parameters = config.parameters.parameters
+        temperatures = config.temperatures.temperatures
+        system = config.system
+
+        sample = [(par.pattern, par.reference) for par in parameters]
+        all_patterns = [par.pattern for par in parameters]
+        all_patterns += [system.molname_pattern, system.resname_pattern]
+        for temp in temperatures:
+            all_patterns += [temp.temperature_pattern,
+                             temp.molnumber_liq_pattern,
+                             temp.boxsize_liq_pattern, temp.eq_step_pattern,
+                             temp.run_step_pattern, temp.pressure_pattern]
+        charges = config.charges.GetReferenceValues()
+        all_patterns += [pattern for pattern, _ in charges]
+        all_patterns = list(set(all_patterns))
+
+        if len(charges) > 0:
+            report.Render('BUILD/model/Topology.top', charges, all_patterns)
+        else:
+            report.CheckFile('BUILD/model/Topology.top')
+        report.CheckFile('BUILD/pdb/' + system.molname + '.pdb')
+        if system.packer == 'packmol':
+            report.CheckExecutable('BUILD/pack/packmol')
+            report.Info('Packer: packmol')
+        elif system.packer == 'lattice':
+            if os.path.isfile('BUILD/pack/packmol'):
+                report.Info('Packer: lattice (built-in), falls back to '
+                            'BUILD/pack/packmol')
+            else:
+                report.Info('Packer: lattice (built-in), no packmol '
+                            'fallback')
+        else:
+            report.Info('Packer: {} (built-in)'.format(system.packer))
+        report.CheckExecutable('BUILD/sim/GOMC_CPU_NPT')
+        if system.builder == 'vmd':
+            if shutil.which('vmd') is None:
+                report.Warning('vmd is not on PATH; it has to be provided by '
+                               '"module load vmd" on the compute nodes')
+        elif os.path.isfile('BUILD/model/Topology.top'):
+            try:
+                residue = Topology('BUILD/model/Topology.top').GetResidue(
+                    system.resname)
+                report.Info('Native build of RESI {}: {} atoms, {} bonds'
+                            .format(residue.name, len(residue.atoms),
+                                    len(residue.bonds)))
+            except ValueError as err:
+                report.Error('Topology.top: {}'.format(err))
+
+        report.Render('BUILD/model/Parameters.par', sample, all_patterns)
+        built = os.listdir('BUILD/model') + ['START.pdb', 'START.psf']
+        for temp in temperatures:
+            report.Render('BUILD/pack/pack.inp',
+                          [(system.molname_pattern, system.molname),
+                           (temp.molnumber_liq_pattern, temp.molnumber_liq),
+                           (temp.boxsize_liq_pattern, temp.boxsize_liq)],
+                          all_patterns)
+            if system.builder == 'vmd':
+                report.Render('BUILD/pack/build.tcl',
+                              [(system.resname_pattern, system.resname)],
+                              all_patterns)
+            eq = report.Render('BUILD/sim/eq.conf',
+                               [(temp.pressure_pattern, temp.pressure),
+                                (temp.temperature_pattern, temp.temperature),
+                                (temp.eq_step_pattern, temp.eq_step),
+                                (temp.boxsize_liq_pattern, temp.boxsize_liq)],
+                               all_patterns, required=False)
+            run = report.Render('BUILD/sim/in.conf',
+                                [(temp.run_step_pattern, temp.run_step),
+                                 (temp.temperature_pattern, temp.temperature),
+                                 (temp.pressure_pattern, temp.pressure),
+                                 (temp.boxsize_liq_pattern,
+                                  temp.boxsize_liq)],
+                                all_patterns, required=False)
+            if eq is None or run is None:
+                continue
+
+            # in.conf restarts from the files written by the equilibration
+            restart = list(built)
+            for line in eq.split('\n'):
+                columns = line.split('#')[0].split()
+                if len(columns) == 2 and columns[0] == 'OutputName':
+                    restart += [columns[1] + '_BOX_0_restart.pdb',
+                                columns[1] + '_merged.psf']
+            for name in DryRunReport.ConfFiles(eq):
+                if name not in built:
+                    report.Error('T_{}: eq.conf reads {} which is not '
+                                 'built'.format(temp.temperature, name))
+            for name in DryRunReport.ConfFiles(run):
+                if name not in restart:
+                    report.Error('T_{}: in.conf reads {} which is not '
+                                 'written by the equilibration'
+                                 .format(temp.temperature, name))
+            if (config.reweighting.enabled
+                    and not DryRunReport.ConfEnabled(run, 'CoordinatesFreq')):
+                report.Error('T_{}: reweighting needs CoordinatesFreq true '
+                             'in in.conf'.format(temp.temperature))
+
+        number_of_temperatures = len(temperatures)
+        number_of_candidates = len(range(0, nPop, number_of_temperatures))
+        total = number_of_temperatures
+        total += (numIt + 1) * number_of_candidates * number_of_temperatures
+        report.Info('Parameters: {}'.format(
+            ', '.join(par.name for par in parameters)))
+        if len(charges) > 0:
+            report.Info('Charges: {} (dependent: {})'.format(
+                ', '.join('{}={:.6f}'.format(pattern, value)
+                          for pattern, value in charges),
+                ', '.join(ch.pattern for ch in config.charges.charges
+                          if ch.dependent)))
+        report.Info('Temperatures: {}'.format(
+            ', '.join(temp.temperature for temp in temperatures)))
+        report.Info('Optimizer: {}, {} candidates, up to {} iterations'
+                    .format(config.optparameters.kind, number_of_candidates,
+                            numIt))
+        report.Info('Estimated simulations: {} equilibrations + {} runs = {}'
+                    .format(number_of_temperatures,
+                            total - number_of_temperatures, total))
+        return report.Print()
@@ -0,0 +1,306 @@
+import numpy as np
+
+
+# Built-in replacement for packmol: places rigid copies of one molecule in
+# the cube of pack.inp so that atoms of different molecules are at least
+# `tolerance` apart. Molecules go on the sites of a lattice (or at random
+# positions) with random orientations; a periodic cell list of the placed
+# atoms keeps every overlap check local. Lattice molecules that cannot be
+# placed are pushed apart afterwards by Relax; a box that still has atoms
+# closer than the tolerance is an error.
+class LiquidPacker:
+    def __init__(self, molecule, number, origin, length, tolerance,
+                 method='lattice', max_tries=None):
+        self.lines, self.atoms = LiquidPacker.ReadMolecule(molecule)
+        self.number = number
+        self.tolerance = tolerance
+        self.method = method
+        self.max_tries = max_tries
+        if self.max_tries is None:
+            self.max_tries = 10 if method == 'lattice' else 1000
+        # Coordinates relative to the geometric center
+        self.atoms = self.atoms - self.atoms.mean(axis=0)
+        self.radius = np.max(np.sqrt(np.sum(self.atoms ** 2, axis=1)))
+        self.origin = np.asarray(origin, dtype=float)
+        self.length = float(length)
+        # GOMC uses periodic boundaries, so overlaps are checked with the
+        # minimum image convention
+        self.ncell = max(int(self.length // tolerance), 1)
+        self.cellsize = self.length / self.ncell
+        self.cells = {}
+        self.overlaps = 0
+
+    # Reads tolerance, structure, number and "inside cube" from pack.inp
+    @staticmethod
+    def FromInput(filename, method='lattice'):
+        tolerance = 2.0
+        molecule = None
+        number = None
+        origin = None
+        length = None
+        with open(filename, 'r') as file:
+            for line in file:
+                columns = line.split('#')[0].split()
+                if len(columns) < 2:
+                    continue
+                if columns[0] == 'tolerance':
+                    tolerance = float(columns[1])
+                elif columns[0] == 'structure':
+                    molecule = columns[1]
+                elif columns[0] == 'number':
+                    number = int(columns[1])
+                elif (columns[0] == 'inside' and columns[1] == 'cube'
+                      and len(columns) >= 6):
+                    origin = [float(c) for c in columns[2:5]]
+                    length = float(columns[5])
+        if molecule is None or number is None or length is None:
+            raise ValueError('{} needs structure, number and inside cube'
+                             .format(filename))
+        return LiquidPacker(molecule, number, origin, length, tolerance,
+                            method)
+
+    @staticmethod
+    def ReadMolecule(filename):
+        lines = []
+        atoms = []
+        with open(filename, 'r') as file:
+            for line in file:
+                if line.startswith('ATOM') or line.startswith('HETATM'):
+                    lines.append(line.rstrip('\n').ljust(54))
+                    atoms.append((line[30:38], line[38:46], line[46:54]))
+        if len(atoms) == 0:
+            raise ValueError('No atoms in ' + filename)
+        return lines, np.array(atoms, dtype=float)
+
+    # Uniformly distributed rotation matrices from random unit quaternions
+    @staticmethod
+    def RandomRotations(count):
+        q = np.random.normal(size=(count, 4))
+        q /= np.sqrt(np.sum(q ** 2, axis=1))[:, np.newaxis]
+        w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+        return np.stack([
+            np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w),
+                      2 * (x * z + y * w)], axis=1),
+            np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z),
+                      2 * (y * z - x * w)], axis=1),
+            np.stack([2 * (x * z - y * w), 2 * (y * z + x * w),
+                      1 - 2 * (x * x + y * y)], axis=1)], axis=1)
+
+    def Cell(self, coords):
+        cells = np.floor((coords - self.origin) / self.cellsize).astype(int)
+        return cells % self.ncell
+
+    def Overlaps(self, coords):
+        cells = set()
+        for cell in self.Cell(coords):
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for dz in (-1, 0, 1):
+                        cells.add(((cell[0] + dx) % self.ncell,
+                                   (cell[1] + dy) % self.ncell,
+                                   (cell[2] + dz) % self.ncell))
+        neighbors = [self.cells[cell] for cell in cells if cell in self.cells]
+        if len(neighbors) == 0:
+            return False
+        neighbors = np.concatenate(neighbors)
+        diff = coords[:, np.newaxis, :] - neighbors[np.newaxis, :, :]
+        diff -= self.length * np.round(diff / self.length)
+        return np.min(np.sum(diff ** 2, axis=2)) < self.tolerance ** 2
+
+    def Add(self, coords):
+        for cell, atom in zip(map(tuple, self.Cell(coords)), coords):
+            if cell in self.cells:
+                self.cells[cell] = np.vstack([self.cells[cell], atom])
+            else:
+                self.cells[cell] = atom[np.newaxis, :]
+
+    # Sites of the near-cubic lattice with the fewest empty sites, spread
+    # over the whole periodic box and filled in random order
+    def LatticeSites(self):
+        n = int(np.floor(self.number ** (1.0 / 3.0) + 1e-9))
+        best = None
+        for extra in [(0, 0, 0), (0, 0, 1), (0, 1, 1), (1, 1, 1)]:
+            shape = tuple(n + e for e in extra)
+            if np.prod(shape) >= self.number:
+                best = shape
+                break
+        if best is None:
+            best = (n + 1, n + 1, n + 1)
+        grid = np.indices(best).reshape(3, -1).T + 0.5
+        self.spacing = self.length / np.array(best)
+        sites = self.origin + grid * self.spacing
+        return sites[np.random.permutation(len(sites))[:self.number]]
+
+    def Pack(self):
+        # Keep every atom inside the cube
+        low = self.origin + self.radius
+        high = self.origin + self.length - self.radius
+        if np.any(high < low):
+            raise ValueError('The molecule does not fit in the box')
+        if self.method == 'lattice':
+            sites = self.LatticeSites()
+        else:
+            sites = None
+        molecules = np.zeros((self.number, len(self.atoms), 3))
+        batch = min(50, self.max_tries)
+        for i in range(self.number):
+            placed = False
+            # Draw the trial positions and orientations in batches
+            for start in range(0, self.max_tries, batch):
+                rotations = LiquidPacker.RandomRotations(batch)
+                if sites is None:
+                    centers = np.random.uniform(low, high, (batch, 3))
+                else:
+                    # Let a crowded molecule move off its site, further
+                    # the longer it takes to place
+                    shift = 0.5 * self.spacing * start / self.max_tries
+                    centers = np.clip(sites[i] + np.random.uniform(
+                        -shift, shift, (batch, 3)), low, high)
+                for k in range(batch):
+                    coords = self.atoms @ rotations[k].T + centers[k]
+                    if not self.Overlaps(coords):
+                        placed = True
+                        break
+                if placed:
+                    break
+            if not placed:
+                if sites is None:
+                    raise ValueError('Could not insert molecule {} of {} '
+                                     'after {} tries; use the lattice method '
+                                     'or packmol for this density'.format(
+                                         i + 1, self.number, self.max_tries))
+                # A lattice site keeps its last orientation until Relax
+                self.overlaps += 1
+            self.Add(coords)
+            molecules[i] = coords
+        if self.overlaps > 0:
+            molecules = self.Relax(molecules)
+        return molecules
+
+    # Rotation matrices for the rotation vectors `angles` (Rodrigues)
+    @staticmethod
+    def Rotations(angles):
+        theta = np.sqrt(np.sum(angles ** 2, axis=1))
+        k = angles / np.maximum(theta, 1e-12)[:, np.newaxis]
+        K = np.zeros((len(k), 3, 3))
+        K[:, 0, 1] = -k[:, 2]
+        K[:, 0, 2] = k[:, 1]
+        K[:, 1, 0] = k[:, 2]
+        K[:, 1, 2] = -k[:, 0]
+        K[:, 2, 0] = -k[:, 1]
+        K[:, 2, 1] = k[:, 0]
+        return (np.eye(3) + np.sin(theta)[:, np.newaxis, np.newaxis] * K
+                + (1 - np.cos(theta))[:, np.newaxis, np.newaxis] * K @ K)
+
+    # Pairs i < j of molecules whose centers are closer than `cutoff`
+    # (minimum image), from a periodic cell list of the centers
+    def NeighborPairs(self, centers, cutoff):
+        ncell = max(int(self.length // cutoff), 1)
+        cells = (np.floor((centers - self.origin) / (self.length / ncell))
+                 .astype(int) % ncell)
+        index = (cells[:, 0] * ncell + cells[:, 1]) * ncell + cells[:, 2]
+        order = np.argsort(index)
+        counts = np.bincount(index, minlength=ncell ** 3)
+        starts = np.cumsum(counts) - counts
+        offsets = set((dx % ncell, dy % ncell, dz % ncell)
+                      for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                      for dz in (-1, 0, 1))
+        first = []
+        second = []
+        # Every molecule against every molecule of each neighbouring cell
+        for offset in offsets:
+            other = (cells + offset) % ncell
+            other = (other[:, 0] * ncell + other[:, 1]) * ncell + other[:, 2]
+            number = counts[other]
+            i = np.repeat(np.arange(len(centers)), number)
+            within = np.arange(len(i)) - np.repeat(np.cumsum(number) - number,
+                                                   number)
+            first.append(i)
+            second.append(order[np.repeat(starts[other], number) + within])
+        i = np.concatenate(first)
+        j = np.concatenate(second)
+        keep = i < j
+        i, j = i[keep], j[keep]
+        diff = centers[i] - centers[j]
+        diff -= self.length * np.round(diff / self.length)
+        keep = np.sum(diff ** 2, axis=1) < cutoff ** 2
+        return i[keep], j[keep]
+
+    # Rigid-body steepest descent on the overlap penalty, as packmol does:
+    # every pair of atoms of different molecules closer than a slightly
+    # larger target adds (target^2 - d^2)^2. Only pairs with a molecule
+    # that moved in the last step are evaluated, from a neighbour list
+    # with a skin that is rebuilt once a molecule has moved half of it.
+    def Relax(self, molecules, max_steps=2000):
+        target = 1.02 * self.tolerance
+        centers = molecules.mean(axis=1)
+        relative = molecules - centers[:, np.newaxis, :]
+        low = self.origin + self.radius
+        high = self.origin + self.length - self.radius
+        skin = 1.0
+        cutoff = 2 * self.radius + target + skin
+        moved = np.ones(self.number, dtype=bool)
+        drift = np.full(self.number, np.inf)
+        for step in range(max_steps):
+            if np.max(drift) > skin / 2:
+                pairs = self.NeighborPairs(centers, cutoff)
+                drift[:] = 0.0
+            active = moved[pairs[0]] | moved[pairs[1]]
+            first, second = pairs[0][active], pairs[1][active]
+            forces = np.zeros_like(relative)
+            close = False
+            coords = centers[:, np.newaxis, :] + relative
+            # In chunks, to bound the memory of the atom pair arrays
+            for start in range(0, len(first), 1000):
+                i = first[start:start + 1000]
+                j = second[start:start + 1000]
+                diff = (coords[i][:, :, np.newaxis, :]
+                        - coords[j][:, np.newaxis, :, :])
+                diff -= self.length * np.round(diff / self.length)
+                distance = np.sum(diff ** 2, axis=3)
+                close = close or np.any(distance < self.tolerance ** 2)
+                force = (4 * np.maximum(target ** 2 - distance, 0.0)
+                         [..., np.newaxis] * diff)
+                np.add.at(forces, i, force.sum(axis=2))
+                np.add.at(forces, j, -force.sum(axis=1))
+            if not close:
+                return coords
+            # Translation and rotation of every molecule, at most 0.2 A
+            # and 0.1 rad per step
+            move = 0.002 * forces.sum(axis=1)
+            length = np.sqrt(np.sum(move ** 2, axis=1))
+            move *= np.minimum(1.0, 0.2 / np.maximum(length, 1e-12))[
+                :, np.newaxis]
+            angle = (0.002 / self.radius ** 2
+                     * np.sum(np.cross(relative, forces), axis=1))
+            theta = np.sqrt(np.sum(angle ** 2, axis=1))
+            angle *= np.minimum(1.0, 0.1 / np.maximum(theta, 1e-12))[
+                :, np.newaxis]
+            theta = np.minimum(theta, 0.1)
+            old = centers
+            centers = np.clip(centers + move, low, high)
+            relative = np.einsum('nij,naj->nai',
+                                 LiquidPacker.Rotations(angle), relative)
+            shift = np.sqrt(np.sum((centers - old) ** 2, axis=1))
+            moved = (shift > 0) | (theta > 0)
+            drift += shift + self.radius * theta
+        raise ValueError('{} of {} molecules still closer than the tolerance '
+                         'of {} A after {} relaxation steps; use packmol or a '
+                         'larger box'.format(self.overlaps, self.number,
+                                             self.tolerance, max_steps))
+
+    # Same layout as packmol's output: the molecule's PDB lines repeated
+    # with the residue number and the coordinates replaced
+    def Write(self, filename):
+        molecules = self.Pack().tolist()
+        lines = []
+        for i, molecule in enumerate(molecules):
+            resid = '%4d' % ((i + 1) % 10000)
+            for line, (x, y, z) in zip(self.lines, molecule):
+                lines.append('%s%s%s%8.3f%8.3f%8.3f%s\n'
+                             % (line[:22], resid, line[26:30], x, y, z,
+                                line[54:]))
+        with open(filename, 'w') as file:
+            file.write(''.join(lines))
+            file.write('END\n')
+        return self.overlaps
@@ -1,5 +1,3 @@
-import xml.etree.ElementTree
-
 class Parameter:
     def __init__(self, pars):
         self.name = pars['name']
@@ -15,11 +13,10 @@ class Parameter:
                                           self.pattern, self.reference)
 
 class Parameters:
-    def __init__(self, inputfile):
+    def __init__(self, root):
         self.parameters = []
         
-        e = xml.etree.ElementTree.parse(inputfile).getroot()
-        for par in e.find('parameters').findall('parameter'):
+        for par in root.find('parameters').findall('parameter'):
             pars = {}
             pars['name'] = par.find('name').text
             pars['kind'] = par.find('kind').text
@@ -7,31 +7,45 @@ size = comm.Get_size()
 rank = comm.Get_rank()
 
 from utility import Utility
+from reweighting import Reweighting
+from noise import NoiseModel
 
 class Particle:
-    def __init__(self, pars, temps):
-        self.dim = pars.GetDim()
+    def __init__(self, pars, temps, charges, reweighting):
+        self.dim = pars.GetDim() + charges.GetIndependentDim()
         self.tempdim = temps.GetDim()
         self.pos = np.random.uniform(0.0, 1.0, self.dim)
         self.pars = np.copy(self.pos)
         self.vel = np.zeros(shape=[self.dim], dtype=np.float32)
         self.dens = np.zeros(shape=[self.tempdim], dtype=np.float32)
+        # Standard errors of the densities and of the cost from the blocks
+        self.dens_err = np.zeros(shape=[self.tempdim], dtype=np.float32)
+        self.cost_err = 0.0
         self.best_pos = np.copy(self.pos)
         self.cost = np.finfo(np.float32).max
         self.best_cost = self.cost
         self.parinfo = pars
         self.tempinfo = temps
+        self.chargeinfo = charges
+        # Wallclock and return code of this rank's last simulation
+        self.runtime = 0.0
+        self.returncode = 0
+        # ResourceUsage of the last simulation, None when it was not simulated
+        self.usage = None
+        # Set on rank 0 when the densities were estimated from earlier
+        # simulations instead of simulating
+        self.reweighting = reweighting
+        self.reweighted = False
+        # Set on rank 0 for the slots that rerun a candidate with a new seed
+        self.replicate = False
         
-    def CalculateNextVelocity(self, w, c1, c2, global_best_pos):
-        self.vel = w * self.vel + c1 * np.random.uniform(0.0, 1.0, self.dim) * (self.best_pos - self.pos) + c2 * np.random.uniform(0.0, 1.0, self.dim) *                    (global_best_pos - self.pos)
-        self.vel = np.minimum(self.vel, np.repeat(0.1, self.dim))
-        self.vel = np.maximum(self.vel, np.repeat(-0.1, self.dim))
-        
-    def CalculateNextPosition(self):
-        self.pos = self.pos + self.vel
+    def MoveTo(self, pos):
+        self.vel = pos - self.pos
+        self.pos = np.copy(pos)
 
-        self.pos = np.minimum(self.pos, np.repeat(1.0, self.dim))
-        self.pos = np.maximum(self.pos, np.repeat(0.0, self.dim))
+    def GetChargeValues(self):
+        npars = self.parinfo.GetDim()
+        return self.chargeinfo.GetValues(self.pars[npars:])
 
     def UpdateBestPosition(self):
         if self.cost < self.best_cost:
@@ -39,8 +53,10 @@ class Particle:
             self.best_pos = self.pos
 
     def ConvertPosToPars(self):
-        for index in range(len(self.parinfo.parameters)):
-            parameter = self.parinfo.parameters[index]
+        # pos holds the parameters followed by the independent charges
+        dimensions = self.parinfo.parameters + self.chargeinfo.GetIndependent()
+        for index in range(len(dimensions)):
+            parameter = dimensions[index]
             kind = parameter.kind
             if kind == 'discrete':
                 self.pars[index] = Utility.ScaleDiscrete(self.pos[index],
@@ -51,18 +67,66 @@ class Particle:
                                                            parameter.start,
                                                            parameter.end)
 
-    def Evaluate(self, it):
-        directory = 'runs/it{}/run{}'.format(it, int(rank/3))
+    def Directory(self, it, index):
+        return 'runs/it{}/run{}'.format(it, int(index/self.tempdim))
+
+    # Writes the run files of every temperature of the particle
+    def Prepare(self, it, index):
+        directory = self.Directory(it, index)
+        shutil.rmtree(directory, ignore_errors=True)
+        Utility.GenerateRunFiles(directory, self.tempinfo.temperatures)
+        self.ConvertPosToPars()
+        Utility.ReplaceParameters(self, directory, self.tempinfo)
+        if self.chargeinfo.GetDim() > 0:
+            Utility.ReplaceCharges(self, directory, self.tempinfo)
+        if self.replicate:
+            for temp in self.tempinfo.temperatures:
+                NoiseModel.Reseed(Utility.SimulationFolder(temp, directory)
+                                  + '/in.conf')
+
+    # Runs the simulation of the temperature of swarm slot `index`
+    def Run(self, it, index):
+        directory = self.Directory(it, index)
+        temp = self.tempinfo.temperatures[index % self.tempdim]
+        self.ConvertPosToPars()
+        self.returncode, self.usage = Utility.RunSimulation(temp, directory)
+        self.runtime = self.usage['wallclock']
+        if self.reweighting.enabled and self.returncode == 0:
+            self.StoreSamples(directory, temp)
 
-        if rank % 3 == 0:
-            shutil.rmtree(directory, ignore_errors=True)
-            Utility.GenerateRunFiles(directory, self.tempinfo.temperatures)
-            self.ConvertPosToPars()
-            Utility.ReplaceParameters(self, directory, self.tempinfo)
+    def Score(self, it, index):
+        self.cost = Utility.GetCost(self, self.Directory(it, index),
+                                    self.tempinfo)
 
-        comm.barrier()
-        Utility.RunSimulation(self.tempinfo.temperatures, directory)
+    # Cost bound from the simulations of the temperatures in `indices`
+    def Bound(self, it, index, indices):
+        self.cost = Utility.GetCostBound(self, self.Directory(it, index),
+                                         self.tempinfo, indices)
+        return self.cost
+
+    # group: the ranks simulating the temperatures of this particle; only
+    # they wait for each other's run files and simulations
+    def Evaluate(self, it, group):
+        if rank % self.tempdim == 0 and not self.reweighted:
+            self.Prepare(it, rank)
+
+        group.barrier()
+        self.runtime = 0.0
+        self.returncode = 0
+        self.usage = None
+        if not self.reweighted:
+            self.Run(it, rank)
         
-        comm.barrier()
-        if rank % 3 == 0:
-            self.cost = Utility.GetCost(self, directory, self.tempinfo)
+        group.barrier()
+        if rank % self.tempdim == 0 and not self.reweighted:
+            self.Score(it, rank)
+
+    # Keep the frames of this simulation for reweighting
+    def StoreSamples(self, directory, temp):
+        dimensions = self.parinfo.parameters + self.chargeinfo.GetIndependent()
+        error = Reweighting.Store(Utility.SimulationFolder(temp, directory),
+                                  self.reweighting, dimensions, self,
+                                  temp.temperature)
+        if error is not None:
+            Utility.LogMessage('No reweighting samples from {}: {}'
+                               .format(directory, error))
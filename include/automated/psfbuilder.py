@@ -0,0 +1,229 @@
+import numpy as np
+
+
+class Residue:
+    def __init__(self, name, charge):
+        self.name = name
+        self.charge = charge
+        self.atoms = []
+        self.bonds = []
+        self.angles = []
+        self.dihedrals = []
+        self.impropers = []
+
+    def Index(self, name):
+        for i, atom in enumerate(self.atoms):
+            if atom[0] == name:
+                return i
+        raise ValueError('Atom {} is not defined in RESI {}'.format(
+            name, self.name))
+
+    # Angles and dihedrals from the bond graph, as psfgen does for
+    # AUTOGENERATE ANGLES DIHEDRALS
+    def Autogenerate(self, angles, dihedrals):
+        neighbors = [[] for _ in self.atoms]
+        for a, b in self.bonds:
+            neighbors[a].append(b)
+            neighbors[b].append(a)
+        if angles:
+            for b in range(len(self.atoms)):
+                for i in range(len(neighbors[b])):
+                    for j in range(i + 1, len(neighbors[b])):
+                        self.angles.append((neighbors[b][i], b,
+                                            neighbors[b][j]))
+        if dihedrals:
+            for b, c in self.bonds:
+                for a in neighbors[b]:
+                    for d in neighbors[c]:
+                        if a != c and d != b and a != d:
+                            self.dihedrals.append((a, b, c, d))
+
+
+# CHARMM topology reader (MASS, RESI, ATOM, BOND/DOUBLE, ANGL, DIHE, IMPR)
+class Topology:
+    def __init__(self, filename):
+        self.masses = {}
+        self.residues = {}
+        self.angles = False
+        self.dihedrals = False
+        self.Read(filename)
+
+    def Read(self, filename):
+        residue = None
+        connections = []
+        with open(filename, 'r') as file:
+            for line in file:
+                columns = line.split('!')[0].split()
+                if len(columns) == 0:
+                    continue
+                keyword = columns[0].upper()[:4]
+                if keyword == 'MASS' and len(columns) >= 4:
+                    self.masses[columns[2]] = float(columns[3])
+                elif keyword == 'AUTO':
+                    flags = [c.upper()[:4] for c in columns[1:]]
+                    self.angles = 'ANGL' in flags
+                    self.dihedrals = 'DIHE' in flags
+                elif keyword in ['RESI', 'PRES']:
+                    residue = Residue(columns[1], float(columns[2])
+                                      if len(columns) > 2 else 0.0)
+                    connections.append((residue, []))
+                    if keyword == 'RESI':
+                        self.residues[residue.name] = residue
+                elif residue is None:
+                    continue
+                elif keyword == 'ATOM':
+                    residue.atoms.append((columns[1], columns[2],
+                                          float(columns[3])))
+                elif keyword in ['BOND', 'DOUB', 'TRIP']:
+                    connections[-1][1].append((2, columns[1:]))
+                elif keyword in ['ANGL', 'THET']:
+                    connections[-1][1].append((3, columns[1:]))
+                elif keyword in ['DIHE', 'PHI']:
+                    connections[-1][1].append((4, columns[1:]))
+                elif keyword in ['IMPR', 'IMPH']:
+                    connections[-1][1].append((5, columns[1:]))
+
+        # Connections may name atoms listed later in the residue
+        for residue, entries in connections:
+            lists = {2: residue.bonds, 3: residue.angles,
+                     4: residue.dihedrals, 5: residue.impropers}
+            for kind, names in entries:
+                size = 4 if kind == 5 else kind
+                for i in range(0, len(names) - size + 1, size):
+                    lists[kind].append(tuple(residue.Index(name)
+                                             for name in names[i:i + size]))
+            residue.Autogenerate(self.angles, self.dihedrals)
+
+    def GetResidue(self, resname):
+        if resname not in self.residues:
+            raise ValueError('RESI {} not found in the topology'.format(
+                resname))
+        return self.residues[resname]
+
+
+# Writes the START.psf/START.pdb that psfgen would build from build.tcl
+# (one segment named after the residue, every molecule a copy of it).
+class PSFBuilder:
+    @staticmethod
+    def Build(topology, resname, packed, psf, pdb):
+        topology = Topology(topology)
+        residue = topology.GetResidue(resname)
+        names, coords = PSFBuilder.ReadPDB(packed)
+        coords = PSFBuilder.Order(residue, names, coords)
+        PSFBuilder.WritePSF(psf, topology.masses, residue, len(coords))
+        PSFBuilder.WritePDB(pdb, residue, coords)
+
+    @staticmethod
+    def ReadPDB(filename):
+        names = []
+        coords = []
+        with open(filename, 'r') as file:
+            for line in file:
+                if line.startswith('ATOM') or line.startswith('HETATM'):
+                    names.append(line[12:16].strip())
+                    coords.append((line[30:38], line[38:46], line[46:54]))
+        return names, np.array(coords, dtype=float).reshape(-1, 3)
+
+    # Molecules as an (nmol, natom, 3) array in topology atom order. The
+    # packed molecules are copies of one PDB, so the first one fixes the
+    # mapping for all of them.
+    @staticmethod
+    def Order(residue, names, coords):
+        natom = len(residue.atoms)
+        if natom == 0 or len(names) == 0 or len(names) % natom != 0:
+            raise ValueError('{} atoms cannot be split into molecules of '
+                             'RESI {} with {} atoms'.format(
+                                 len(names), residue.name, natom))
+        first = names[:natom]
+        try:
+            order = [first.index(atom[0]) for atom in residue.atoms]
+        except ValueError:
+            raise ValueError('Atom names {} do not match RESI {}'.format(
+                ' '.join(first), residue.name))
+        return coords.reshape(-1, natom, 3)[:, order, :]
+
+    # Per-molecule index tuples repeated for every molecule (1-based)
+    @staticmethod
+    def Expand(items, size, nmol, natom):
+        items = np.array(items, dtype=np.int64).reshape(-1, size)
+        offsets = np.arange(nmol, dtype=np.int64) * natom + 1
+        return (items[np.newaxis, :, :]
+                + offsets[:, np.newaxis, np.newaxis]).reshape(-1, size)
+
+    @staticmethod
+    def WriteSection(file, items, per_line, title):
+        file.write('{:8d} !{}\n'.format(len(items), title))
+        values = items.reshape(-1).tolist()
+        step = per_line * items.shape[1]
+        lines = []
+        full = len(values) // step * step
+        line_format = '%8d' * step + '\n'
+        for i in range(0, full, step):
+            lines.append(line_format % tuple(values[i:i + step]))
+        if full < len(values):
+            lines.append('%8d' * (len(values) - full) % tuple(values[full:])
+                         + '\n')
+        file.write(''.join(lines))
+        file.write('\n')
+
+    @staticmethod
+    def WritePSF(filename, masses, residue, nmol):
+        natom = len(residue.atoms)
+        for atom in residue.atoms:
+            if atom[1] not in masses:
+                raise ValueError('No MASS for atom type ' + atom[1])
+        atom_format = ['%8d {:<4s} %-4d {:<4s} {:<4s} {:<4s} {:10.6f} '
+                       '{:13.4f} {:11d}\n'.format(residue.name, residue.name,
+                                                  name, kind, charge,
+                                                  masses[kind], 0)
+                       for name, kind, charge in residue.atoms]
+        lines = []
+        for mol in range(nmol):
+            for i in range(natom):
+                lines.append(atom_format[i] % (mol * natom + i + 1, mol + 1))
+
+        with open(filename, 'w') as file:
+            file.write('PSF\n\n')
+            file.write('{:8d} !NTITLE\n'.format(1))
+            file.write(' REMARKS generated structure x-plor psf file\n\n')
+            file.write('{:8d} !NATOM\n'.format(nmol * natom))
+            file.write(''.join(lines))
+            file.write('\n')
+            PSFBuilder.WriteSection(
+                file, PSFBuilder.Expand(residue.bonds, 2, nmol, natom), 4,
+                'NBOND: bonds')
+            PSFBuilder.WriteSection(
+                file, PSFBuilder.Expand(residue.angles, 3, nmol, natom), 3,
+                'NTHETA: angles')
+            PSFBuilder.WriteSection(
+                file, PSFBuilder.Expand(residue.dihedrals, 4, nmol, natom), 2,
+                'NPHI: dihedrals')
+            PSFBuilder.WriteSection(
+                file, PSFBuilder.Expand(residue.impropers, 4, nmol, natom), 2,
+                'NIMPHI: impropers')
+            file.write('{:8d} !NDON: donors\n\n\n'.format(0))
+            file.write('{:8d} !NACC: acceptors\n\n\n'.format(0))
+            file.write('{:8d} !NNB\n\n'.format(0))
+            file.write('{:8d}{:8d} !NGRP\n\n'.format(0, 0))
+
+    @staticmethod
+    def WritePDB(filename, residue, coords):
+        nmol, natom = coords.shape[0], coords.shape[1]
+        coords = coords.tolist()
+        # PDB atom names shorter than 4 characters start in column 14
+        names = [name if len(name) == 4 else ' ' + name
+                 for name, _, _ in residue.atoms]
+        lines = []
+        for mol in range(nmol):
+            for i in range(natom):
+                x, y, z = coords[mol][i]
+                lines.append('ATOM  %5d %-4s %-4s %4d    %8.3f%8.3f%8.3f'
+                             '  1.00  0.00      %-4s\n'
+                             % ((mol * natom + i + 1) % 100000, names[i],
+                                residue.name, (mol + 1) % 10000, x, y, z,
+                                residue.name))
+        with open(filename, 'w') as file:
+            file.write('CRYST1    0.000    0.000    0.000  90.00  90.00  '
+                       '90.00 P 1           1\n')
+            file.write(''.join(lines))
+            file.write('END\n')
@@ -1,10 +1,15 @@
-import xml.etree.ElementTree
-
 class System:
-    def __init__(self, inputfile):
-        e = xml.etree.ElementTree.parse(inputfile).getroot()
-        
-        self.molname = e.find('system').find('molname').text
-        self.molname_pattern = e.find('system').find('molname').get('pattern')
-        self.resname = e.find('system').find('resname').text
-        self.resname_pattern = e.find('system').find('resname').get('pattern')
+    def __init__(self, root):
+        self.molname = root.find('system').find('molname').text
+        self.molname_pattern = root.find('system').find('molname').get('pattern')
+        self.resname = root.find('system').find('resname').text
+        self.resname_pattern = root.find('system').find('resname').get('pattern')
+        # psfgen is only needed with <builder>vmd</builder>
+        self.builder = 'native'
+        if root.find('system').find('builder') is not None:
+            self.builder = root.find('system').find('builder').text.strip().lower()
+        # packmol is only needed with <packer>packmol</packer>, or as the
+        # fallback when the lattice cannot meet the tolerance
+        self.packer = 'lattice'
+        if root.find('system').find('packer') is not None:
+            self.packer = root.find('system').find('packer').text.strip().lower()
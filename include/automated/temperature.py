@@ -1,6 +1,5 @@
 import numpy as np
 from mpi4py import MPI
-import xml.etree.ElementTree
 
 
 comm = MPI.COMM_WORLD
@@ -24,11 +23,10 @@ class Temperature:
         self.expt_liq = pars['expt_liq']
 
 class Temperatures:
-    def __init__(self, inputfile):
+    def __init__(self, root):
         self.temperatures = []
         
-        e = xml.etree.ElementTree.parse(inputfile).getroot()
-        for temp in e.find('data').findall('temperature'):
+        for temp in root.find('data').findall('temperature'):
             pars = {}
             pars['temperature'] = temp.find('temp').text
             pars['temperature_pattern'] = temp.find('temp').get('pattern')
@@ -1,15 +1,26 @@
 import numpy as np
 from mpi4py import MPI
 import os
+import sys
 import datetime
+import re
 import fileinput
 from pathlib import Path
 import shutil
 
+from buildcache import BuildCache
+from psfbuilder import PSFBuilder
+from liquidpacker import LiquidPacker
+from accounting import ResourceUsage
+
 comm = MPI.COMM_WORLD
 size = comm.Get_size()
 rank = comm.Get_rank()
 
+# The build steps chdir into the simulation folders; always log to the
+# campaign directory
+logfile = os.path.join(os.getcwd(), 'log.txt')
+
 class Utility:
     @staticmethod
     def MakeDirectory(directory):
@@ -21,20 +32,79 @@ class Utility:
     
     @staticmethod
     def ReplaceText(filename, text_to_search, replacement_text):
+        found = False
         with fileinput.FileInput(filename, inplace=True) as file:
             for line in file:
+                if text_to_search in line:
+                    found = True
                 print(line.replace(text_to_search, replacement_text), end='')
+        if not found:
+            Utility.LogMessage('Pattern {} not found in {}'
+                               .format(text_to_search, filename))
     
     @staticmethod
     def ReplaceParameters(particle, directory, tempinfo):
         temperatures = tempinfo.temperatures
         for temp in temperatures:
-            for index in range(len(particle.pars)):
-                parinfo = particle.parinfo.parameters
+            parinfo = particle.parinfo.parameters
+            for index in range(len(parinfo)):
                 file = directory + '/T_' + temp.temperature + '/Liq/Parameters.par'
                 val = particle.pars[index]
                 Utility.ReplaceText(file, parinfo[index].pattern, str(val))
                 
+    @staticmethod
+    def GetChargeAtoms(topology, charges):
+        # Map (resname, atom name) to the charge pattern used for it in the
+        # template topology, e.g. "ATOM H1 HW HCHARGE"
+        patterns = [ch.pattern for ch in charges.charges]
+        atoms = {}
+        resname = None
+        with open(topology, 'r') as file:
+            for line in file:
+                columns = line.split('!')[0].split()
+                if len(columns) >= 2 and columns[0].upper() == 'RESI':
+                    resname = columns[1]
+                elif (len(columns) >= 4 and columns[0].upper() == 'ATOM'
+                      and columns[3] in patterns):
+                    atoms[(resname, columns[1])] = columns[3]
+        return atoms
+
+    @staticmethod
+    def ReplaceCharges(particle, directory, tempinfo):
+        # The charges live in the PSF built during equilibration, so the
+        # charge column of the copied PSF files is rewritten for each run.
+        values = dict(particle.GetChargeValues())
+        atoms = Utility.GetChargeAtoms('BUILD/model/Topology.top',
+                                       particle.chargeinfo)
+        for temp in tempinfo.temperatures:
+            folder = directory + '/T_' + temp.temperature + '/Liq/'
+            for filename in os.listdir(folder):
+                if filename.endswith('.psf'):
+                    Utility.ReplacePSFCharges(folder + filename, atoms, values)
+
+    @staticmethod
+    def ReplacePSFCharges(filename, atoms, values):
+        with open(filename, 'r') as file:
+            lines = file.readlines()
+        natom = 0
+        for i in range(len(lines)):
+            if natom > 0:
+                columns = lines[i].split()
+                key = (columns[3], columns[4])
+                if key in atoms:
+                    # keep the fixed column layout of the charge field
+                    spans = [m.span() for m in re.finditer(r'\S+', lines[i])]
+                    start, end = spans[6]
+                    charge = '{:.6f}'.format(values[atoms[key]])
+                    start = min(start, end - len(charge))
+                    lines[i] = (lines[i][:start] + charge.rjust(end - start)
+                                + lines[i][end:])
+                natom -= 1
+            elif '!NATOM' in lines[i]:
+                natom = int(lines[i].split()[0])
+        with open(filename, 'w') as file:
+            file.writelines(lines)
+
     @staticmethod
     def ScaleContinuous(position, scale_min, scale_max):
         scale_pos = (scale_max - scale_min) * position
@@ -50,15 +120,45 @@ class Utility:
         return scale_pos
 
     @staticmethod
-    def RunSimulation(temperatures, directory):
+    def SimulationFolder(temp, directory):
+        return directory + '/T_' + temp.temperature + '/Liq'
+
+    @staticmethod
+    def RunSimulation(temp, directory):
         loadmodule = 'module swap gnu7/7.3.0 intel/2019;'
-        cd = 'cd ' + directory
+        cd = 'cd ' + Utility.SimulationFolder(temp, directory) + ';'
         end_part = './GOMC_CPU_NPT in.conf > out.log 2>&1'
-        temp = temperatures[int(rank%3)]
-        folder = '/T_' + temp.temperature + '/Liq;'
-        command = loadmodule + cd + folder + end_part
-        os.system(command)
+        command = loadmodule + cd + end_part
+        return ResourceUsage.Run(command)
             
+    @staticmethod
+    def ReadDensity(directory, folder):
+        # Mean density of the last 20% of the blocks and its standard error
+        filename = directory + folder + 'Blk_PRODUCTION_BOX_0.dat'
+        if not Path(filename).is_file():  # simulation failed for some reason
+            Utility.LogMessage('Error reading file ' + filename)
+            return 9999, 0.0
+        with open(filename, 'r') as file:
+            lines = []
+            numlines = 0
+            for line in file:
+                lines.append(line)
+                numlines += 1
+            if numlines < 10:
+                Utility.LogMessage('Error reading file from ' +
+                                   directory + folder)
+                return 9999, 0.0
+            start_line = int(numlines * 0.8)
+            length = numlines - start_line
+            blocks = []
+            for i in range(length):
+                index = i + start_line
+                line = lines[index]
+                line = re.sub(' +', ' ', line).strip()
+                columns = line.split(' ')
+                blocks.append(float(columns[10]))
+        return np.mean(blocks), np.std(blocks, ddof=1) / np.sqrt(length)
+
     @staticmethod
     def GetCost(particle, directory, tempinfo):
         temperatures = tempinfo.temperatures
@@ -68,31 +168,51 @@ class Utility:
             folders.append('/T_' + temp.temperature + '/Liq/')
             target_densities.append(float(temp.expt_liq))
         densities = []
+        errors = []
         for folder in folders:
-            filename = directory + folder + 'Blk_PRODUCTION_BOX_0.dat'
-            density = 0
-            with open(filename, 'r') as file:
-                lines = []
-                numlines = 0
-                for line in file:
-                    lines.append(line)
-                    numlines += 1
-                if numlines < 10:
-                    Utility.LogMessage('Error reading file from ' +
-                                       directory + folder)
-                    density = 9999
-                else:
-                    start_line = int(numlines * 0.8)
-                    length = numlines - start_line
-                    for i in range(length):
-                        index = i + start_line
-                        line = lines[index]
-                        line = re.sub(' +', ' ', line).strip()
-                        columns = line.split(' ')
-                        density += float(columns[10])
-                    density = density / length
+            density, error = Utility.ReadDensity(directory, folder)
             densities.append(density)
+            errors.append(error)
         np.copyto(particle.dens, densities)
+        np.copyto(particle.dens_err, errors)
+        particle.cost_err = Utility.CostError(target_densities, errors,
+                                              temperatures)
+        return Utility.CostFunction(target_densities, densities, temperatures)
+
+    @staticmethod
+    def CostError(target_densities, errors, temperatures):
+        # The cost is linear in the relative error at every temperature;
+        # its coefficient is the cost of a relative error of one
+        variance = 0.0
+        for i in range(len(errors)):
+            worse = list(target_densities)
+            worse[i] = 2 * target_densities[i]
+            coefficient = Utility.CostFunction(target_densities, worse,
+                                               temperatures)
+            variance += (coefficient * errors[i] / target_densities[i]) ** 2
+        return np.sqrt(variance)
+
+    @staticmethod
+    def GetCostBound(particle, directory, tempinfo, indices):
+        # Lower bound of GetCost from the temperatures in `indices` only.
+        # The other densities are set to their targets, which minimizes
+        # the cost as long as it grows with the error at every temperature.
+        temperatures = tempinfo.temperatures
+        target_densities = [float(temp.expt_liq) for temp in temperatures]
+        densities = list(target_densities)
+        measured = np.full(len(temperatures), np.nan)
+        for i in indices:
+            folder = '/T_' + temperatures[i].temperature + '/Liq/'
+            densities[i], _ = Utility.ReadDensity(directory, folder)
+            measured[i] = densities[i]
+        np.copyto(particle.dens, measured)
+        for i in range(len(temperatures)):
+            if i not in indices:
+                worse = list(target_densities)
+                worse[i] = 2 * target_densities[i]
+                if Utility.CostFunction(target_densities, worse,
+                                        temperatures) < 0:
+                    return -np.inf
         return Utility.CostFunction(target_densities, densities, temperatures)
     
     @staticmethod
@@ -115,19 +235,72 @@ class Utility:
         return final
     
     @staticmethod
-    def GetBestParticle(swarm):
+    def ReweightCandidates(swarm, num_of_temps, estimator, best_cost):
+        # Candidates whose densities at every temperature can be reweighted
+        # from earlier simulations are scored without simulating. An
+        # estimate better than the global best is confirmed by simulating.
+        estimator.Load()
+        temperatures = swarm[0].tempinfo.temperatures
+        target_densities = [float(temp.expt_liq) for temp in temperatures]
+        scored = []
+        for i in range(0, len(swarm), num_of_temps):
+            particle = swarm[i]
+            particle.ConvertPosToPars()
+            estimates = []
+            for temp in temperatures:
+                estimate = estimator.Estimate(particle.pos, particle.pars,
+                                              temp.temperature)
+                if estimate is None:
+                    break
+                estimates.append(estimate)
+            # Replicates exist to be simulated
+            reweighted = (len(estimates) == len(temperatures)
+                          and not particle.replicate)
+            if reweighted:
+                densities = [density for density, _ in estimates]
+                cost = Utility.CostFunction(target_densities, densities,
+                                            temperatures)
+                reweighted = cost >= best_cost
+            for j in range(i, i + num_of_temps):
+                swarm[j].reweighted = reweighted
+            if reweighted:
+                np.copyto(particle.dens, densities)
+                particle.cost = cost
+                scored.append('{} (effective samples {:.0f})'.format(
+                    i // num_of_temps, min(n for _, n in estimates)))
+        if len(scored) > 0:
+            Utility.LogMessage('Candidates scored by reweighting: {}'
+                               .format(', '.join(scored)))
+        return len(scored)
+
+    @staticmethod
+    def GetBestParticle(swarm, num_of_temps):
         best_particle = swarm[0]
         length = len(swarm)
         for i in range(length):
-            if i % 3 == 0:
+            if i % num_of_temps == 0:
                 particle = swarm[i]
                 if particle.cost < best_particle.cost:
                     best_particle = particle
         return best_particle
 
+    @staticmethod
+    def AssignPositions(swarm, positions, num_of_temps):
+        # Every rank sharing a particle directory gets the same position
+        for i in range(len(swarm)):
+            swarm[i].MoveTo(positions[int(i / num_of_temps)])
+
+    @staticmethod
+    def GetCosts(swarm, num_of_temps):
+        costs = []
+        for i in range(len(swarm)):
+            if i % num_of_temps == 0:
+                costs.append(swarm[i].cost)
+        return np.array(costs)
+
     @staticmethod
     def LogMessage(message):
-        with open('log.txt', 'a') as file:
+        with open(logfile, 'a') as file:
             out = str(datetime.datetime.now()) + ' - '
             out += str(rank) + ' - '
             out += message + '\n'
@@ -136,14 +309,24 @@ class Utility:
     
     @staticmethod
     def PrintCoordinates(it, p):
+        # One line per particle; str() wraps long arrays over several lines
+        arrays = [np.array2string(np.asarray(a), max_line_width=np.inf,
+                                  threshold=sys.maxsize)
+                  for a in [p.pos, p.pars, p.dens, p.vel, p.best_pos]]
         with open('data.csv', 'a') as file:
-            file.write('{},{},{},{},{},{},{}\n'
-                       .format(it, p.pos, p.pars, p.dens, p.vel, p.best_pos, p.cost))
+            file.write('{},{},{},{},{},{},{}\n'.format(it, *arrays, p.cost))
             file.flush()
 
     @staticmethod
-    def GenerateFilesForEquilibrate(temperatures, parameters, system, charges):
+    def GenerateFilesForEquilibrate(temperatures, parameters, system, charges,
+                                    cacheparameters):
         base_directory = os.getcwd()
+        # Every packer/builder combination writes different files
+        if system.builder == 'vmd' and system.packer == 'packmol':
+            cache = BuildCache(cacheparameters, 'build')
+        else:
+            cache = BuildCache(cacheparameters, 'build_{}_{}'.format(
+                system.packer, system.builder))
         shutil.rmtree('Equilibrate', ignore_errors=True)
         for temp in temperatures.temperatures:
             directory = "Equilibrate/T_" + temp.temperature + "/Liq/"
@@ -151,7 +334,8 @@ class Utility:
             Utility.CopyDirectory("BUILD/model/*", directory)
             Utility.CopyDirectory("BUILD/pack/*", directory)
             Utility.CopyDirectory("BUILD/pdb/*", directory)
-            os.chmod(directory + 'packmol', 509)
+            if system.packer == 'packmol':
+                os.chmod(directory + 'packmol', 509)
                 
             os.chdir(directory)
             Utility.ReplaceText("pack.inp",
@@ -164,22 +348,76 @@ class Utility:
             Utility.ReplaceText("build.tcl", system.resname_pattern,
                                 system.resname)
                 
-            pars = ['epsilon', 'sigma', 'n']
-            for par in pars:
-                parameter = parameters.GetParameterByName(par)
+            for parameter in parameters.parameters:
                 Utility.ReplaceText("Parameters.par", parameter.pattern,
                                     parameter.reference)
+            # Build with the neutral reference charges; runs rewrite the PSF
+            for pattern, value in charges.GetReferenceValues():
+                Utility.ReplaceText("Topology.top", pattern,
+                                    '{:.6f}'.format(value))
                 
-            os.system('./packmol < pack.inp' + '>> build_error.log 2>&1')
-            loadmodule = 'module load vmd;'
-            os.system(loadmodule + 'vmd -dispdev text < build.tcl' + '>> build_error.log 2>&1')
+            # Reuse START.pdb/START.psf if these exact inputs were built before
+            inputs = ['pack.inp', 'build.tcl', 'Topology.top',
+                      system.molname + '.pdb']
+            if system.packer == 'packmol':
+                inputs.append('packmol')
+            key = BuildCache.Key(inputs)
+            if cache.Restore(key, '.'):
+                Utility.LogMessage('Reusing cached build {} for T_{}'
+                                   .format(key[:12], temp.temperature))
+            else:
+                if system.packer == 'packmol':
+                    os.system('./packmol < pack.inp' + '>> build_error.log 2>&1')
+                else:
+                    Utility.PackLiquid(system, temp)
+                if system.builder == 'vmd':
+                    loadmodule = 'module load vmd;'
+                    os.system(loadmodule + 'vmd -dispdev text < build.tcl' + '>> build_error.log 2>&1')
+                else:
+                    Utility.BuildStructure(system)
+                if os.path.isfile('START.pdb') and os.path.isfile('START.psf'):
+                    cache.Store(key, '.', ['START.pdb', 'START.psf'])
                 
             # return to base directory
             os.chdir(base_directory)
         
     @staticmethod
-    def RunEquilibrate(temperatures):
+    def PackLiquid(system, temp):
+        # Writes packed.pdb from pack.inp without running packmol. A box
+        # that cannot be packed to the tolerance falls back to packmol if
+        # it was copied with the build files, and stops the build if not.
+        try:
+            packer = LiquidPacker.FromInput('pack.inp', system.packer)
+            overlaps = packer.Write('packed.pdb')
+            if overlaps > 0:
+                Utility.LogMessage('T_{}: {} crowded molecules relaxed to the '
+                                   'packing tolerance'.format(
+                                       temp.temperature, overlaps))
+        except (IOError, ValueError) as err:
+            Utility.LogMessage('Packing T_{} failed: {}'.format(
+                temp.temperature, err))
+            if not os.path.isfile('packmol'):
+                raise
+            Utility.LogMessage('Packing T_{} with packmol instead'.format(
+                temp.temperature))
+            os.chmod('packmol', 509)
+            os.system('./packmol < pack.inp' + '>> build_error.log 2>&1')
+
+    @staticmethod
+    def BuildStructure(system):
+        # Same output as build.tcl (one segment named after the residue)
+        # without starting VMD
+        try:
+            PSFBuilder.Build('Topology.top', system.resname, 'packed.pdb',
+                             'START.psf', 'START.pdb')
+        except (IOError, ValueError) as err:
+            Utility.LogMessage('Building START.psf/START.pdb in {} failed: '
+                               '{}'.format(os.getcwd(), err))
+
+    @staticmethod
+    def RunEquilibrate(temperatures, cacheparameters):
         base_directory = os.getcwd()
+        cache = BuildCache(cacheparameters, 'equilibrate')
         
         directories = []
         temps = []
@@ -211,9 +449,23 @@ class Utility:
             Utility.ReplaceText('eq.conf', temps[i].boxsize_liq_pattern,
                                 temps[i].boxsize_liq)
             
-            # Run the equilibrium simulation
-            loadmodule = 'module swap gnu7/7.3.0 intel/2019;'
-            os.system(loadmodule + './GOMC_CPU_NPT eq.conf &> out.log')
+            # Reuse the equilibrated system if the same start configuration
+            # was already equilibrated with the same settings
+            key = BuildCache.Key(['START.pdb', 'START.psf', 'eq.conf',
+                                  'Parameters.par', 'GOMC_CPU_NPT'])
+            if (cacheparameters.equilibration
+                    and cache.Restore(key, '.')):
+                Utility.LogMessage('Reusing cached equilibration {} for T_{}'
+                                   .format(key[:12], temps[i].temperature))
+            else:
+                # Run the equilibrium simulation
+                loadmodule = 'module swap gnu7/7.3.0 intel/2019;'
+                ret = os.system(loadmodule +
+                                './GOMC_CPU_NPT eq.conf > out.log 2>&1')
+                if ret == 0 and cacheparameters.equilibration:
+                    outputs = [f for f in os.listdir('.')
+                               if f != 'GOMC_CPU_NPT']
+                    cache.Store(key, '.', outputs)
             
             # Go back to base directory
             os.chdir(base_directory)
@@ -0,0 +1,169 @@
+import os
+import time
+import socket
+import resource
+import numpy as np
+
+
+class AccountingParameters:
+    def __init__(self, root):
+        accounting = root.find('accounting')
+
+        # Every simulation is measured; the settings only control the files
+        self.enabled = True
+        self.filename = 'resources.csv'
+        self.report = 'resources.txt'
+        # Margin added on top of the largest measured use when suggesting
+        # a batch request
+        self.headroom = 1.25
+        if accounting is not None:
+            if accounting.find('enabled') is not None:
+                self.enabled = (accounting.find('enabled').text.strip()
+                                .lower() == 'true')
+            if accounting.find('file') is not None:
+                self.filename = accounting.find('file').text.strip()
+            if accounting.find('report') is not None:
+                self.report = accounting.find('report').text.strip()
+            if accounting.find('headroom') is not None:
+                self.headroom = float(accounting.find('headroom').text)
+
+
+# Resources used by one simulation. The command runs in its own /bin/sh,
+# like os.system, and is reaped with wait4 so its rusage covers the shell
+# and everything it waited for (GOMC). Linux adds the I/O counters of a
+# reaped child to its parent, so the difference of /proc/self/io around
+# the wait is the I/O of the simulation.
+class ResourceUsage:
+    FIELDS = ['wallclock', 'cpu_user', 'cpu_system', 'max_rss', 'read_bytes',
+              'write_bytes', 'status', 'host']
+
+    @staticmethod
+    def ReadIO():
+        try:
+            with open('/proc/self/io', 'r') as file:
+                counters = dict(line.split(':') for line in file)
+            return int(counters['rchar']), int(counters['wchar'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    # Runs `command` and returns its wait status (as os.system) and a dict
+    # with the fields of FIELDS; max_rss and the I/O are in bytes
+    @staticmethod
+    def Run(command):
+        before = ResourceUsage.ReadIO()
+        start = time.time()
+        pid = os.posix_spawn('/bin/sh', ['sh', '-c', command], os.environ)
+        _, status, rusage = os.wait4(pid, 0)
+        wallclock = time.time() - start
+        after = ResourceUsage.ReadIO()
+        if before is not None and after is not None:
+            read = after[0] - before[0]
+            written = after[1] - before[1]
+        else:
+            # Block counts are the closest portable figure
+            read = rusage.ru_inblock * 512
+            written = rusage.ru_oublock * 512
+        usage = {'wallclock': wallclock,
+                 'cpu_user': rusage.ru_utime,
+                 'cpu_system': rusage.ru_stime,
+                 # kilobytes on Linux
+                 'max_rss': rusage.ru_maxrss * 1024,
+                 'read_bytes': read,
+                 'write_bytes': written,
+                 'status': status,
+                 'host': socket.gethostname()}
+        return status, usage
+
+
+# Collects the ResourceUsage of every simulation on rank 0. Each iteration
+# appends one row per simulation to the CSV file and gets a one-line
+# summary; Finish writes the campaign report with a suggested request per
+# simulation.
+class ResourceReport:
+    # temperatures: the temperature of every slot of a particle group
+    def __init__(self, settings, temperatures):
+        self.settings = settings
+        self.temperatures = temperatures
+        self.filename = os.path.abspath(settings.filename)
+        self.report = os.path.abspath(settings.report)
+        self.rows = []
+        if self.settings.enabled:
+            with open(self.filename, 'w') as file:
+                file.write('iteration,candidate,temperature,' +
+                           ','.join(ResourceUsage.FIELDS) + '\n')
+
+    # Records the simulations of an iteration; slots without usage were
+    # not simulated. Returns the summary line for the log.
+    def Record(self, it, swarm, num_of_temps):
+        rows = []
+        for i in range(len(swarm)):
+            usage = getattr(swarm[i], 'usage', None)
+            if usage is None:
+                continue
+            row = dict(usage)
+            row['iteration'] = it
+            row['candidate'] = i // num_of_temps
+            row['temperature'] = self.temperatures[i % num_of_temps]
+            rows.append(row)
+        self.rows.extend(rows)
+        if self.settings.enabled and len(rows) > 0:
+            with open(self.filename, 'a') as file:
+                for row in rows:
+                    file.write(','.join(
+                        str(row[key]) for key in ['iteration', 'candidate',
+                                                  'temperature']
+                        + ResourceUsage.FIELDS) + '\n')
+        return ResourceReport.Summary(rows)
+
+    @staticmethod
+    def Summary(rows):
+        if len(rows) == 0:
+            return 'no simulations'
+        cpu = sum(r['cpu_user'] + r['cpu_system'] for r in rows)
+        wall = sum(r['wallclock'] for r in rows)
+        failed = len([r for r in rows if r['status'] != 0])
+        return ('{} simulations, {:.2f} CPU h, {:.2f} wallclock h, peak RSS '
+                '{:.0f} MB, read {:.1f} MB, written {:.1f} MB, {} failed'
+                .format(len(rows), cpu / 3600, wall / 3600,
+                        max(r['max_rss'] for r in rows) / 2**20,
+                        sum(r['read_bytes'] for r in rows) / 2**20,
+                        sum(r['write_bytes'] for r in rows) / 2**20, failed))
+
+    # Per temperature statistics of the successful simulations and the
+    # chunk a simulation needs: cores from the CPU time per wallclock
+    # second, memory from the largest resident set
+    def Render(self):
+        lines = ['Campaign: ' + ResourceReport.Summary(self.rows), '']
+        lines.append('{:>12} {:>6} {:>10} {:>10} {:>8} {:>10} {:>10}'.format(
+            'temperature', 'runs', 'wall p50 s', 'wall p95 s', 'cores',
+            'RSS p95 MB', 'RSS max MB'))
+        ok = [r for r in self.rows if r['status'] == 0]
+        for temp in self.temperatures:
+            rows = [r for r in ok if r['temperature'] == temp]
+            if len(rows) == 0:
+                continue
+            wall = np.array([r['wallclock'] for r in rows])
+            cores = np.array([(r['cpu_user'] + r['cpu_system'])
+                              / max(r['wallclock'], 1e-9) for r in rows])
+            rss = np.array([r['max_rss'] for r in rows]) / 2**20
+            lines.append('{:>12} {:>6} {:>10.1f} {:>10.1f} {:>8.2f} {:>10.0f} '
+                         '{:>10.0f}'.format(temp, len(rows),
+                                            np.percentile(wall, 50),
+                                            np.percentile(wall, 95),
+                                            np.mean(cores),
+                                            np.percentile(rss, 95),
+                                            np.max(rss)))
+        if len(ok) > 0:
+            cores = max((r['cpu_user'] + r['cpu_system'])
+                        / max(r['wallclock'], 1e-9) for r in ok)
+            rss = max(r['max_rss'] for r in ok) * self.settings.headroom
+            lines.append('')
+            lines.append('Per simulation: ncpus={} mem={}mb'.format(
+                max(int(np.ceil(cores - 0.05)), 1),
+                int(np.ceil(rss / 2**20))))
+        return '\n'.join(lines) + '\n'
+
+    def Finish(self):
+        if self.settings.enabled:
+            with open(self.report, 'w') as file:
+                file.write(self.Render())
@@ -0,0 +1,184 @@
+import os
+import pickle
+import numpy as np
+
+from optimizer import Optimizers
+from convergence import ConvergenceMonitor
+from initializer import Initializer
+from feasibility import FeasibilityModel
+from refinement import TrustRegionSearch
+
+
+# The search of a campaign without the simulations: Ask() proposes the
+# parameter sets of the next batch, Tell() takes their costs in the same
+# order (and optionally which of them failed) and returns the reason to
+# stop, or None. It needs neither MPI nor GOMC, so a workflow manager can
+# evaluate the batches however it likes; prebuilt.py and pso-general.py
+# drive it with GOMC on MPI ranks through CampaignDriver.
+#
+#   campaign = Campaign(config, config.parameters.parameters, 20)
+#   while campaign.stop is None:
+#       costs = [Evaluate(pars) for pars in campaign.Ask()]
+#       campaign.Tell(costs)
+class Campaign:
+    # config: the Configuration read from par.xml
+    # dimensions: the searched parameters, in the order of the vectors
+    def __init__(self, config, dimensions, ncandidates):
+        self.dimensions = dimensions
+        self.ncandidates = ncandidates
+        initial = Initializer.Create(config.initparameters, dimensions,
+                                     ncandidates)
+        self.optimizer = Optimizers.Create(config.optparameters,
+                                           config.psoparameters, initial)
+        self.monitor = ConvergenceMonitor(config.convparameters, ncandidates)
+        self.feasibility = FeasibilityModel(config.feasibility)
+        self.settings = config.refinement
+        # The local search while it runs, and the best cost it last
+        # started from, so that a stalled best is refined only once
+        self.refinement = None
+        self.refined = np.finfo(np.float32).max
+        self.iteration = 0
+        # Normalized positions of the batch waiting for its costs
+        self.positions = None
+        self.best_cost = np.finfo(np.float32).max
+        self.best_pars = None
+        self.restarted = []
+        # Proposals of the last batch moved away from failure regions
+        self.repaired = []
+        self.rejected = []
+        self.stop = None
+
+    # Parameter values of a normalized position, as Particle.ConvertPosToPars
+    @staticmethod
+    def Scale(position, parameter):
+        if parameter.kind == 'discrete':
+            value = int((parameter.end + 1 - parameter.start) * position
+                        + parameter.start)
+            return min(value, parameter.end)
+        return (parameter.end - parameter.start) * position + parameter.start
+
+    def Parameters(self, positions):
+        return np.array([[Campaign.Scale(pos[d], self.dimensions[d])
+                          for d in range(len(self.dimensions))]
+                         for pos in positions])
+
+    # Asking again before telling returns the same batch
+    def Ask(self):
+        if self.positions is None and self.refinement is not None:
+            self.positions = self.refinement.Ask()
+        elif self.positions is None:
+            self.positions = self.optimizer.Ask()
+            if self.feasibility.settings.enabled:
+                self.repaired, self.rejected = self.feasibility.Screen(
+                    self.positions)
+        return self.Parameters(self.positions)
+
+    # Cost each candidate of the batch has to beat to matter to the
+    # search, e.g. to skip the rest of its simulations once it cannot
+    def References(self):
+        if self.refinement is not None:
+            return np.repeat(float(self.refinement.cost), len(self.positions))
+        return self.optimizer.PersonalBests()
+
+    # failed: whether the simulations of each candidate failed, to learn
+    # where not to propose
+    def Tell(self, costs, failed=None):
+        if self.positions is None:
+            raise ValueError('Tell() without a batch from Ask()')
+        costs = np.asarray(costs, dtype=float)
+        if len(costs) != len(self.positions):
+            raise ValueError('Expected {} costs, got {}'.format(
+                len(self.positions), len(costs)))
+        positions = self.positions
+        if failed is not None:
+            self.feasibility.Record(positions, failed)
+        best = int(np.argmin(costs))
+        if costs[best] < self.best_cost:
+            self.best_cost = float(costs[best])
+            self.best_pars = self.Parameters(positions[best:best + 1])[0]
+        self.restarted = []
+        if self.refinement is not None:
+            self.Refine(positions, costs)
+            self.positions = None
+            self.iteration += 1
+            return self.stop
+
+        self.optimizer.Tell(positions, costs)
+        self.stop = self.monitor.Update(positions, costs)
+
+        # Candidates that stopped improving are re-seeded, unless the
+        # campaign is about to stop anyway or the optimizer has no
+        # candidates of its own to re-seed
+        self.restarted = self.monitor.Stagnated()
+        if (len(self.restarted) > 0 and self.stop is None
+                and self.optimizer.Restart(self.restarted)):
+            self.monitor.Reset(self.restarted)
+        else:
+            self.restarted = []
+
+        # A stalled swarm hands over to a local search around its best;
+        # the search only moves continuous parameters
+        if (self.settings.enabled and self.stop is None
+                and any(d.kind == 'continuous' for d in self.dimensions)
+                and self.monitor.stale >= self.settings.stall
+                and self.optimizer.best_cost < self.refined):
+            self.refined = self.optimizer.best_cost
+            self.refinement = TrustRegionSearch(
+                self.settings, self.dimensions, self.optimizer.best_pos,
+                self.optimizer.best_cost, self.ncandidates)
+        self.positions = None
+        self.iteration += 1
+        return self.stop
+
+    # One round of the local search; when it is done its best becomes the
+    # best of the optimizer and the swarm continues
+    def Refine(self, positions, costs):
+        self.refinement.Tell(positions, costs)
+        if not self.refinement.Done():
+            return
+        if self.refinement.cost < self.optimizer.best_cost:
+            self.optimizer.SetBest(self.refinement.center,
+                                   self.refinement.cost)
+            self.monitor.Improve(self.refinement.cost)
+        self.refined = min(self.refined, self.refinement.cost)
+        self.refinement = None
+
+    # Everything needed to continue the search, including the random
+    # state; the dictionary can be pickled
+    def State(self):
+        return {'iteration': self.iteration,
+                'optimizer': self.optimizer,
+                'monitor': self.monitor,
+                'feasibility': self.feasibility,
+                'refinement': self.refinement,
+                'refined': self.refined,
+                'positions': self.positions,
+                'best_cost': self.best_cost,
+                'best_pars': self.best_pars,
+                'stop': self.stop,
+                'random': np.random.get_state()}
+
+    def LoadState(self, state):
+        self.iteration = state['iteration']
+        self.optimizer = state['optimizer']
+        self.monitor = state['monitor']
+        self.feasibility = state['feasibility']
+        self.refinement = state['refinement']
+        self.refined = state['refined']
+        self.positions = state['positions']
+        self.best_cost = state['best_cost']
+        self.best_pars = state['best_pars']
+        self.stop = state['stop']
+        np.random.set_state(state['random'])
+
+    # Written to a temporary file and renamed so a crash never leaves a
+    # partial state
+    def Save(self, filename):
+        temporary = filename + '.tmp'
+        with open(temporary, 'wb') as file:
+            pickle.dump(self.State(), file)
+        os.replace(temporary, filename)
+
+    def Load(self, filename):
+        with open(filename, 'rb') as file:
+            self.LoadState(pickle.load(file))
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class ConvergenceParameters:
+    def __init__(self, root):
+        conv = root.find('convergence')
+
+        # Every criterion is disabled unless it is set in par.xml
+        self.max_iterations = None
+        self.patience = None
+        self.diameter = None
+        self.target_cost = None
+        self.restart = None
+        if conv is not None:
+            if conv.find('max_iterations') is not None:
+                self.max_iterations = int(conv.find('max_iterations').text)
+            if conv.find('patience') is not None:
+                self.patience = int(conv.find('patience').text)
+            if conv.find('diameter') is not None:
+                self.diameter = float(conv.find('diameter').text)
+            if conv.find('target_cost') is not None:
+                self.target_cost = float(conv.find('target_cost').text)
+            if conv.find('restart') is not None:
+                self.restart = int(conv.find('restart').text)
+
+
+class ConvergenceMonitor:
+    def __init__(self, convparameters, npop):
+        self.settings = convparameters
+        self.best_cost = np.finfo(np.float32).max
+        self.stale = 0
+        self.personal_best = np.repeat(np.finfo(np.float32).max, npop)
+        self.personal_stale = np.zeros(npop, dtype=int)
+
+    def Update(self, positions, costs):
+        costs = np.asarray(costs, dtype=float)
+        if np.min(costs) < self.best_cost:
+            self.best_cost = np.min(costs)
+            self.stale = 0
+        else:
+            self.stale += 1
+
+        improved = costs < self.personal_best
+        self.personal_best[improved] = costs[improved]
+        self.personal_stale[improved] = 0
+        self.personal_stale[~improved] += 1
+
+        # Return the reason to stop, or None to keep going
+        settings = self.settings
+        if (settings.target_cost is not None
+                and self.best_cost <= settings.target_cost):
+            return 'global best cost {} reached target {}'.format(
+                self.best_cost, settings.target_cost)
+        if settings.patience is not None and self.stale >= settings.patience:
+            return 'no improvement in global best for {} iterations'.format(
+                self.stale)
+        if settings.diameter is not None:
+            diameter = ConvergenceMonitor.Diameter(positions)
+            if diameter < settings.diameter:
+                return 'swarm diameter {} below tolerance {}'.format(
+                    diameter, settings.diameter)
+        return None
+
+    # A better best found outside the swarm, e.g. by local refinement
+    def Improve(self, cost):
+        if cost < self.best_cost:
+            self.best_cost = cost
+            self.stale = 0
+
+    def Stagnated(self):
+        if self.settings.restart is None:
+            return []
+        stagnated = np.where(self.personal_stale >= self.settings.restart)[0]
+        return [int(i) for i in stagnated]
+
+    def Reset(self, indices):
+        for i in indices:
+            self.personal_best[i] = np.finfo(np.float32).max
+            self.personal_stale[i] = 0
+
+    @staticmethod
+    def Diameter(positions):
+        positions = np.asarray(positions)
+        diff = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+        return np.max(np.sqrt(np.sum(diff ** 2, axis=2)))
@@ -0,0 +1,277 @@
+import sys
+import copy
+import numpy as np
+from mpi4py import MPI
+
+from validation import ConfigurationError
+from campaign import Campaign
+from optimizer import Optimizers
+from metrics import CampaignMetrics
+from reweighting import ReweightingEstimator
+from scheduler import TaskScheduler
+from accounting import ResourceReport
+from islands import Islands
+from noise import NoiseModel
+from feasibility import FeasibilityModel
+
+comm = MPI.COMM_WORLD
+size = comm.Get_size()
+rank = comm.Get_rank()
+
+
+# Drives a Campaign with GOMC on the MPI ranks. Every iteration the batch
+# of the campaign is simulated at all temperatures, its costs are told to
+# the campaign and the global best, migrations, metrics and resources are
+# recorded. prebuilt.py and pso-general.py only differ in how the
+# simulations are prepared, which their Utility and Particle classes hide.
+class CampaignDriver:
+    # Reads and validates the input file once, on rank 0; every rank exits
+    # on an error
+    @staticmethod
+    def Read(configuration, filename, utility, nPop):
+        config = None
+        error = None
+        if rank == 0:
+            try:
+                config = configuration(filename)
+                error = CampaignDriver.Check(config, nPop)
+            except ConfigurationError as err:
+                error = str(err)
+            if error is not None:
+                utility.LogMessage(error)
+        config, error = comm.bcast((config, error), root=0)
+        if error is not None:
+            if rank == 0:
+                print(error)
+            sys.exit(1)
+        return config
+
+    # Problems with splitting the swarm over the ranks, None if there are
+    # none. Every island runs its own swarm on a contiguous group of ranks.
+    @staticmethod
+    def Check(config, nPop):
+        ntemps = config.temperatures.GetDim()
+        error = Islands.Check(config.islands, size, nPop, ntemps,
+                              config.scheduler.policy == 'static')
+        candidates = nPop // (config.islands.count * ntemps)
+        if (error is None and config.noise.enabled
+                and config.noise.slots >= candidates):
+            error = ('noise: {} replicate slots leave no candidates for the '
+                     'optimizer ({} per island)'.format(config.noise.slots,
+                                                        candidates))
+        if error is None and config.noise.enabled:
+            candidates -= config.noise.slots
+        if error is None:
+            error = Optimizers.Check(config.optparameters, candidates)
+        return error
+
+    # utility: the Utility class of the method
+    # dimensions: the searched parameters, in the order of Particle.pos
+    # create: returns a new Particle
+    def __init__(self, config, utility, numIt, nPop, dimensions, create):
+        self.config = config
+        self.utility = utility
+        self.numIt = numIt
+        if config.convparameters.max_iterations is not None:
+            self.numIt = config.convparameters.max_iterations
+        self.ntemps = config.temperatures.GetDim()
+        temperatures = [t.temperature for t in config.temperatures.temperatures]
+        self.island = Islands(config.islands, comm, nPop, self.ntemps)
+
+        # With the predictive scheduler the swarm may hold more
+        # simulations than there are ranks
+        self.scheduler = None
+        self.group = None
+        if config.scheduler.policy == 'predictive':
+            self.scheduler = TaskScheduler(config.scheduler, temperatures,
+                                           self.island.offset)
+        else:
+            # The ranks of one particle only synchronize among themselves
+            self.group = comm.Split(rank // self.ntemps, rank)
+
+        self.swarm = None
+        self.best_particle = None
+        if self.island.rank != 0:
+            return
+        self.swarm = [create() for i in range(self.island.npop)]
+        ncandidates = len(range(0, self.island.npop, self.ntemps))
+        # The last candidates of the swarm re-run earlier positions when
+        # the costs are noisy
+        self.replicates = 0
+        self.noise = None
+        if config.noise.enabled:
+            self.replicates = config.noise.slots
+            self.noise = NoiseModel(config.noise)
+        self.campaign = Campaign(config, dimensions,
+                                 ncandidates - self.replicates)
+        self.positions = None
+        utility.LogMessage('Using {} optimizer with {} candidates, {} '
+                           'initialization'.format(
+                               config.optparameters.kind, ncandidates,
+                               config.initparameters.method))
+        names = [d.name for d in dimensions]
+        if self.scheduler is None:
+            self.metrics = CampaignMetrics(
+                self.island.Local(config.metrics), names, temperatures,
+                self.numIt, len(self.swarm))
+        else:
+            self.metrics = CampaignMetrics(
+                self.island.Local(config.metrics), names, None, self.numIt,
+                self.island.size)
+        self.metrics.Start()
+        self.resources = ResourceReport(self.island.Local(config.accounting),
+                                        temperatures)
+        self.estimator = None
+        if config.reweighting.enabled:
+            self.estimator = ReweightingEstimator(config.reweighting,
+                                                  dimensions)
+
+    # Collective over all ranks
+    def Run(self):
+        it = 0
+        stop = None
+        while it <= self.numIt:
+            if self.island.rank == 0:
+                self.Propose(it)
+            busy = self.Evaluate(it)
+            if self.island.rank == 0:
+                stop = self.Record(it, busy)
+            stop = self.island.comm.bcast(stop, root=0)
+            if stop is not None:
+                break
+            it += 1
+
+        if self.island.rank == 0:
+            self.metrics.Finish()
+            self.resources.Finish()
+
+    # Coordinator only: moves the swarm to the next batch of the campaign
+    def Propose(self, it):
+        log = self.utility.LogMessage
+        if it == 0:
+            log('Initializing the costs for the swarm')
+        else:
+            log('Starting iteration {}'.format(it))
+        campaign = self.campaign
+        campaign.Ask()
+        if campaign.refinement is not None:
+            log('Refining the global best {}: round {}, radius {}'.format(
+                campaign.refinement.cost, campaign.refinement.round + 1,
+                campaign.refinement.radius))
+        self.positions = campaign.positions
+        if len(campaign.repaired) + len(campaign.rejected) > 0:
+            log('Proposals predicted to fail: repaired {}, redrawn {}'
+                .format(campaign.repaired, campaign.rejected))
+        batch = self.positions
+        if self.noise is not None:
+            batch = np.concatenate(
+                [batch, self.noise.Replicates(self.replicates, batch)])
+        self.utility.AssignPositions(self.swarm, batch, self.ntemps)
+        for i in range(len(self.swarm)):
+            self.swarm[i].replicate = (i // self.ntemps
+                                       >= len(self.positions))
+        reweighting = self.config.reweighting
+        if reweighting.enabled and it >= reweighting.start_iteration:
+            self.utility.ReweightCandidates(self.swarm, self.ntemps,
+                                            self.estimator,
+                                            self.best_particle.cost)
+        self.metrics.StartIteration(
+            it, len([p for p in self.swarm if not p.reweighted]))
+
+    # Collective over the island; returns the simulation time of every
+    # rank on the coordinator
+    def Evaluate(self, it):
+        if self.scheduler is None:
+            particle = self.island.comm.scatter(self.swarm, root=0)
+            particle.Evaluate(it, self.group)
+            particle.UpdateBestPosition()
+            self.swarm = self.island.comm.gather(particle, root=0)
+            if self.island.rank != 0:
+                return None
+            return [p.runtime for p in self.swarm]
+
+        references = None
+        if self.island.rank == 0:
+            references = self.campaign.References()
+        self.swarm, busy, makespans, rejected = self.scheduler.Evaluate(
+            self.island.comm, self.swarm, it, references)
+        if self.island.rank == 0:
+            self.utility.LogMessage(
+                'Simulation time per rank: max {:.1f} s, mean {:.1f} s '
+                '(predicted makespan {:.1f} s, round robin {:.1f} s)'.format(
+                    max(busy), np.mean(busy), makespans[0], makespans[1]))
+            if self.scheduler.stage is not None:
+                self.utility.LogMessage('Candidates rejected after the first '
+                                        'stage: {}'.format(rejected))
+        return busy
+
+    # Coordinator only: tells the costs to the campaign and records the
+    # iteration; returns the reason to stop, or None
+    def Record(self, it, busy):
+        log = self.utility.LogMessage
+        swarm = self.swarm
+        positions = self.positions
+        for i in range(0, len(swarm), self.ntemps):
+            self.utility.PrintCoordinates(it, swarm[i])
+        # Candidates rejected after the first stage (nan densities) only
+        # have a bound on their cost; the bound is discarded and the
+        # optimizer is told an infinite cost
+        costs = np.asarray(self.utility.GetCosts(swarm, self.ntemps),
+                           dtype=float)[:len(positions)]
+        for k in range(len(positions)):
+            if np.any(np.isnan(swarm[k * self.ntemps].dens)):
+                costs[k] = np.inf
+        failed = FeasibilityModel.Failures(swarm, self.ntemps)
+        stop = self.campaign.Tell(costs, failed[:len(positions)])
+        if len(self.campaign.restarted) > 0:
+            log('Restarting stagnated candidates: {}'
+                .format(self.campaign.restarted))
+            # The slots of a re-seeded candidate start a new history
+            for k in self.campaign.restarted:
+                for particle in swarm[k * self.ntemps:(k + 1) * self.ntemps]:
+                    particle.best_cost = np.finfo(np.float32).max
+                    particle.best_pos = np.copy(particle.pos)
+
+        self.UpdateBest(it)
+        if self.island.Due(it):
+            cost, pars, best = self.island.Migrate(
+                self.campaign.optimizer, positions, costs, self.best_particle)
+            log('Exchanged migrants; best over all islands: {}, {} '
+                '(island {})'.format(cost, pars, best))
+        log('Resources: {}'.format(
+            self.resources.Record(it, swarm, self.ntemps)))
+        self.metrics.EndIteration(
+            CampaignMetrics.CountFailures(swarm, self.ntemps), busy,
+            self.best_particle)
+        stop = self.island.Stop(stop)
+        if stop is not None:
+            log('Stopping after iteration {}: {}'.format(it, stop))
+        return stop
+
+    def UpdateBest(self, it):
+        log = self.utility.LogMessage
+        swarm = self.swarm
+        best_p = self.utility.GetBestParticle(swarm, self.ntemps)
+        if self.noise is not None:
+            # The incumbent changes only for a significantly better mean
+            for i in range(0, len(swarm), self.ntemps):
+                self.noise.Add(swarm[i])
+            best = self.noise.Select()
+            self.campaign.optimizer.SetBest(best.pos, best.cost)
+            runs = self.noise.Estimate(self.noise.incumbent)[2]
+            log('Global best: {} +- {} over {} runs, {}, {}, {}'.format(
+                best.cost, best.cost_err, runs, best.pars, best.pos,
+                best.dens))
+        elif it == 0:
+            best = copy.deepcopy(best_p)
+            log('Best global cost: {}, {}, {}, {}'.format(
+                best.cost, best.pars, best.pos, best.dens))
+        elif best_p.cost < self.best_particle.cost:
+            best = copy.deepcopy(best_p)
+            log('Found better global cost: {}, {}, {}'.format(
+                best.cost, best.pos, best.dens))
+        else:
+            best = self.best_particle
+            log('Old global best is still better! {}, {}, {}'.format(
+                best.cost, best.pos, best.dens))
+        self.best_particle = best
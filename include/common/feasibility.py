@@ -0,0 +1,101 @@
+import numpy as np
+
+
+class FeasibilityParameters:
+    def __init__(self, root):
+        feasibility = root.find('feasibility')
+
+        # Off by default: every proposal is simulated
+        self.enabled = False
+        self.neighbors = 5
+        # Failure probability above which a proposal is not launched
+        self.threshold = 0.5
+        # Random draws tried for a proposal that cannot be repaired
+        self.attempts = 100
+        if feasibility is not None:
+            if feasibility.find('enabled') is not None:
+                self.enabled = (feasibility.find('enabled').text.strip()
+                                .lower() == 'true')
+            if feasibility.find('neighbors') is not None:
+                self.neighbors = int(feasibility.find('neighbors').text)
+            if feasibility.find('threshold') is not None:
+                self.threshold = float(feasibility.find('threshold').text)
+            if feasibility.find('attempts') is not None:
+                self.attempts = int(feasibility.find('attempts').text)
+
+
+# Where the simulations failed, as a distance weighted k-nearest-neighbour
+# classifier over the normalized positions of every evaluated candidate.
+# A proposal predicted to fail is repaired by moving it towards the
+# nearest candidate that succeeded; if no point on the way is predicted to
+# succeed it is rejected and replaced by a random position that is.
+class FeasibilityModel:
+    def __init__(self, settings):
+        self.settings = settings
+        self.points = []
+        self.failed = []
+
+    # A candidate failed when a simulation exited with an error or left no
+    # density (9999), as counted by CampaignMetrics.CountFailures
+    @staticmethod
+    def Failures(swarm, num_of_temps):
+        failed = []
+        for i in range(0, len(swarm), num_of_temps):
+            failed.append(any(
+                getattr(swarm[j], 'returncode', 0) != 0
+                or swarm[i].dens[j - i] == 9999
+                for j in range(i, i + num_of_temps)))
+        return failed
+
+    def Record(self, positions, failed):
+        for pos, fail in zip(positions, failed):
+            self.points.append(np.copy(pos))
+            self.failed.append(bool(fail))
+
+    # Probability that a simulation at `pos` fails; zero until something
+    # has failed
+    def Probability(self, pos):
+        if not any(self.failed):
+            return 0.0
+        distances = np.linalg.norm(np.array(self.points) - pos, axis=1)
+        nearest = np.argsort(distances)[:self.settings.neighbors]
+        weights = 1.0 / (distances[nearest] + 1e-6)
+        return float(np.sum(weights * np.array(self.failed)[nearest])
+                     / np.sum(weights))
+
+    def Feasible(self, pos):
+        return self.Probability(pos) <= self.settings.threshold
+
+    # Changes the infeasible proposals in place; returns the indices of the
+    # repaired and of the rejected ones
+    def Screen(self, positions):
+        repaired = []
+        rejected = []
+        if not any(self.failed):
+            return repaired, rejected
+        succeeded = np.array([p for p, f in zip(self.points, self.failed)
+                              if not f])
+        for i in range(len(positions)):
+            if self.Feasible(positions[i]):
+                continue
+            replacement = None
+            if len(succeeded) > 0:
+                target = succeeded[np.argmin(np.linalg.norm(
+                    succeeded - positions[i], axis=1))]
+                for step in [0.25, 0.5, 0.75]:
+                    pos = positions[i] + step * (target - positions[i])
+                    if self.Feasible(pos):
+                        replacement = pos
+                        repaired.append(i)
+                        break
+            if replacement is None:
+                for _ in range(self.settings.attempts):
+                    pos = np.random.uniform(0.0, 1.0, len(positions[i]))
+                    if self.Feasible(pos):
+                        replacement = pos
+                        rejected.append(i)
+                        break
+            # Nothing predicted to succeed; the proposal is simulated
+            if replacement is not None:
+                positions[i] = replacement
+        return repaired, rejected
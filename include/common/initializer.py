@@ -0,0 +1,164 @@
+import numpy as np
+
+
+class InitializerParameters:
+    def __init__(self, root):
+        init = root.find('initialization')
+
+        self.method = 'uniform'
+        self.spread = 0.1
+        self.import_file = None
+        if init is not None:
+            if init.find('method') is not None:
+                self.method = init.find('method').text.strip().lower()
+            if init.find('spread') is not None:
+                self.spread = float(init.find('spread').text)
+            if init.find('import') is not None:
+                self.import_file = init.find('import').text.strip()
+
+
+class Initializer:
+    # Direction numbers for dimensions 2-16 from Joe and Kuo
+    # (new-joe-kuo-6.21201): degree s, coefficient a and initial m values.
+    SOBOL_DIRECTIONS = [
+        (1, 0, [1]),
+        (2, 1, [1, 3]),
+        (3, 1, [1, 3, 1]),
+        (3, 2, [1, 1, 1]),
+        (4, 1, [1, 1, 3, 3]),
+        (4, 4, [1, 3, 5, 13]),
+        (5, 2, [1, 1, 5, 5, 17]),
+        (5, 4, [1, 1, 5, 5, 5]),
+        (5, 7, [1, 1, 7, 11, 19]),
+        (5, 11, [1, 1, 5, 1, 1]),
+        (5, 13, [1, 1, 1, 3, 11]),
+        (5, 14, [1, 3, 5, 5, 31]),
+        (6, 1, [1, 3, 3, 9, 7, 49]),
+        (6, 13, [1, 1, 1, 15, 21, 21]),
+        (6, 16, [1, 3, 1, 13, 27, 49]),
+    ]
+    SOBOL_MAX_DIM = len(SOBOL_DIRECTIONS) + 1
+    SOBOL_BITS = 30
+
+    # dimensions: the searched Parameter-like objects (name, kind, start,
+    # end and optionally reference) in the order of Particle.pos
+    @staticmethod
+    def Create(initparameters, dimensions, npop):
+        dim = len(dimensions)
+        method = initparameters.method
+        if method == 'uniform':
+            positions = Initializer.Uniform(npop, dim)
+        elif method == 'sobol':
+            positions = Initializer.Sobol(npop, dim)
+        elif method == 'lhs':
+            positions = Initializer.LatinHypercube(npop, dim)
+        elif method == 'reference':
+            positions = Initializer.Reference(npop, dimensions,
+                                              initparameters.spread)
+        else:
+            raise ValueError('Unknown initialization method: ' + method)
+
+        # Seed the first candidates with the best results of a previous run
+        if initparameters.import_file is not None:
+            imported = Initializer.ImportPositions(initparameters.import_file,
+                                                   dimensions, npop)
+            positions[:len(imported)] = imported
+        return positions
+
+    @staticmethod
+    def Uniform(npop, dim):
+        return np.random.uniform(0.0, 1.0, (npop, dim))
+
+    @staticmethod
+    def Sobol(npop, dim):
+        if dim > Initializer.SOBOL_MAX_DIM:
+            raise ValueError('Sobol initialization supports at most {} '
+                             'parameters'.format(Initializer.SOBOL_MAX_DIM))
+        bits = Initializer.SOBOL_BITS
+        V = np.zeros((dim, bits), dtype=np.int64)
+        V[0] = [1 << (bits - 1 - k) for k in range(bits)]
+        for d in range(1, dim):
+            s, a, m = Initializer.SOBOL_DIRECTIONS[d - 1]
+            for k in range(bits):
+                if k < s:
+                    V[d][k] = m[k] << (bits - 1 - k)
+                else:
+                    V[d][k] = V[d][k - s] ^ (V[d][k - s] >> s)
+                    for j in range(1, s):
+                        if (a >> (s - 1 - j)) & 1:
+                            V[d][k] ^= V[d][k - j]
+
+        # Gray code construction with a random digital shift so the
+        # first point is not always the corner of the box
+        points = np.zeros((npop, dim), dtype=np.int64)
+        x = np.zeros(dim, dtype=np.int64)
+        for i in range(1, npop):
+            c = 0
+            value = i - 1
+            while value & 1:
+                value >>= 1
+                c += 1
+            x = x ^ V[:, c]
+            points[i] = x
+        shift = np.random.randint(0, 1 << bits, dim, dtype=np.int64)
+        return (points ^ shift) / float(1 << bits)
+
+    @staticmethod
+    def LatinHypercube(npop, dim):
+        positions = np.zeros((npop, dim))
+        for d in range(dim):
+            strata = np.random.permutation(npop)
+            positions[:, d] = (strata + np.random.uniform(0.0, 1.0, npop)) / npop
+        return positions
+
+    @staticmethod
+    def Reference(npop, dimensions, spread):
+        center = []
+        for parameter in dimensions:
+            if getattr(parameter, 'reference', None) is None:
+                raise ValueError('Parameter ' + parameter.name +
+                                 ' has no reference value')
+            center.append(Initializer.Normalize(float(parameter.reference),
+                                                parameter))
+        center = np.array(center)
+        positions = np.random.normal(center, spread, (npop, len(center)))
+        # Keep the reference itself as one of the candidates
+        positions[0] = center
+        return np.clip(positions, 0.0, 1.0)
+
+    @staticmethod
+    def Normalize(value, parameter):
+        if parameter.kind == 'discrete':
+            pos = ((value - parameter.start + 0.5)
+                   / (parameter.end - parameter.start + 1))
+        else:
+            pos = (value - parameter.start) / (parameter.end - parameter.start)
+        return min(max(pos, 0.0), 1.0)
+
+    @staticmethod
+    def ImportPositions(filename, dimensions, npop):
+        # data.csv lines: it,pos,pars,dens,vel,best_pos,cost. The physical
+        # pars are re-normalized so a campaign with different ranges can
+        # be imported.
+        results = []
+        with open(filename, 'r') as file:
+            for line in file:
+                columns = line.strip().split(',')
+                if len(columns) < 7:
+                    continue
+                pars = np.array(columns[2].strip(' []').split(), dtype=float)
+                if len(pars) != len(dimensions):
+                    continue
+                results.append((float(columns[6]), tuple(pars)))
+
+        positions = []
+        seen = set()
+        for cost, pars in sorted(results):
+            if pars in seen:
+                continue
+            seen.add(pars)
+            positions.append([Initializer.Normalize(pars[i], parameter)
+                              for i, parameter in enumerate(dimensions)])
+            if len(positions) == npop:
+                break
+        return np.array(positions).reshape(-1, len(dimensions))
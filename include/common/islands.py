@@ -0,0 +1,104 @@
+import os
+import copy
+import numpy as np
+from mpi4py import MPI
+
+
+class IslandParameters:
+    def __init__(self, root):
+        islands = root.find('islands')
+
+        # A single island is the usual one-swarm campaign
+        self.count = 1
+        self.interval = 10
+        self.migrants = 1
+        if islands is not None:
+            if islands.find('count') is not None:
+                self.count = int(islands.find('count').text)
+            if islands.find('interval') is not None:
+                self.interval = int(islands.find('interval').text)
+            if islands.find('migrants') is not None:
+                self.migrants = int(islands.find('migrants').text)
+
+
+# Splits the ranks into `count` contiguous groups, each running its own
+# swarm with its own coordinator (rank 0 of the group). Every `interval`
+# iterations the coordinators exchange their best candidates over a
+# communicator of their own: island k receives the migrants of island
+# k - 1. Everything else, including the swarm updates and best selection,
+# stays inside the island.
+class Islands:
+    def __init__(self, settings, comm, npop, ntemps):
+        self.settings = settings
+        self.count = settings.count
+        world = comm.Get_rank()
+        self.index = world * self.count // comm.Get_size()
+        self.comm = comm.Split(self.index, world)
+        self.rank = self.comm.Get_rank()
+        self.size = self.comm.Get_size()
+        self.leaders = comm.Split(0 if self.rank == 0 else MPI.UNDEFINED,
+                                  world)
+        # Swarm slots of this island and the first one in the whole
+        # campaign, which keeps the run folders of the islands apart
+        self.npop = npop // self.count
+        self.offset = self.index * self.npop
+        self.ntemps = ntemps
+
+    # Problems with the number of ranks or swarm slots, None if there are
+    # none. The static policy needs one rank per swarm slot.
+    @staticmethod
+    def Check(settings, size, npop, ntemps, static):
+        count = settings.count
+        if static and size % count != 0:
+            return ('{} ranks cannot be split into {} equal islands'
+                    .format(size, count))
+        if npop % (count * ntemps) != 0:
+            return ('{} swarm slots cannot be split into {} islands of '
+                    'whole candidates ({} temperatures)'.format(npop, count,
+                                                                ntemps))
+        if size < count:
+            return 'fewer ranks ({}) than islands ({})'.format(size, count)
+        return None
+
+    # Per-island copy of the metrics or accounting settings: the file
+    # names get an .island<k> suffix and the HTTP port is offset by k
+    def Local(self, settings):
+        if self.count == 1:
+            return settings
+        local = copy.copy(settings)
+        for name in ['filename', 'report']:
+            if hasattr(local, name):
+                root, ext = os.path.splitext(getattr(local, name))
+                setattr(local, name,
+                        '{}.island{}{}'.format(root, self.index, ext))
+        if getattr(local, 'port', None) is not None:
+            local.port += self.index
+        return local
+
+    def Due(self, it):
+        return (self.count > 1 and it > 0
+                and it % self.settings.interval == 0)
+
+    # Coordinators only. Sends the best `migrants` of this iteration, with
+    # the island best, and hands those of the previous island to the
+    # optimizer. Returns the best (cost, pars, island) over all islands.
+    def Migrate(self, optimizer, positions, costs, best_particle):
+        costs = np.asarray(costs, dtype=float)
+        order = np.argsort(costs)[:self.settings.migrants]
+        outgoing = (positions[order], costs[order], float(best_particle.cost),
+                    np.copy(best_particle.pars))
+        everything = self.leaders.allgather(outgoing)
+        incoming = everything[(self.index - 1) % self.count]
+        optimizer.Migrate(incoming[0], incoming[1])
+        best = int(np.argmin([e[2] for e in everything]))
+        return everything[best][2], everything[best][3], best
+
+    # Coordinators only. The campaign stops once every island has a reason
+    # to stop, so that the migrations stay collective.
+    def Stop(self, stop):
+        if self.count == 1:
+            return stop
+        stops = self.leaders.allgather(stop)
+        if any(s is None for s in stops):
+            return None
+        return stops[self.index]
@@ -0,0 +1,245 @@
+import os
+import time
+import threading
+import numpy as np
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+
+class MetricsParameters:
+    def __init__(self, root):
+        metrics = root.find('metrics')
+
+        # The metrics file is written by default, the HTTP endpoint only
+        # when a port is set
+        self.enabled = True
+        self.filename = 'metrics.prom'
+        self.interval = 30.0
+        self.port = None
+        self.address = '127.0.0.1'
+        if metrics is not None:
+            if metrics.find('enabled') is not None:
+                self.enabled = (metrics.find('enabled').text.strip().lower()
+                                == 'true')
+            if metrics.find('file') is not None:
+                self.filename = metrics.find('file').text.strip()
+            if metrics.find('interval') is not None:
+                self.interval = float(metrics.find('interval').text)
+            if metrics.find('port') is not None:
+                self.port = int(metrics.find('port').text)
+            if metrics.find('address') is not None:
+                self.address = metrics.find('address').text.strip()
+
+
+# Progress of a campaign as seen by rank 0. The counters are updated at
+# the start and end of every iteration; a background thread rewrites the
+# Prometheus text file every `interval` seconds so the elapsed times and
+# the estimate to finish stay current while the simulations run.
+class CampaignMetrics:
+    PREFIX = 'psogof_'
+
+    # names: the searched dimensions in the order of Particle.pars
+    # temperatures: temperature of every rank in a particle group, None
+    # when the ranks do not have a fixed temperature
+    def __init__(self, settings, names, temperatures, max_iterations,
+                 nranks):
+        self.settings = settings
+        self.names = names
+        self.temperatures = temperatures
+        self.max_iterations = max_iterations
+        self.nranks = nranks
+        self.filename = os.path.abspath(settings.filename)
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = None
+        self.server = None
+
+        self.start = time.time()
+        self.iteration = 0
+        self.iteration_start = None
+        self.durations = []
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.best_cost = float('nan')
+        self.best_pars = [float('nan')] * len(names)
+        self.runtime = np.zeros(nranks)
+        self.busy = np.zeros(nranks)
+        self.utilization = np.zeros(nranks)
+        self.finished = 0
+        self.updated = self.start
+
+    def Start(self):
+        if not self.settings.enabled:
+            return
+        self.Write()
+        self.thread = threading.Thread(target=self.Refresh, daemon=True)
+        self.thread.start()
+        if self.settings.port is not None:
+            self.Serve()
+
+    def Refresh(self):
+        while not self.stop.wait(self.settings.interval):
+            self.Write()
+
+    def Serve(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = metrics.Render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer((self.settings.address, self.settings.port),
+                                 Handler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+
+    def StartIteration(self, it, running):
+        with self.lock:
+            self.iteration = it
+            self.iteration_start = time.time()
+            self.running = running
+            self.updated = self.iteration_start
+        self.Write()
+
+    # failures: number of simulations of this iteration that failed
+    # runtimes: wallclock of the simulation of every rank
+    def EndIteration(self, failures, runtimes, best_particle):
+        now = time.time()
+        with self.lock:
+            wall = max(now - self.iteration_start, 1e-9)
+            self.durations.append(wall)
+            self.completed += self.running
+            self.failed += failures
+            self.running = 0
+            self.runtime = np.asarray(runtimes, dtype=float)
+            self.busy += self.runtime
+            self.utilization = np.minimum(self.runtime / wall, 1.0)
+            self.best_cost = float(best_particle.cost)
+            self.best_pars = [float(p) for p in best_particle.pars]
+            self.updated = now
+        self.Write()
+
+    def Finish(self):
+        with self.lock:
+            self.finished = 1
+            self.running = 0
+            self.updated = time.time()
+        self.stop.set()
+        self.Write()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    # Seconds left, from the mean duration of the finished iterations
+    def ETA(self, now):
+        if self.finished or len(self.durations) == 0:
+            return 0.0
+        remaining = self.max_iterations - self.iteration
+        if self.running > 0:
+            elapsed = now - self.iteration_start
+            current = max(np.mean(self.durations) - elapsed, 0.0)
+            return current + np.mean(self.durations) * remaining
+        return np.mean(self.durations) * remaining
+
+    def Render(self):
+        lines = []
+
+        def Add(name, kind, help, samples):
+            lines.append('# HELP {}{} {}'.format(self.PREFIX, name, help))
+            lines.append('# TYPE {}{} {}'.format(self.PREFIX, name, kind))
+            for labels, value in samples:
+                lines.append('{}{}{} {}'.format(self.PREFIX, name, labels,
+                                                float(value)))
+
+        with self.lock:
+            now = time.time()
+            elapsed = 0.0
+            if self.running > 0:
+                elapsed = now - self.iteration_start
+            Add('iteration', 'gauge', 'Current iteration',
+                [('', self.iteration)])
+            Add('max_iterations', 'gauge', 'Last iteration of the campaign',
+                [('', self.max_iterations)])
+            Add('evaluations_completed_total', 'counter',
+                'Simulations finished', [('', self.completed)])
+            Add('evaluations_running', 'gauge',
+                'Simulations of the current iteration',
+                [('', self.running)])
+            Add('evaluations_failed_total', 'counter',
+                'Simulations that failed or gave no density',
+                [('', self.failed)])
+            Add('best_cost', 'gauge', 'Global best cost',
+                [('', self.best_cost)])
+            Add('best_parameter', 'gauge', 'Parameters of the global best',
+                [('{{name="{}"}}'.format(name), value)
+                 for name, value in zip(self.names, self.best_pars)])
+            if self.temperatures is None:
+                rank_labels = ['{{rank="{}"}}'.format(rank)
+                               for rank in range(self.nranks)]
+            else:
+                rank_labels = ['{{rank="{}",temperature="{}"}}'.format(
+                    rank, self.temperatures[rank % len(self.temperatures)])
+                    for rank in range(self.nranks)]
+            Add('rank_runtime_seconds', 'gauge',
+                'Simulation wallclock of every rank in the last iteration',
+                zip(rank_labels, self.runtime))
+            Add('rank_busy_seconds_total', 'counter',
+                'Simulation wallclock of every rank',
+                zip(rank_labels, self.busy))
+            Add('rank_utilization', 'gauge',
+                'Fraction of the last iteration every rank was simulating',
+                zip(rank_labels, self.utilization))
+            Add('iteration_elapsed_seconds', 'gauge',
+                'Time spent in the current iteration', [('', elapsed)])
+            Add('iteration_mean_seconds', 'gauge',
+                'Mean duration of the finished iterations',
+                [('', np.mean(self.durations)
+                  if len(self.durations) > 0 else 0.0)])
+            Add('elapsed_seconds', 'gauge', 'Time since the campaign started',
+                [('', now - self.start)])
+            Add('eta_seconds', 'gauge', 'Estimated time to finish',
+                [('', self.ETA(now))])
+            Add('finished', 'gauge', '1 once the campaign has stopped',
+                [('', self.finished)])
+            Add('last_update_timestamp_seconds', 'gauge',
+                'Time of the last progress update', [('', self.updated)])
+        return '\n'.join(lines) + '\n'
+
+    # Written to a temporary file and renamed so readers never see a
+    # partial file
+    def Write(self):
+        if not self.settings.enabled:
+            return
+        text = self.Render()
+        temporary = self.filename + '.tmp'
+        try:
+            with open(temporary, 'w') as file:
+                file.write(text)
+            os.replace(temporary, self.filename)
+        except OSError:
+            pass
+
+    # Number of failed simulations: a non-zero return code or the 9999
+    # density GetCost assigns when the output is missing or too short
+    @staticmethod
+    def CountFailures(swarm, num_of_temps):
+        failures = 0
+        for i in range(len(swarm)):
+            root = swarm[i - i % num_of_temps]
+            if (getattr(swarm[i], 'returncode', 0) != 0
+                    or root.dens[i % num_of_temps] == 9999):
+                failures += 1
+        return failures
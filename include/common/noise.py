@@ -0,0 +1,143 @@
+import re
+import copy
+import numpy as np
+
+
+class NoiseParameters:
+    def __init__(self, root):
+        noise = root.find('noise')
+
+        # Off by default: the global best is the lowest single cost
+        self.enabled = False
+        # Candidate slots of every iteration used for replicates
+        self.slots = 1
+        # Two costs differ when their difference exceeds z standard errors
+        self.z = 2.0
+        self.max_replicates = 4
+        if noise is not None:
+            if noise.find('enabled') is not None:
+                self.enabled = (noise.find('enabled').text.strip().lower()
+                                == 'true')
+            if noise.find('slots') is not None:
+                self.slots = int(noise.find('slots').text)
+            if noise.find('z') is not None:
+                self.z = float(noise.find('z').text)
+            if noise.find('max_replicates') is not None:
+                self.max_replicates = int(noise.find('max_replicates').text)
+
+
+# Every simulated candidate with the costs of its runs, on rank 0. The
+# uncertainty of a single cost comes from the scatter of the production
+# blocks (Particle.cost_err); replicates with other seeds average it down.
+# The incumbent only changes for a candidate that is better by more than
+# z standard errors of the difference, or that is better on average once
+# both have max_replicates runs. Candidates within noise of the incumbent
+# get replicate runs in the reserved slots.
+class NoiseModel:
+    def __init__(self, settings):
+        self.settings = settings
+        self.records = {}
+        self.incumbent = None
+
+    @staticmethod
+    def Key(pos):
+        return tuple(np.round(pos, 12))
+
+    # Scored particle of a candidate group; bounds of rejected candidates
+    # (nan densities) and reweighted estimates are not samples
+    def Add(self, particle):
+        if particle.reweighted or np.any(np.isnan(particle.dens)):
+            return
+        key = NoiseModel.Key(particle.pos)
+        record = self.records.setdefault(key, {'costs': [], 'errors': [],
+                                               'particle': None})
+        record['costs'].append(float(particle.cost))
+        record['errors'].append(float(particle.cost_err))
+        if record['particle'] is None:
+            record['particle'] = copy.deepcopy(particle)
+
+    # Mean cost, its standard error and the number of runs
+    def Estimate(self, key):
+        costs = np.array(self.records[key]['costs'])
+        errors = np.array(self.records[key]['errors'])
+        n = len(costs)
+        se = np.sqrt(np.mean(errors ** 2) / n)
+        if n > 1:
+            se = max(se, np.std(costs, ddof=1) / np.sqrt(n))
+        return np.mean(costs), se, n
+
+    # True when candidate `a` should replace `b`
+    def Better(self, a, b):
+        mean_a, se_a, n_a = self.Estimate(a)
+        mean_b, se_b, n_b = self.Estimate(b)
+        difference = mean_b - mean_a
+        if difference > self.settings.z * np.sqrt(se_a ** 2 + se_b ** 2):
+            return True
+        return (difference > 0 and n_a >= self.settings.max_replicates
+                and n_b >= self.settings.max_replicates)
+
+    # Within noise of the incumbent
+    def Close(self, key):
+        mean_a, se_a, _ = self.Estimate(key)
+        mean_b, se_b, _ = self.Estimate(self.incumbent)
+        return (key != self.incumbent and abs(mean_a - mean_b)
+                <= self.settings.z * np.sqrt(se_a ** 2 + se_b ** 2))
+
+    # Re-evaluates the incumbent from every record; returns a copy of its
+    # particle with the mean cost, or None before the first sample
+    def Select(self):
+        keys = sorted(self.records, key=lambda k: self.Estimate(k)[0])
+        if len(keys) == 0:
+            return None
+        if self.incumbent is None:
+            self.incumbent = keys[0]
+        for key in keys:
+            if key != self.incumbent and self.Better(key, self.incumbent):
+                self.incumbent = key
+                break
+        best = copy.deepcopy(self.records[self.incumbent]['particle'])
+        best.cost, best.cost_err, _ = self.Estimate(self.incumbent)
+        return best
+
+    # Positions to replicate in `count` slots: the candidates within noise
+    # of the incumbent with the lowest mean first, and the incumbent while
+    # it has no more runs than they have. Without such candidates the
+    # incumbent and then the runner-up are confirmed. Before the first
+    # sample the slots replicate `fallback`.
+    def Replicates(self, count, fallback):
+        if self.incumbent is None:
+            return [np.copy(fallback[i % len(fallback)]) for i in range(count)]
+        close = [key for key in self.records if self.Close(key)]
+        contenders = [key for key in close
+                      if self.Estimate(key)[2] < self.settings.max_replicates]
+        contenders.sort(key=lambda k: self.Estimate(k)[0])
+        keys = []
+        runs = self.Estimate(self.incumbent)[2]
+        if (len(close) > 0 and runs < self.settings.max_replicates
+                and runs <= min(self.Estimate(k)[2] for k in close)):
+            keys.append(self.incumbent)
+        keys += contenders
+        if len(keys) == 0 and runs < self.settings.max_replicates:
+            keys = [self.incumbent]
+        if len(keys) == 0:
+            keys = sorted([key for key in self.records
+                           if key != self.incumbent and self.Estimate(key)[2]
+                           < self.settings.max_replicates],
+                          key=lambda k: self.Estimate(k)[0])[:1]
+        if len(keys) == 0:
+            keys = [self.incumbent]
+        keys = [keys[i % len(keys)] for i in range(count)]
+        return [np.copy(self.records[key]['particle'].pos) for key in keys]
+
+    # GOMC seeds every run from the clock with PRNG RANDOM; a fixed
+    # INTSEED would repeat the original run, so it gets a new seed
+    @staticmethod
+    def Reseed(filename):
+        with open(filename, 'r') as file:
+            lines = file.readlines()
+        for i, line in enumerate(lines):
+            if re.match(r'\s*Random_Seed\b', line):
+                lines[i] = 'Random_Seed\t{}\n'.format(
+                    np.random.randint(1, 2 ** 31 - 1))
+        with open(filename, 'w') as file:
+            file.writelines(lines)
@@ -0,0 +1,283 @@
+import numpy as np
+
+
+class OptimizerParameters:
+    def __init__(self, root):
+        opt = root.find('optimizer')
+
+        # PSO stays the default so existing par.xml files keep working
+        self.kind = 'pso'
+        self.sigma = 0.3
+        self.f = 0.8
+        self.cr = 0.9
+        if opt is not None:
+            if opt.find('type') is not None:
+                self.kind = opt.find('type').text.strip().lower()
+            if opt.find('sigma') is not None:
+                self.sigma = float(opt.find('sigma').text)
+            if opt.find('f') is not None:
+                self.f = float(opt.find('f').text)
+            if opt.find('cr') is not None:
+                self.cr = float(opt.find('cr').text)
+
+
+# All optimizers work in the normalized [0, 1]^dim space of Particle.pos.
+# Ask() proposes a batch of positions, the caller evaluates them and hands
+# the costs back through Tell() in the same order.
+class Optimizer:
+    def __init__(self, dim, npop):
+        self.dim = dim
+        self.npop = npop
+        self.best_pos = None
+        self.best_cost = np.finfo(np.float32).max
+
+    # Re-seed the given candidates at random and return True; optimizers
+    # without per-candidate state ignore it and return False.
+    def Restart(self, indices):
+        return False
+
+    # Candidates from another island. They take the place of the worst
+    # candidates; optimizers without per-candidate state only keep the
+    # better best.
+    def Migrate(self, positions, costs):
+        self.UpdateBest(positions, costs)
+
+    def UpdateBest(self, positions, costs):
+        index = int(np.argmin(costs))
+        if costs[index] < self.best_cost:
+            self.best_cost = costs[index]
+            self.best_pos = np.copy(positions[index])
+
+    # Cost every candidate has to beat to change the search; without
+    # per-candidate state that is the best so far
+    def PersonalBests(self):
+        return np.repeat(float(self.best_cost), self.npop)
+
+    # Overrides the best found by Tell(), e.g. with an incumbent judged
+    # over replicate runs; PSO steers its social term towards it
+    def SetBest(self, position, cost):
+        self.best_pos = np.copy(position)
+        self.best_cost = cost
+
+
+class ParticleSwarmOptimizer(Optimizer):
+    def __init__(self, initial, w, c1, c2):
+        Optimizer.__init__(self, initial.shape[1], initial.shape[0])
+        self.w = w
+        self.c1 = c1
+        self.c2 = c2
+        self.pos = np.copy(initial)
+        self.vel = np.zeros(shape=[self.npop, self.dim], dtype=np.float32)
+        self.pbest_pos = np.copy(self.pos)
+        self.pbest_cost = np.repeat(np.finfo(np.float32).max, self.npop)
+        self.evaluated = False
+
+    def Ask(self):
+        if self.evaluated:
+            r1 = np.random.uniform(0.0, 1.0, (self.npop, self.dim))
+            r2 = np.random.uniform(0.0, 1.0, (self.npop, self.dim))
+            self.vel = (self.w * self.vel
+                        + self.c1 * r1 * (self.pbest_pos - self.pos)
+                        + self.c2 * r2 * (self.best_pos - self.pos))
+            self.vel = np.clip(self.vel, -0.1, 0.1)
+            self.pos = np.clip(self.pos + self.vel, 0.0, 1.0)
+        return np.copy(self.pos)
+
+    def Tell(self, positions, costs):
+        costs = np.asarray(costs, dtype=float)
+        # The batch may have been moved after Ask(), e.g. out of a failure
+        # region; the particles continue from where they were evaluated
+        self.pos = np.copy(positions)
+        improved = costs < self.pbest_cost
+        self.pbest_cost[improved] = costs[improved]
+        self.pbest_pos[improved] = positions[improved]
+        self.UpdateBest(positions, costs)
+        self.evaluated = True
+
+    def PersonalBests(self):
+        return np.copy(self.pbest_cost)
+
+    def Restart(self, indices):
+        for i in indices:
+            self.pos[i] = np.random.uniform(0.0, 1.0, self.dim)
+            self.vel[i] = 0.0
+            self.pbest_pos[i] = self.pos[i]
+            self.pbest_cost[i] = np.finfo(np.float32).max
+        return True
+
+    def Migrate(self, positions, costs):
+        worst = np.argsort(self.pbest_cost)[::-1][:len(costs)]
+        for i, pos, cost in zip(worst, positions, costs):
+            if cost < self.pbest_cost[i]:
+                self.pos[i] = pos
+                self.vel[i] = 0.0
+                self.pbest_pos[i] = pos
+                self.pbest_cost[i] = cost
+        self.UpdateBest(positions, costs)
+
+
+class CMAESOptimizer(Optimizer):
+    def __init__(self, initial, sigma):
+        Optimizer.__init__(self, initial.shape[1], initial.shape[0])
+        n = self.dim
+        npop = self.npop
+        self.mean = np.repeat(0.5, n)
+        self.sigma = sigma
+
+        # Selection and recombination weights
+        self.mu = max(npop // 2, 1)
+        weights = np.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / np.sum(weights)
+        self.mueff = 1.0 / np.sum(self.weights ** 2)
+
+        # Adaptation constants (Hansen, The CMA Evolution Strategy: A Tutorial)
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff)
+                       / ((n + 2) ** 2 + self.mueff))
+        self.damps = (1 + 2 * max(0, np.sqrt((self.mueff - 1) / (n + 1)) - 1)
+                      + self.cs)
+        self.chiN = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.C = np.eye(n)
+        self.generation = 0
+        self.initial = np.copy(initial)
+
+    def Ask(self):
+        if self.generation == 0:
+            return np.copy(self.initial)
+        eigval, B = np.linalg.eigh(self.C)
+        D = np.sqrt(np.maximum(eigval, 1e-20))
+        z = np.random.standard_normal((self.npop, self.dim))
+        positions = self.mean + self.sigma * (z * D) @ B.T
+        return np.clip(positions, 0.0, 1.0)
+
+    def Tell(self, positions, costs):
+        costs = np.asarray(costs, dtype=float)
+        self.UpdateBest(positions, costs)
+        order = np.argsort(costs)[:self.mu]
+        selected = positions[order]
+        self.generation += 1
+
+        # The first batch comes from the initializer; start the search from
+        # its weighted best instead of adapting to a non-Gaussian sample.
+        if self.generation == 1:
+            self.mean = self.weights @ selected
+            return
+
+        n = self.dim
+        old_mean = self.mean
+        self.mean = self.weights @ selected
+        y_w = (self.mean - old_mean) / self.sigma
+
+        eigval, B = np.linalg.eigh(self.C)
+        D = np.sqrt(np.maximum(eigval, 1e-20))
+        invsqrtC = B @ np.diag(1.0 / D) @ B.T
+
+        self.ps = ((1 - self.cs) * self.ps
+                   + np.sqrt(self.cs * (2 - self.cs) * self.mueff)
+                   * invsqrtC @ y_w)
+        norm_ps = np.linalg.norm(self.ps)
+        hsig = (norm_ps / np.sqrt(1 - (1 - self.cs) ** (2 * self.generation))
+                / self.chiN) < (1.4 + 2 / (n + 1))
+        self.pc = ((1 - self.cc) * self.pc
+                   + hsig * np.sqrt(self.cc * (2 - self.cc) * self.mueff)
+                   * y_w)
+
+        artmp = (selected - old_mean) / self.sigma
+        self.C = ((1 - self.c1 - self.cmu) * self.C
+                  + self.c1 * (np.outer(self.pc, self.pc)
+                               + (1 - hsig) * self.cc * (2 - self.cc)
+                               * self.C)
+                  + self.cmu * artmp.T @ np.diag(self.weights) @ artmp)
+        self.C = (self.C + self.C.T) / 2
+        self.sigma *= np.exp((self.cs / self.damps) * (norm_ps / self.chiN - 1))
+
+
+class DifferentialEvolutionOptimizer(Optimizer):
+    def __init__(self, initial, f, cr):
+        Optimizer.__init__(self, initial.shape[1], initial.shape[0])
+        self.f = f
+        self.cr = cr
+        self.population = np.copy(initial)
+        self.fitness = None
+
+    def Ask(self):
+        if self.fitness is None:
+            return np.copy(self.population)
+        trials = np.copy(self.population)
+        for i in range(self.npop):
+            others = [j for j in range(self.npop) if j != i]
+            a, b, c = np.random.choice(others, 3, replace=False)
+            mutant = (self.population[a]
+                      + self.f * (self.population[b] - self.population[c]))
+            cross = np.random.uniform(0.0, 1.0, self.dim) < self.cr
+            cross[np.random.randint(self.dim)] = True
+            trials[i] = np.where(cross, mutant, self.population[i])
+        return np.clip(trials, 0.0, 1.0)
+
+    def Tell(self, positions, costs):
+        costs = np.asarray(costs, dtype=float)
+        self.UpdateBest(positions, costs)
+        if self.fitness is None:
+            self.population = np.copy(positions)
+            self.fitness = np.copy(costs)
+            return
+        improved = costs <= self.fitness
+        self.population[improved] = positions[improved]
+        self.fitness[improved] = costs[improved]
+
+    # A trial replaces its target only if it is at least as good
+    def PersonalBests(self):
+        if self.fitness is None:
+            return np.repeat(np.finfo(np.float32).max, self.npop)
+        return np.copy(self.fitness)
+
+    def Restart(self, indices):
+        if self.fitness is None:
+            return False
+        for i in indices:
+            self.population[i] = np.random.uniform(0.0, 1.0, self.dim)
+            self.fitness[i] = np.finfo(np.float32).max
+        return True
+
+    def Migrate(self, positions, costs):
+        self.UpdateBest(positions, costs)
+        if self.fitness is None:
+            return
+        worst = np.argsort(self.fitness)[::-1][:len(costs)]
+        for i, pos, cost in zip(worst, positions, costs):
+            if cost < self.fitness[i]:
+                self.population[i] = pos
+                self.fitness[i] = cost
+
+
+class Optimizers:
+    # Problems with running the optimizer on this many candidates, None if
+    # there are none
+    @staticmethod
+    def Check(optparameters, ncandidates):
+        # rand/1 mutates with three candidates other than the target
+        if optparameters.kind == 'de' and ncandidates < 4:
+            return ('optimizer: de needs at least 4 candidates, got {}'
+                    .format(ncandidates))
+        return None
+
+    @staticmethod
+    def Create(optparameters, psoparameters, initial):
+        error = Optimizers.Check(optparameters, initial.shape[0])
+        if error is not None:
+            raise ValueError(error)
+        kind = optparameters.kind
+        if kind == 'pso':
+            return ParticleSwarmOptimizer(initial, psoparameters.w,
+                                          psoparameters.c1, psoparameters.c2)
+        elif kind == 'cmaes':
+            return CMAESOptimizer(initial, optparameters.sigma)
+        elif kind == 'de':
+            return DifferentialEvolutionOptimizer(initial, optparameters.f,
+                                                  optparameters.cr)
+        raise ValueError('Unknown optimizer type: ' + kind)
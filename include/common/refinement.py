@@ -0,0 +1,117 @@
+import numpy as np
+
+
+class RefinementParameters:
+    def __init__(self, root):
+        refinement = root.find('refinement')
+
+        # Off by default: the optimizer runs until it stops
+        self.enabled = False
+        # Iterations without a better global best before refining
+        self.stall = 5
+        # Trust region in normalized units
+        self.radius = 0.05
+        self.min_radius = 0.001
+        self.rounds = 10
+        if refinement is not None:
+            if refinement.find('enabled') is not None:
+                self.enabled = (refinement.find('enabled').text.strip()
+                                .lower() == 'true')
+            if refinement.find('stall') is not None:
+                self.stall = int(refinement.find('stall').text)
+            if refinement.find('radius') is not None:
+                self.radius = float(refinement.find('radius').text)
+            if refinement.find('min_radius') is not None:
+                self.min_radius = float(refinement.find('min_radius').text)
+            if refinement.find('rounds') is not None:
+                self.rounds = int(refinement.find('rounds').text)
+
+
+# Local refinement of the global best over the continuous parameters; the
+# discrete ones stay at the values of the center. Every round polls the
+# center +- radius along each continuous direction, one batch of `size`
+# candidates that runs in parallel like an optimizer batch. Spare slots
+# poll random directions on the same sphere; with fewer slots than poll
+# points a random subset of the directions is polled. The +- pairs give a
+# central difference gradient and curvature, and the minimum of that
+# separable quadratic model within the radius is tried in the next round.
+# The center moves to the best point of a round and the radius doubles;
+# without a better point it halves.
+class TrustRegionSearch:
+    def __init__(self, settings, dimensions, center, cost, size):
+        self.settings = settings
+        self.continuous = [d for d in range(len(dimensions))
+                           if dimensions[d].kind == 'continuous']
+        self.center = np.copy(center)
+        self.cost = cost
+        self.size = size
+        self.radius = settings.radius
+        self.round = 0
+        self.trial = None
+        # Index of the + and - point of every polled direction
+        self.pairs = {}
+
+    def Done(self):
+        return (len(self.continuous) == 0
+                or self.radius < self.settings.min_radius
+                or self.round >= self.settings.rounds)
+
+    def Ask(self):
+        points = []
+        if self.trial is not None:
+            points.append(self.trial)
+        self.pairs = {}
+        for d in np.random.permutation(self.continuous):
+            if len(points) + 2 > self.size:
+                break
+            plus = np.copy(self.center)
+            minus = np.copy(self.center)
+            plus[d] = min(self.center[d] + self.radius, 1.0)
+            minus[d] = max(self.center[d] - self.radius, 0.0)
+            self.pairs[d] = (len(points), len(points) + 1)
+            points += [plus, minus]
+        while len(points) < self.size:
+            direction = np.zeros(len(self.center))
+            direction[self.continuous] = np.random.standard_normal(
+                len(self.continuous))
+            direction /= max(np.linalg.norm(direction), 1e-12)
+            points.append(np.clip(self.center + self.radius * direction,
+                                  0.0, 1.0))
+        return np.array(points)
+
+    def Tell(self, positions, costs):
+        costs = np.asarray(costs, dtype=float)
+        step = np.zeros(len(self.center))
+        for d, (i, j) in self.pairs.items():
+            # Only pairs that were not cut by the bounds are central, and
+            # only scored points (not rejected ones) give a difference
+            h = positions[i][d] - self.center[d]
+            if h <= 0 or not np.isclose(h, self.center[d] - positions[j][d]):
+                continue
+            if not np.isfinite(costs[i]) or not np.isfinite(costs[j]):
+                continue
+            gradient = (costs[i] - costs[j]) / (2 * h)
+            curvature = (costs[i] - 2 * self.cost + costs[j]) / h ** 2
+            if curvature > 0:
+                step[d] = -gradient / curvature
+            else:
+                step[d] = -np.sign(gradient) * self.radius
+        norm = np.linalg.norm(step)
+        if norm > self.radius:
+            step *= self.radius / norm
+        old = self.center
+
+        best = int(np.argmin(costs))
+        if costs[best] < self.cost:
+            self.center = np.copy(positions[best])
+            self.cost = float(costs[best])
+            self.radius = min(2 * self.radius, 0.5)
+        else:
+            self.radius /= 2
+        self.trial = None
+        if norm > 0:
+            trial = np.clip(old + step, 0.0, 1.0)
+            known = np.vstack([positions, self.center])
+            if not np.any(np.all(np.isclose(known, trial), axis=1)):
+                self.trial = trial
+        self.round += 1
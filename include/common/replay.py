@@ -0,0 +1,329 @@
+import re
+import heapq
+import argparse
+import numpy as np
+import xml.etree.ElementTree
+
+from scheduler import RuntimeModel
+
+
+# One recorded simulation
+class ReplayTask:
+    def __init__(self, iteration, candidate, temp_index, duration, failed):
+        self.iteration = iteration
+        self.candidate = candidate
+        self.temp_index = temp_index
+        self.duration = duration
+        self.failed = failed
+
+
+# A finished campaign as recorded in resources.csv (the duration and exit
+# status of every simulation) and optionally data.csv (the densities and
+# cost of every candidate, one row per candidate in swarm order)
+class ReplayTrace:
+    def __init__(self):
+        self.temperatures = []
+        self.iterations = []
+        self.candidates = {}
+        self.tasks = {}
+        self.costs = {}
+        self.densities = {}
+
+    @staticmethod
+    def Read(resources, data=None):
+        trace = ReplayTrace()
+        with open(resources, 'r') as file:
+            header = file.readline().strip().split(',')
+            columns = dict((name, i) for i, name in enumerate(header))
+            for line in file:
+                values = line.strip().split(',')
+                if len(values) < len(header):
+                    continue
+                it = int(values[columns['iteration']])
+                candidate = int(values[columns['candidate']])
+                temp = values[columns['temperature']]
+                if temp not in trace.temperatures:
+                    trace.temperatures.append(temp)
+                task = ReplayTask(it, candidate,
+                                  trace.temperatures.index(temp),
+                                  float(values[columns['wallclock']]),
+                                  int(values[columns['status']]) != 0)
+                trace.tasks.setdefault((it, candidate), []).append(task)
+                trace.Add(it, candidate)
+        if data is not None:
+            trace.ReadData(data)
+        trace.iterations.sort()
+        for it in trace.iterations:
+            trace.candidates[it].sort()
+        return trace
+
+    def Add(self, it, candidate):
+        if it not in self.candidates:
+            self.iterations.append(it)
+            self.candidates[it] = []
+        if candidate not in self.candidates[it]:
+            self.candidates[it].append(candidate)
+
+    # The fields of data.csv are it, [pos], [pars], [dens], [vel],
+    # [best_pos], cost; candidates that were not simulated (reweighted)
+    # only appear here
+    def ReadData(self, filename):
+        counts = {}
+        with open(filename, 'r') as file:
+            for line in file:
+                fields = re.findall(r'\[[^\]]*\]|[^,\[\]]+', line.strip())
+                fields = [f for f in fields if f.strip() != '']
+                if len(fields) < 7:
+                    continue
+                it = int(fields[0])
+                candidate = counts.get(it, 0)
+                counts[it] = candidate + 1
+                self.densities[(it, candidate)] = np.array(
+                    fields[3].strip('[]').split(), dtype=float)
+                self.costs[(it, candidate)] = float(fields[-1])
+                self.Add(it, candidate)
+
+    # First candidate, in the order of the campaign, with the best cost
+    def Best(self):
+        if len(self.costs) == 0:
+            return None
+        best = min(self.costs.values())
+        for it in self.iterations:
+            for candidate in self.candidates[it]:
+                if self.costs.get((it, candidate)) == best:
+                    return (it, candidate)
+        return None
+
+
+# Discrete-event replay of a trace on `ranks` ranks. Every policy runs the
+# recorded simulations with their recorded durations; failed simulations
+# take their time like any other. The positions the optimizer would have
+# proposed under a different policy are not known, so every policy replays
+# the same candidates.
+class ReplaySimulator:
+    def __init__(self, trace, ranks, targets=None, stage=None):
+        self.trace = trace
+        self.ranks = ranks
+        self.targets = targets
+        self.stage = stage
+        self.ntemps = len(trace.temperatures)
+
+    # Greedy list scheduling of `tasks` in the given order, each on the
+    # rank that is free first; returns the finish time of every task and
+    # updates the free times `free` and the work `busy` of the ranks
+    @staticmethod
+    def Dispatch(tasks, free, busy):
+        heap = [(free[r], r) for r in range(len(free))]
+        heapq.heapify(heap)
+        finish = []
+        for task in tasks:
+            time, r = heapq.heappop(heap)
+            time += task.duration
+            busy[r] += task.duration
+            free[r] = time
+            finish.append(time)
+            heapq.heappush(heap, (time, r))
+        return finish
+
+    # Same cost as Utility.CostFunction: weighted relative errors and their
+    # slopes over the temperatures
+    def Cost(self, densities):
+        temps = [float(t) for t in self.trace.temperatures]
+        errors = [abs(d - t) / t for d, t in zip(densities, self.targets)]
+        slopes = sum((errors[i + 1] - errors[i]) / (temps[i + 1] - temps[i])
+                     for i in range(len(errors) - 1))
+        return 0.91 * np.sum(errors) + 0.09 * slopes
+
+    # As Utility.GetCostBound
+    def Bound(self, densities, indices):
+        filled = list(self.targets)
+        for i in indices:
+            filled[i] = densities[i]
+        for i in range(self.ntemps):
+            if i not in indices:
+                worse = list(self.targets)
+                worse[i] = 2 * self.targets[i]
+                if self.Cost(worse) < 0:
+                    return -np.inf
+        return self.Cost(filled)
+
+    # Synchronous iterations: all simulations of an iteration, then a
+    # barrier. static keeps the swarm order, predictive places the longest
+    # predicted first (temperature-only RuntimeModel learned from the
+    # earlier iterations), staged runs `stage` first and the remaining
+    # temperatures only for the candidates that can beat their best.
+    def Synchronous(self, policy):
+        model = RuntimeModel(self.ntemps, 1.0)
+        free = np.zeros(self.ranks)
+        busy = np.zeros(self.ranks)
+        done = {}
+        personal = {}
+        rejected = 0
+        now = 0.0
+        for it in self.trace.iterations:
+            candidates = self.trace.candidates[it]
+            tasks = [task for c in candidates
+                     for task in self.trace.tasks.get((it, c), [])]
+            rounds = [tasks]
+            if policy == 'staged':
+                rounds = [[t for t in tasks if t.temp_index in self.stage]]
+            for k in range(2 if policy == 'staged' else 1):
+                if k == 1:
+                    survivors = []
+                    for c in candidates:
+                        dens = self.trace.densities.get((it, c))
+                        if (dens is None or self.Bound(dens, self.stage)
+                                < personal.get(c, np.inf)):
+                            survivors.append(c)
+                        elif len(self.trace.tasks.get((it, c), [])) > 0:
+                            rejected += 1
+                    rounds.append([t for t in tasks if t.candidate in survivors
+                                   and t.temp_index not in self.stage])
+                work = rounds[k]
+                if policy != 'static':
+                    order = np.argsort(
+                        [model.Predict(t.temp_index, np.zeros(0))
+                         for t in work], kind='stable')[::-1]
+                    work = [work[i] for i in order]
+                free[:] = now
+                finish = ReplaySimulator.Dispatch(work, free, busy)
+                now = max([now] + finish)
+                for t in work:
+                    model.Record(t.temp_index, np.zeros(0), t.duration)
+            for c in candidates:
+                done[(it, c)] = now
+                cost = self.trace.costs.get((it, c))
+                if cost is not None:
+                    personal[c] = min(personal.get(c, np.inf), cost)
+        return now, busy, done, rejected
+
+    # Asynchronous queue: no barrier; a candidate's next position only
+    # waits for its own last evaluation. Ranks take the earliest ready
+    # simulation.
+    def Asynchronous(self):
+        busy = np.zeros(self.ranks)
+        done = {}
+        # Iterations of every candidate slot, released one at a time
+        chain = {}
+        for it in self.trace.iterations:
+            for c in self.trace.candidates[it]:
+                chain.setdefault(c, []).append(it)
+        pending = dict((c, 0) for c in chain)
+        remaining = {}
+        # (time the simulation can start, iteration, order, task)
+        queue = []
+        order = 0
+
+        def Release(c, time):
+            nonlocal order
+            while pending[c] < len(chain[c]):
+                it = chain[c][pending[c]]
+                pending[c] += 1
+                tasks = self.trace.tasks.get((it, c), [])
+                if len(tasks) == 0:
+                    done[(it, c)] = time
+                    continue
+                remaining[(it, c)] = len(tasks)
+                for task in tasks:
+                    heapq.heappush(queue, (time, it, order, task))
+                    order += 1
+                return
+
+        for c in chain:
+            Release(c, 0.0)
+        ranks = [(0.0, r) for r in range(self.ranks)]
+        heapq.heapify(ranks)
+        now = 0.0
+        while len(queue) > 0:
+            start, it, _, task = heapq.heappop(queue)
+            free, r = heapq.heappop(ranks)
+            finish = max(start, free) + task.duration
+            busy[r] += task.duration
+            heapq.heappush(ranks, (finish, r))
+            now = max(now, finish)
+            key = (task.iteration, task.candidate)
+            remaining[key] -= 1
+            done[key] = max(done.get(key, 0.0), finish)
+            if remaining[key] == 0:
+                Release(task.candidate, done[key])
+        return now, busy, done, 0
+
+    def Run(self, policy):
+        if policy == 'async':
+            makespan, busy, done, rejected = self.Asynchronous()
+        else:
+            makespan, busy, done, rejected = self.Synchronous(policy)
+        best = self.trace.Best()
+        result = {'policy': policy,
+                  'ranks': self.ranks,
+                  'makespan': makespan,
+                  'utilization': (np.sum(busy) / (self.ranks * makespan)
+                                  if makespan > 0 else 0.0),
+                  'time_to_best': done.get(best, float('nan')),
+                  'rejected': rejected,
+                  'failed_seconds': sum(t.duration
+                                        for tasks in self.trace.tasks.values()
+                                        for t in tasks if t.failed)}
+        return result
+
+
+# Target densities of par.xml in the order of the trace's temperatures;
+# prebuilt configurations give <expt_dens>, automated ones <expt_liq>
+def ReadTargets(filename, temperatures):
+    root = xml.etree.ElementTree.parse(filename).getroot()
+    targets = {}
+    for temp in root.find('data').findall('temperature'):
+        name = temp.find('temp').text.strip()
+        target = temp.find('expt_dens')
+        if target is None:
+            target = temp.find('expt_liq')
+        if target is None:
+            raise ValueError('{}: temperature {} has neither <expt_dens> nor '
+                             '<expt_liq>'.format(filename, name))
+        targets[name] = float(target.text)
+    return [targets[t] for t in temperatures]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Replay a recorded campaign under other scheduling '
+                    'policies and rank counts')
+    parser.add_argument('resources', help='resources.csv of the campaign')
+    parser.add_argument('--data', default=None,
+                        help='data.csv of the campaign, for the time to best '
+                             'and the staged policy')
+    parser.add_argument('--config', default=None,
+                        help='par.xml, for the target densities of the '
+                             'staged policy')
+    parser.add_argument('--ranks', type=int, nargs='+', required=True,
+                        help='rank counts to replay')
+    parser.add_argument('--policies', nargs='+',
+                        default=['static', 'predictive', 'async'],
+                        choices=['static', 'predictive', 'async', 'staged'])
+    parser.add_argument('--stage', nargs='+', default=None,
+                        help='temperatures of the first stage (staged)')
+    args = parser.parse_args()
+
+    trace = ReplayTrace.Read(args.resources, args.data)
+    targets = None
+    stage = None
+    if 'staged' in args.policies:
+        if args.data is None or args.config is None or args.stage is None:
+            parser.error('staged needs --data, --config and --stage')
+        try:
+            targets = ReadTargets(args.config, trace.temperatures)
+        except ValueError as err:
+            parser.error(str(err))
+        stage = [trace.temperatures.index(t) for t in args.stage]
+
+    print('%-11s %6s %12s %12s %14s %9s' % (
+        'policy', 'ranks', 'makespan s', 'utilization', 'time to best s',
+        'rejected'))
+    for ranks in args.ranks:
+        for policy in args.policies:
+            result = ReplaySimulator(trace, ranks, targets, stage).Run(policy)
+            print('%-11s %6d %12.1f %12.3f %14.1f %9d' % (
+                policy, ranks, result['makespan'], result['utilization'],
+                result['time_to_best'], result['rejected']))
+    print('Failed simulations took %.1f s of rank time' %
+          result['failed_seconds'])
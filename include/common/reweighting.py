@@ -0,0 +1,343 @@
+import os
+import glob
+import numpy as np
+
+
+class ReweightingParameters:
+    def __init__(self, root):
+        rew = root.find('reweighting')
+
+        # epsilon, sigma and the Mie exponents are either the name of a
+        # searched parameter or a fixed number
+        self.enabled = False
+        self.epsilon = 'epsilon'
+        self.sigma = 'sigma'
+        self.repulsive = '12'
+        self.attractive = '6'
+        self.atomtype = None
+        self.min_samples = 50.0
+        self.states = 10
+        self.start_iteration = 1
+        self.discard = 0.2
+        if rew is not None:
+            if rew.find('enabled') is not None:
+                self.enabled = rew.find('enabled').text.strip().lower() == 'true'
+            for tag in ['epsilon', 'sigma', 'repulsive', 'attractive',
+                        'atomtype']:
+                if rew.find(tag) is not None:
+                    setattr(self, tag, rew.find(tag).text.strip())
+            if rew.find('min_samples') is not None:
+                self.min_samples = float(rew.find('min_samples').text)
+            if rew.find('states') is not None:
+                self.states = int(rew.find('states').text)
+            if rew.find('start_iteration') is not None:
+                self.start_iteration = int(rew.find('start_iteration').text)
+            if rew.find('discard') is not None:
+                self.discard = float(rew.find('discard').text)
+
+
+# Every finished simulation stores, for each saved frame of its GOMC
+# trajectory, the sums of r^-k over the interacting site pairs. For a
+# single Mie site type the nonbonded energy of a frame at any
+# (epsilon, sigma, n, m) is then
+#   U = C(n, m) * epsilon * (sigma^n * S_n - sigma^m * S_m) + tail
+# so the frames of earlier simulations can be reweighted with MBAR to a
+# new parameter set without running GOMC.
+class Reweighting:
+    SAMPLE_FILE = 'reweight.npz'
+    # g/mol/A^3 to kg/m^3, the unit of GOMC's TOT_DENSITY
+    DENSITY = 1660.5390666
+
+    # First value of every GOMC keyword in a config file
+    @staticmethod
+    def ReadConf(filename):
+        conf = {}
+        with open(filename, 'r') as file:
+            for line in file:
+                columns = line.split('#')[0].split()
+                if len(columns) >= 2 and columns[0].lower() not in conf:
+                    conf[columns[0].lower()] = columns[1:]
+        return conf
+
+    @staticmethod
+    def ReadPSF(filename):
+        types = []
+        masses = []
+        bonds = []
+        with open(filename, 'r') as file:
+            lines = iter(file.readlines())
+        for line in lines:
+            if '!NATOM' in line:
+                for _ in range(int(line.split()[0])):
+                    columns = next(lines).split()
+                    types.append(columns[5])
+                    masses.append(float(columns[7]))
+            elif '!NBOND' in line:
+                count = int(line.split()[0])
+                while len(bonds) < count:
+                    values = [int(v) for v in next(lines).split()]
+                    bonds += [(values[i] - 1, values[i + 1] - 1)
+                              for i in range(0, len(values) - 1, 2)]
+                break
+        return (np.array(types), np.array(masses),
+                np.array(bonds, dtype=int).reshape(-1, 2))
+
+    # Pairs of atoms at most `depth` bonds apart (GOMC's Exclude 1-2,
+    # 1-3 or 1-4 gives a depth of 1, 2 or 3)
+    @staticmethod
+    def ExcludedPairs(natom, bonds, depth):
+        neighbors = [[] for _ in range(natom)]
+        for a, b in bonds:
+            neighbors[a].append(b)
+            neighbors[b].append(a)
+        pairs = []
+        for atom in range(natom):
+            seen = {atom}
+            shell = [atom]
+            for _ in range(depth):
+                shell = [n for a in shell for n in neighbors[a] if n not in seen]
+                seen.update(shell)
+            pairs += [(atom, other) for other in seen if other > atom]
+        return np.array(pairs, dtype=int).reshape(-1, 2)
+
+    # Frames of a GOMC PDB trajectory as (box lengths, coordinates)
+    @staticmethod
+    def ReadTrajectory(filename):
+        frames = []
+        box = None
+        coords = []
+        with open(filename, 'r') as file:
+            for line in file:
+                if line.startswith('CRYST1'):
+                    box = np.array([line[6:15], line[15:24], line[24:33]],
+                                   dtype=float)
+                elif line.startswith('ATOM') or line.startswith('HETATM'):
+                    coords.append((line[30:38], line[38:46], line[46:54]))
+                elif line.startswith('END'):
+                    if box is not None and len(coords) > 0:
+                        frames.append((box, np.array(coords, dtype=float)))
+                    coords = []
+        return frames
+
+    # Sums of r^-k over the pairs within the cutoff, minimum image,
+    # without the excluded intramolecular pairs
+    @staticmethod
+    def PairSums(coords, box, rcut, exponents, excluded):
+        sums = np.zeros(len(exponents))
+        count = 0
+        natom = len(coords)
+        block = 512
+        for start in range(0, natom, block):
+            stop = min(start + block, natom)
+            diff = coords[start:stop, np.newaxis, :] - coords[np.newaxis,
+                                                              start:, :]
+            diff -= box * np.round(diff / box)
+            r2 = np.sum(diff ** 2, axis=2)
+            upper = (np.arange(start, natom)[np.newaxis, :]
+                     > np.arange(start, stop)[:, np.newaxis])
+            r2 = r2[upper & (r2 < rcut * rcut)]
+            count += len(r2)
+            for e, k in enumerate(exponents):
+                sums[e] += np.sum(r2 ** (-0.5 * k))
+        if len(excluded) > 0:
+            diff = coords[excluded[:, 0]] - coords[excluded[:, 1]]
+            diff -= box * np.round(diff / box)
+            r2 = np.sum(diff ** 2, axis=1)
+            r2 = r2[r2 < rcut * rcut]
+            count -= len(r2)
+            for e, k in enumerate(exponents):
+                sums[e] -= np.sum(r2 ** (-0.5 * k))
+        return sums, count
+
+    # Exponents whose sums are stored: every value a discrete exponent
+    # parameter can take, or the fixed exponent
+    @staticmethod
+    def Exponents(settings, dimensions):
+        exponents = set()
+        for spec in [settings.repulsive, settings.attractive]:
+            found = False
+            for dim in dimensions:
+                if dim.name == spec:
+                    exponents.update(range(int(dim.start), int(dim.end) + 1))
+                    found = True
+            if not found:
+                exponents.add(int(float(spec)))
+        return sorted(exponents)
+
+    # Called by the rank that ran the simulation in `folder`. Returns None
+    # on success, otherwise the reason the frames could not be stored.
+    @staticmethod
+    def Store(folder, settings, dimensions, particle, temperature):
+        try:
+            conf = Reweighting.ReadConf(os.path.join(folder, 'in.conf'))
+            potential = conf.get('potential', ['VDW'])[0].upper()
+            if potential not in ['VDW', 'SHIFT']:
+                return 'Potential {} is not supported'.format(potential)
+            if conf.get('coordinatesfreq', ['false'])[0].lower() != 'true':
+                return 'CoordinatesFreq is not enabled in in.conf'
+            rcut = float(conf['rcut'][0])
+            lrc = (potential == 'VDW'
+                   and conf.get('lrc', ['true'])[0].lower() == 'true')
+            depth = int(conf.get('exclude', ['1-4'])[0].split('-')[-1]) - 1
+            structure = conf['structure'][-1]
+            trajectory = conf['outputname'][0] + '_BOX_0.pdb'
+
+            types, masses, bonds = Reweighting.ReadPSF(
+                os.path.join(folder, structure))
+            frames = Reweighting.ReadTrajectory(
+                os.path.join(folder, trajectory))
+        except (IOError, KeyError, ValueError, IndexError) as err:
+            return 'Cannot read the simulation output: {}'.format(err)
+
+        frames = frames[int(len(frames) * settings.discard):]
+        if len(frames) == 0:
+            return 'No frames in ' + trajectory
+
+        # Only the sites carrying the searched parameters contribute
+        sites = np.where(types == settings.atomtype)[0]
+        excluded = Reweighting.ExcludedPairs(len(types), bonds, depth)
+        index = np.full(len(types), -1)
+        index[sites] = np.arange(len(sites))
+        excluded = index[excluded]
+        excluded = excluded[np.all(excluded >= 0, axis=1)]
+
+        exponents = Reweighting.Exponents(settings, dimensions)
+        volume = []
+        sums = []
+        pairs = []
+        for box, coords in frames:
+            if len(coords) != len(types):
+                return '{} atoms in {} but {} in {}'.format(
+                    len(coords), trajectory, len(types), structure)
+            s, count = Reweighting.PairSums(coords[sites], box, rcut,
+                                            exponents, excluded)
+            volume.append(np.prod(box))
+            sums.append(s)
+            pairs.append(count)
+        volume = np.array(volume)
+        np.savez(os.path.join(folder, Reweighting.SAMPLE_FILE),
+                 names=np.array([dim.name for dim in dimensions]),
+                 pars=np.asarray(particle.pars, dtype=float),
+                 pos=np.asarray(particle.pos, dtype=float),
+                 temperature=str(temperature),
+                 volume=volume,
+                 density=Reweighting.DENSITY * np.sum(masses) / volume,
+                 exponents=np.array(exponents), sums=np.array(sums),
+                 pairs=np.array(pairs), nsites=len(sites), rcut=rcut,
+                 lrc=lrc, shift=potential == 'SHIFT')
+        return None
+
+    @staticmethod
+    def LogSumExp(values, axis):
+        top = np.max(values, axis=axis, keepdims=True)
+        return (np.squeeze(top, axis=axis)
+                + np.log(np.sum(np.exp(values - top), axis=axis)))
+
+    # Dimensionless free energies of K states from the reduced energies
+    # u_kn of all N pooled samples at every state (self-consistent MBAR
+    # equations of Shirts and Chodera, 2008)
+    @staticmethod
+    def MBAR(u_kn, N_k, tolerance=1e-8, max_iterations=10000):
+        log_N = np.log(np.asarray(N_k, dtype=float))
+        f_k = np.zeros(len(N_k))
+        for _ in range(max_iterations):
+            log_denominator = Reweighting.LogSumExp(
+                log_N[:, np.newaxis] + f_k[:, np.newaxis] - u_kn, axis=0)
+            f_new = -Reweighting.LogSumExp(-u_kn - log_denominator, axis=1)
+            f_new -= f_new[0]
+            if np.max(np.abs(f_new - f_k)) < tolerance:
+                return f_new
+            f_k = f_new
+        return f_k
+
+
+# Estimates <rho> at a new parameter set from the stored frames of the
+# nearest simulated parameter sets at the same temperature (rank 0)
+class ReweightingEstimator:
+    def __init__(self, settings, dimensions):
+        self.settings = settings
+        self.names = [dim.name for dim in dimensions]
+        self.samples = {}
+        # Every other searched dimension must match a stored state exactly
+        specs = [settings.epsilon, settings.sigma, settings.repulsive,
+                 settings.attractive]
+        self.fixed = [i for i, name in enumerate(self.names)
+                      if name not in specs]
+
+    def Load(self, pattern='runs/it*/run*/**/' + Reweighting.SAMPLE_FILE):
+        for filename in glob.glob(pattern, recursive=True):
+            if filename in self.samples:
+                continue
+            try:
+                with np.load(filename) as data:
+                    sample = dict((key, data[key]) for key in data.files)
+            except (IOError, ValueError):
+                continue
+            if list(sample['names']) != self.names:
+                continue
+            sample['temperature'] = str(sample['temperature'])
+            self.samples[filename] = sample
+
+    def Value(self, spec, pars):
+        if spec in self.names:
+            return float(pars[self.names.index(spec)])
+        return float(spec)
+
+    # Reduced energies (divided by kT, epsilon in K) of the frames of one
+    # sample at a parameter set
+    def Energies(self, sample, pars, temperature):
+        epsilon = self.Value(self.settings.epsilon, pars)
+        sigma = self.Value(self.settings.sigma, pars)
+        n = int(round(self.Value(self.settings.repulsive, pars)))
+        m = int(round(self.Value(self.settings.attractive, pars)))
+        exponents = list(sample['exponents'])
+        C = (n / (n - m)) * (n / m) ** (m / (n - m))
+        energy = C * epsilon * (sigma ** n * sample['sums'][:, exponents.index(n)]
+                                - sigma ** m * sample['sums'][:, exponents.index(m)])
+        rcut = float(sample['rcut'])
+        if bool(sample['shift']):
+            energy -= (C * epsilon * ((sigma / rcut) ** n - (sigma / rcut) ** m)
+                       * sample['pairs'])
+        if bool(sample['lrc']):
+            N = float(sample['nsites'])
+            energy += (2.0 * np.pi * N * N / sample['volume'] * C * epsilon
+                       * sigma ** 3 * ((sigma / rcut) ** (n - 3) / (n - 3)
+                                       - (sigma / rcut) ** (m - 3) / (m - 3)))
+        return energy / float(temperature)
+
+    # Return (density, effective number of samples), or None if no stored
+    # state can be reweighted to pars or the overlap is too small
+    def Estimate(self, pos, pars, temperature):
+        states = []
+        for sample in self.samples.values():
+            if sample['temperature'] != str(temperature):
+                continue
+            if not np.allclose(sample['pars'][self.fixed],
+                               np.asarray(pars)[self.fixed]):
+                continue
+            states.append((np.sum((sample['pos'] - pos) ** 2), sample))
+        if len(states) == 0:
+            return None
+        states.sort(key=lambda state: state[0])
+        states = [sample for _, sample in states[:self.settings.states]]
+
+        N_k = [len(sample['volume']) for sample in states]
+        u_kn = np.array([np.concatenate([self.Energies(sample, state['pars'],
+                                                       temperature)
+                                         for sample in states])
+                         for state in states])
+        u_n = np.concatenate([self.Energies(sample, pars, temperature)
+                              for sample in states])
+        density = np.concatenate([sample['density'] for sample in states])
+
+        f_k = Reweighting.MBAR(u_kn, N_k)
+        log_denominator = Reweighting.LogSumExp(
+            np.log(np.asarray(N_k, dtype=float))[:, np.newaxis]
+            + f_k[:, np.newaxis] - u_kn, axis=0)
+        log_w = -u_n - log_denominator
+        w = np.exp(log_w - np.max(log_w))
+        w /= np.sum(w)
+        effective = 1.0 / np.sum(w ** 2)
+        if effective < self.settings.min_samples:
+            return None
+        return float(np.sum(w * density)), float(effective)
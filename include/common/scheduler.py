@@ -0,0 +1,200 @@
+import heapq
+import numpy as np
+
+
+class SchedulerParameters:
+    def __init__(self, root):
+        sched = root.find('scheduler')
+
+        # static: one simulation per rank, rank -> (particle, temperature)
+        # predictive: simulations packed on the ranks by predicted runtime
+        self.policy = 'static'
+        self.ridge = 1.0
+        # Temperatures simulated first; the others only run for candidates
+        # whose cost bound can still beat their personal best
+        self.stage = None
+        if sched is not None:
+            if sched.find('policy') is not None:
+                self.policy = sched.find('policy').text.strip().lower()
+            if sched.find('ridge') is not None:
+                self.ridge = float(sched.find('ridge').text)
+            if sched.find('stage') is not None:
+                self.stage = sched.find('stage').text.split()
+
+
+# log(wallclock) of a simulation as a linear function of its temperature
+# (one-hot) and its normalized position, fitted by ridge regression on the
+# runtimes recorded in earlier iterations
+class RuntimeModel:
+    def __init__(self, ntemps, ridge):
+        self.ntemps = ntemps
+        self.ridge = ridge
+        self.features = []
+        self.runtimes = []
+        self.weights = None
+
+    def Features(self, temp_index, pos):
+        onehot = np.zeros(self.ntemps)
+        onehot[temp_index] = 1.0
+        return np.concatenate([onehot, pos])
+
+    def Record(self, temp_index, pos, runtime):
+        if runtime > 0:
+            self.features.append(self.Features(temp_index, pos))
+            self.runtimes.append(np.log(runtime))
+            self.weights = None
+
+    def Fit(self):
+        X = np.array(self.features)
+        y = np.array(self.runtimes)
+        self.mean = np.mean(y)
+        self.weights = np.linalg.solve(
+            X.T @ X + self.ridge * np.eye(X.shape[1]),
+            X.T @ (y - self.mean))
+
+    # Predicted seconds; every simulation is alike until one was recorded
+    def Predict(self, temp_index, pos):
+        if len(self.runtimes) == 0:
+            return 1.0
+        if self.weights is None:
+            self.Fit()
+        return float(np.exp(self.mean + self.Features(temp_index, pos)
+                            @ self.weights))
+
+
+# Runs the simulations of an iteration on any number of ranks. The longest
+# predicted simulations are placed first, each on the rank with the least
+# predicted work so far, so the short ones fill the gaps at the end.
+class TaskScheduler:
+    # temperatures: the temperature of every slot of a particle group
+    # offset: campaign index of the first swarm slot, for the run folders
+    def __init__(self, settings, temperatures, offset=0):
+        self.ntemps = len(temperatures)
+        self.offset = offset
+        self.model = RuntimeModel(self.ntemps, settings.ridge)
+        self.stage = None
+        if settings.stage is not None:
+            temperatures = [temp.strip() for temp in temperatures]
+            self.stage = [temperatures.index(temp) for temp in settings.stage]
+
+    # Longest processing time first; returns the task indices of every
+    # rank in the order they run and the predicted work of every rank
+    @staticmethod
+    def Pack(predictions, nranks):
+        order = np.argsort(predictions, kind='stable')[::-1]
+        lists = [[] for _ in range(nranks)]
+        loads = np.zeros(nranks)
+        heap = [(0.0, r) for r in range(nranks)]
+        for task in order:
+            load, r = heapq.heappop(heap)
+            lists[r].append(int(task))
+            loads[r] = load + predictions[task]
+            heapq.heappush(heap, (loads[r], r))
+        return lists, loads
+
+    # Swarm slots `tasks` to simulate on every rank, with the predicted
+    # makespan of the plan and of a round robin assignment in swarm order
+    def Plan(self, swarm, tasks, nranks):
+        predictions = np.array([self.model.Predict(i % self.ntemps,
+                                                   swarm[i].pos)
+                                for i in tasks])
+        lists, loads = TaskScheduler.Pack(predictions, nranks)
+        robin = np.zeros(nranks)
+        for k in range(len(tasks)):
+            robin[k % nranks] += predictions[k]
+        plan = [[tasks[k] for k in tasks_of_rank] for tasks_of_rank in lists]
+        return plan, np.max(loads), np.max(robin)
+
+    # Collective: runs the simulations of the swarm slots `tasks` (given on
+    # rank 0) and puts the evaluated particles back in the swarm. Returns
+    # the simulation time of every rank and the predicted makespans.
+    def Run(self, comm, swarm, tasks, it):
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+        chunks = None
+        if rank == 0:
+            plan, predicted, robin = self.Plan(swarm, tasks, size)
+            chunks = [[(i, swarm[i]) for i in plan[r]] for r in range(size)]
+        work = comm.scatter(chunks, root=0)
+        for i, particle in work:
+            particle.Run(it, self.offset + i)
+        done = comm.gather(work, root=0)
+
+        if rank != 0:
+            return None, None
+        for work in done:
+            for i, particle in work:
+                swarm[i] = particle
+                self.model.Record(i % self.ntemps, particle.pos,
+                                  particle.runtime)
+        busy = np.array([sum(particle.runtime for _, particle in work)
+                         for work in done])
+        return busy, np.array([predicted, robin])
+
+    # Collective replacement of scatter/Evaluate/gather. swarm is only
+    # given on rank 0, with `references`, the cost each candidate group
+    # has to beat (Campaign.References(); replicates need none). Returns
+    # the evaluated swarm, the simulation time of every rank, the
+    # predicted makespans and the number of candidates rejected after
+    # the first stage on rank 0.
+    def Evaluate(self, comm, swarm, it, references=None):
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+        chunks = None
+        candidates = []
+        if rank == 0:
+            for particle in swarm:
+                if particle.reweighted:
+                    particle.runtime = 0.0
+                    particle.returncode = 0
+                    particle.usage = None
+            candidates = [i for i in range(0, len(swarm), self.ntemps)
+                          if not swarm[i].reweighted]
+            chunks = [[(i, swarm[i]) for i in candidates[r::size]]
+                      for r in range(size)]
+        prepare = comm.scatter(chunks, root=0)
+
+        # The run files of every candidate are written before any of its
+        # simulations starts
+        for i, particle in prepare:
+            particle.Prepare(it, self.offset + i)
+        comm.barrier()
+
+        rejected = 0
+        if self.stage is None:
+            tasks = [c + t for c in candidates for t in range(self.ntemps)]
+            busy, makespans = self.Run(comm, swarm, tasks, it)
+        else:
+            tasks = [c + t for c in candidates for t in self.stage]
+            busy, makespans = self.Run(comm, swarm, tasks, it)
+            # Candidates that cannot beat the optimizer's reference keep
+            # the bound as their cost; replicates always run in full
+            survivors = []
+            if rank == 0:
+                for c in candidates:
+                    bound = swarm[c].Bound(it, self.offset + c, self.stage)
+                    if (swarm[c].replicate
+                            or bound < references[c // self.ntemps]):
+                        survivors.append(c)
+                    else:
+                        rejected += 1
+                        for t in range(self.ntemps):
+                            if t not in self.stage:
+                                swarm[c + t].runtime = 0.0
+                                swarm[c + t].returncode = 0
+                                swarm[c + t].usage = None
+                candidates = survivors
+            tasks = [c + t for c in candidates for t in range(self.ntemps)
+                     if t not in self.stage]
+            second, predicted = self.Run(comm, swarm, tasks, it)
+            if rank == 0:
+                busy += second
+                makespans += predicted
+
+        if rank != 0:
+            return None, None, None, None
+        for c in candidates:
+            swarm[c].Score(it, self.offset + c)
+        for particle in swarm:
+            particle.UpdateBestPosition()
+        return swarm, busy, makespans, rejected
@@ -0,0 +1,362 @@
+import os
+
+from initializer import Initializer
+
+
+class ConfigurationError(Exception):
+    pass
+
+
+# Collects every problem found in par.xml so they can be reported at once
+# instead of failing on the first missing tag.
+class Validator:
+    def __init__(self):
+        self.errors = []
+
+    def Require(self, element, path, kind=str, attribute=None, context=''):
+        node = None
+        if element is not None:
+            node = element.find(path)
+        if node is None or node.text is None or node.text.strip() == '':
+            self.errors.append('{}missing <{}>'.format(context, path))
+            return None
+        value = node.text.strip()
+        try:
+            value = kind(value)
+        except ValueError:
+            self.errors.append('{}<{}> is not a valid {}: {}'.format(
+                context, path, kind.__name__, value))
+            return None
+        if attribute is not None and node.get(attribute) is None:
+            self.errors.append('{}<{}> is missing the {} attribute'.format(
+                context, path, attribute))
+        return value
+
+    def Optional(self, element, path, kind=str, context=''):
+        if element is None or element.find(path) is None:
+            return None
+        return self.Require(element, path, kind, context=context)
+
+    def Choice(self, element, path, choices, context=''):
+        value = self.Optional(element, path, context=context)
+        if value is not None and value.lower() not in choices:
+            self.errors.append('{}<{}> must be one of {}: {}'.format(
+                context, path, ', '.join(choices), value))
+        return value
+
+    def Check(self, condition, message):
+        if not condition:
+            self.errors.append(message)
+
+    def ValidateParameters(self, root, extra=()):
+        parameters = root.find('parameters')
+        if parameters is None or len(parameters.findall('parameter')) == 0:
+            self.errors.append('missing <parameters> with at least one '
+                               '<parameter>')
+            return
+        for i, par in enumerate(parameters.findall('parameter')):
+            context = 'parameter {}: '.format(i + 1)
+            self.Require(par, 'name', context=context)
+            self.Require(par, 'pattern', context=context)
+            kind = self.Require(par, 'kind', context=context)
+            if kind is not None:
+                self.Check(kind in ['continuous', 'discrete'],
+                           context + '<kind> must be continuous or discrete')
+            start = self.Require(par, 'start', float, context=context)
+            end = self.Require(par, 'end', float, context=context)
+            if start is not None and end is not None:
+                self.Check(start < end, context + '<start> must be < <end>')
+            for tag, kind in extra:
+                self.Require(par, tag, kind, context=context)
+
+    def ValidateSearch(self, root):
+        optimizer = root.find('optimizer')
+        kind = self.Choice(optimizer, 'type', ['pso', 'cmaes', 'de'],
+                           'optimizer: ')
+        for tag in ['sigma', 'f', 'cr']:
+            self.Optional(optimizer, tag, float, 'optimizer: ')
+        if kind is None or kind.lower() == 'pso':
+            for tag in ['w', 'c1', 'c2']:
+                self.Require(root.find('pso'), tag, float, context='pso: ')
+
+        convergence = root.find('convergence')
+        for tag in ['max_iterations', 'patience', 'restart']:
+            self.Optional(convergence, tag, int, 'convergence: ')
+        for tag in ['diameter', 'target_cost']:
+            self.Optional(convergence, tag, float, 'convergence: ')
+
+        init = root.find('initialization')
+        method = self.Choice(init, 'method',
+                             ['uniform', 'sobol', 'lhs', 'reference'],
+                             'initialization: ')
+        self.Optional(init, 'spread', float, 'initialization: ')
+        filename = self.Optional(init, 'import', context='initialization: ')
+        if filename is not None:
+            self.Check(os.path.isfile(filename),
+                       'initialization: import file not found: ' + filename)
+        if method is not None and method.lower() == 'sobol':
+            # Independent charges are searched along with the parameters
+            dim = len(root.findall('parameters/parameter'))
+            dim += len([ch for ch in root.findall('charges/charge')
+                        if (ch.findtext('dependent') or '').strip()
+                        != 'true'])
+            self.Check(dim <= Initializer.SOBOL_MAX_DIM,
+                       'initialization: sobol supports at most {} searched '
+                       'parameters, got {}'.format(Initializer.SOBOL_MAX_DIM,
+                                                    dim))
+        if method is not None and method.lower() == 'reference':
+            for i, par in enumerate(root.find('parameters')
+                                    .findall('parameter')):
+                self.Require(par, 'reference', float,
+                             context='parameter {}: '.format(i + 1))
+
+    def ValidateMetrics(self, root):
+        metrics = root.find('metrics')
+        self.Choice(metrics, 'enabled', ['true', 'false'], 'metrics: ')
+        self.Optional(metrics, 'file', context='metrics: ')
+        self.Optional(metrics, 'address', context='metrics: ')
+        interval = self.Optional(metrics, 'interval', float, 'metrics: ')
+        if interval is not None:
+            self.Check(interval > 0, 'metrics: <interval> must be > 0')
+        port = self.Optional(metrics, 'port', int, 'metrics: ')
+        if port is not None:
+            self.Check(0 < port < 65536,
+                       'metrics: <port> must be between 1 and 65535')
+
+    def ValidateAccounting(self, root):
+        accounting = root.find('accounting')
+        self.Choice(accounting, 'enabled', ['true', 'false'], 'accounting: ')
+        self.Optional(accounting, 'file', context='accounting: ')
+        self.Optional(accounting, 'report', context='accounting: ')
+        headroom = self.Optional(accounting, 'headroom', float, 'accounting: ')
+        if headroom is not None:
+            self.Check(headroom >= 1, 'accounting: <headroom> must be >= 1')
+
+    def ValidateIslands(self, root):
+        islands = root.find('islands')
+        for name in ['count', 'interval', 'migrants']:
+            value = self.Optional(islands, name, int, 'islands: ')
+            if value is not None:
+                self.Check(value >= 1,
+                           'islands: <{}> must be >= 1'.format(name))
+
+    def ValidateFeasibility(self, root):
+        feasibility = root.find('feasibility')
+        self.Choice(feasibility, 'enabled', ['true', 'false'],
+                    'feasibility: ')
+        for name in ['neighbors', 'attempts']:
+            value = self.Optional(feasibility, name, int, 'feasibility: ')
+            if value is not None:
+                self.Check(value >= 1,
+                           'feasibility: <{}> must be >= 1'.format(name))
+        threshold = self.Optional(feasibility, 'threshold', float,
+                                  'feasibility: ')
+        if threshold is not None:
+            self.Check(0 <= threshold < 1,
+                       'feasibility: <threshold> must be in [0, 1)')
+
+    def ValidateRefinement(self, root):
+        refinement = root.find('refinement')
+        self.Choice(refinement, 'enabled', ['true', 'false'], 'refinement: ')
+        for name in ['stall', 'rounds']:
+            value = self.Optional(refinement, name, int, 'refinement: ')
+            if value is not None:
+                self.Check(value >= 1,
+                           'refinement: <{}> must be >= 1'.format(name))
+        radius = self.Optional(refinement, 'radius', float, 'refinement: ')
+        if radius is not None:
+            self.Check(0 < radius <= 0.5,
+                       'refinement: <radius> must be in (0, 0.5]')
+        smallest = self.Optional(refinement, 'min_radius', float,
+                                 'refinement: ')
+        if smallest is not None:
+            self.Check(smallest > 0, 'refinement: <min_radius> must be > 0')
+
+    def ValidateNoise(self, root):
+        noise = root.find('noise')
+        self.Choice(noise, 'enabled', ['true', 'false'], 'noise: ')
+        slots = self.Optional(noise, 'slots', int, 'noise: ')
+        if slots is not None:
+            self.Check(slots >= 1, 'noise: <slots> must be >= 1')
+        z = self.Optional(noise, 'z', float, 'noise: ')
+        if z is not None:
+            self.Check(z > 0, 'noise: <z> must be > 0')
+        replicates = self.Optional(noise, 'max_replicates', int, 'noise: ')
+        if replicates is not None:
+            self.Check(replicates >= 2,
+                       'noise: <max_replicates> must be >= 2')
+
+    def ValidateScheduler(self, root):
+        scheduler = root.find('scheduler')
+        self.Choice(scheduler, 'policy', ['static', 'predictive'],
+                    'scheduler: ')
+        ridge = self.Optional(scheduler, 'ridge', float, 'scheduler: ')
+        if ridge is not None:
+            self.Check(ridge > 0, 'scheduler: <ridge> must be > 0')
+        stage = self.Optional(scheduler, 'stage', context='scheduler: ')
+        if stage is not None:
+            policy = scheduler.find('policy')
+            self.Check(policy is not None
+                       and policy.text.strip().lower() == 'predictive',
+                       'scheduler: <stage> needs the predictive policy')
+            temps = []
+            if root.find('data') is not None:
+                temps = [temp.find('temp').text.strip() for temp in
+                         root.find('data').findall('temperature')
+                         if temp.find('temp') is not None
+                         and temp.find('temp').text is not None]
+            for temp in stage.split():
+                self.Check(temp in temps, 'scheduler: <stage> temperature {} '
+                                          'is not in <data>'.format(temp))
+            self.Check(len(set(stage.split())) < len(temps),
+                       'scheduler: <stage> must leave at least one '
+                       'temperature for the second stage')
+
+    def ValidateReweighting(self, root):
+        rew = root.find('reweighting')
+        if rew is None:
+            return
+        enabled = self.Choice(rew, 'enabled', ['true', 'false'],
+                              'reweighting: ')
+        # Every other atom type would be counted as a site of the searched
+        # parameters
+        if enabled is not None and enabled.lower() == 'true':
+            self.Require(rew, 'atomtype', context='reweighting: ')
+        else:
+            self.Optional(rew, 'atomtype', context='reweighting: ')
+        self.Optional(rew, 'min_samples', float, 'reweighting: ')
+        for tag in ['states', 'start_iteration']:
+            value = self.Optional(rew, tag, int, 'reweighting: ')
+            if value is not None:
+                self.Check(value >= 1,
+                           'reweighting: <{}> must be >= 1'.format(tag))
+        discard = self.Optional(rew, 'discard', float, 'reweighting: ')
+        if discard is not None:
+            self.Check(0 <= discard < 1,
+                       'reweighting: <discard> must be in [0, 1)')
+
+        # Each term is a parameter name or a number; the exponents must be
+        # integers so their pair sums can be stored
+        parameters = {}
+        if root.find('parameters') is not None:
+            for par in root.find('parameters').findall('parameter'):
+                if par.find('name') is not None and par.find('kind') is not None:
+                    parameters[par.find('name').text.strip()] = (
+                        par.find('kind').text.strip())
+        for tag in ['epsilon', 'sigma', 'repulsive', 'attractive']:
+            spec = self.Optional(rew, tag, context='reweighting: ')
+            if spec is None or spec in parameters:
+                if tag in ['repulsive', 'attractive'] and spec is not None:
+                    self.Check(parameters[spec] == 'discrete',
+                               'reweighting: <{}> parameter {} must be '
+                               'discrete'.format(tag, spec))
+                continue
+            try:
+                value = float(spec)
+            except ValueError:
+                self.errors.append('reweighting: <{}> is neither a parameter '
+                                   'nor a number: {}'.format(tag, spec))
+                continue
+            if tag in ['repulsive', 'attractive']:
+                self.Check(value == int(value),
+                           'reweighting: <{}> must be an integer'.format(tag))
+        if rew.find('epsilon') is None:
+            self.Check('epsilon' in parameters,
+                       'reweighting: no parameter named epsilon, set '
+                       '<epsilon>')
+        if rew.find('sigma') is None:
+            self.Check('sigma' in parameters,
+                       'reweighting: no parameter named sigma, set <sigma>')
+
+    def Raise(self):
+        if len(self.errors) > 0:
+            raise ConfigurationError('Invalid configuration:\n  ' +
+                                     '\n  '.join(self.errors))
+
+
+# Pre-flight checks shared by the --dry-run mode of both methods
+class DryRunReport:
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.lines = []
+
+    def Info(self, message):
+        self.lines.append(message)
+
+    def Warning(self, message):
+        self.warnings.append(message)
+
+    def Error(self, message):
+        self.errors.append(message)
+
+    def CheckFile(self, filename):
+        if not os.path.isfile(filename):
+            self.Error('missing file: ' + filename)
+            return False
+        return True
+
+    def CheckExecutable(self, filename):
+        if not os.path.isfile(filename):
+            self.Error('executable not found: ' + filename)
+            return False
+        if not os.access(filename, os.X_OK):
+            self.Warning('not executable (will be chmod-ed): ' + filename)
+        return True
+
+    # Replace every (pattern, value) in the template text, report patterns
+    # that do not occur and any known pattern left after substitution.
+    def Render(self, filename, substitutions, all_patterns, required=True):
+        if not self.CheckFile(filename):
+            return None
+        with open(filename, 'r') as file:
+            text = file.read()
+        for pattern, value in substitutions:
+            if pattern not in text:
+                message = 'pattern {} not found in {}'.format(pattern,
+                                                               filename)
+                if required:
+                    self.Error(message)
+                else:
+                    self.Warning(message)
+            text = text.replace(pattern, str(value))
+        for pattern in all_patterns:
+            if pattern in text:
+                self.Error('pattern {} left unsubstituted in {}'.format(
+                    pattern, filename))
+        return text
+
+    # Input files a rendered GOMC config reads (Parameters, Coordinates and
+    # Structure lines)
+    @staticmethod
+    def ConfFiles(text):
+        files = []
+        for line in text.split('\n'):
+            columns = line.split('#')[0].split()
+            if len(columns) >= 2 and columns[0] in ['Parameters', 'Coordinates',
+                                                    'Structure']:
+                files.append(columns[-1])
+        return files
+
+    # Whether a GOMC output keyword such as CoordinatesFreq is enabled
+    @staticmethod
+    def ConfEnabled(text, keyword):
+        for line in text.split('\n'):
+            columns = line.split('#')[0].split()
+            if len(columns) >= 2 and columns[0] == keyword:
+                return columns[1].lower() == 'true'
+        return False
+
+    def Print(self):
+        for line in self.lines:
+            print(line)
+        for warning in self.warnings:
+            print('WARNING: ' + warning)
+        for error in self.errors:
+            print('ERROR: ' + error)
+        if len(self.errors) == 0:
+            print('Dry run passed with {} warning(s).'.format(
+                len(self.warnings)))
+            return 0
+        print('Dry run failed with {} error(s).'.format(len(self.errors)))
+        return 1
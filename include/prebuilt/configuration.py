@@ -0,0 +1,72 @@
+import xml.etree.ElementTree
+
+from parameter import Parameters
+from temperature import Temperatures
+from simulation import Simulation
+from particleswarm import ParticleSwarmParameters
+from optimizer import OptimizerParameters
+from convergence import ConvergenceParameters
+from initializer import InitializerParameters
+from metrics import MetricsParameters
+from reweighting import ReweightingParameters
+from scheduler import SchedulerParameters
+from accounting import AccountingParameters
+from islands import IslandParameters
+from noise import NoiseParameters
+from feasibility import FeasibilityParameters
+from refinement import RefinementParameters
+from validation import Validator, ConfigurationError
+
+# par.xml is parsed and validated once on rank 0; the resulting object is
+# broadcast to the other ranks.
+class Configuration:
+  def __init__(self, inputfile):
+    try:
+      root = xml.etree.ElementTree.parse(inputfile).getroot()
+    except (IOError, xml.etree.ElementTree.ParseError) as err:
+      raise ConfigurationError('Cannot read {}: {}'.format(inputfile, err))
+    Configuration.Validate(root)
+
+    self.parameters = Parameters(root)
+    self.temperatures = Temperatures(root)
+    self.simulation = Simulation(root)
+    self.psoparameters = ParticleSwarmParameters(root)
+    self.optparameters = OptimizerParameters(root)
+    self.convparameters = ConvergenceParameters(root)
+    self.initparameters = InitializerParameters(root)
+    self.metrics = MetricsParameters(root)
+    self.reweighting = ReweightingParameters(root)
+    self.scheduler = SchedulerParameters(root)
+    self.accounting = AccountingParameters(root)
+    self.islands = IslandParameters(root)
+    self.noise = NoiseParameters(root)
+    self.feasibility = FeasibilityParameters(root)
+    self.refinement = RefinementParameters(root)
+
+  @staticmethod
+  def Validate(root):
+    validator = Validator()
+    validator.ValidateParameters(root, [('filename', str)])
+    validator.ValidateSearch(root)
+    validator.ValidateMetrics(root)
+    validator.ValidateReweighting(root)
+    validator.ValidateScheduler(root)
+    validator.ValidateAccounting(root)
+    validator.ValidateIslands(root)
+    validator.ValidateNoise(root)
+    validator.ValidateFeasibility(root)
+    validator.ValidateRefinement(root)
+
+    data = root.find('data')
+    if data is None or len(data.findall('temperature')) == 0:
+      validator.Check(False, 'missing <data> with at least one <temperature>')
+    else:
+      for i, temp in enumerate(data.findall('temperature')):
+        context = 'temperature {}: '.format(i + 1)
+        validator.Require(temp, 'temp', float, context=context)
+        validator.Require(temp, 'expt_dens', float, context=context)
+
+    validator.Require(root.find('simulation'), 'executable',
+                      context='simulation: ')
+
+    validator.Raise()
@@ -0,0 +1,72 @@
+import os
+import shutil
+
+from configuration import Configuration
+from validation import ConfigurationError, DryRunReport
+from utility import Utility
+
+# Pre-flight check run with --dry-run: renders every parameter file for a
+# sample particle without running any simulation.
+class DryRun:
+  @staticmethod
+  def Run(numIt, nPop, filename):
+    try:
+      config = Configuration(filename)
+    except ConfigurationError as err:
+      print(err)
+      return 1
+    if config.convparameters.max_iterations is not None:
+      numIt = config.convparameters.max_iterations
+
+    report = DryRunReport()
+    parameters = config.parameters.parameters
+    temperatures = config.temperatures.temperatures
+
+    # Sample particle: the reference if there is one, the middle otherwise
+    sample = []
+    for par in parameters:
+      if par.reference is not None:
+        val = par.reference
+      elif par.kind == 'discrete':
+        val = Utility.ScaleDiscrete(0.5, par.start, par.end)
+      else:
+        val = Utility.ScaleContinuous(0.5, par.start, par.end)
+      sample.append((par.filename, par.pattern, val))
+    all_patterns = [par.pattern for par in parameters]
+
+    executable = config.simulation.executable
+    if shutil.which(executable) is None:
+      report.Error('executable {} is not on PATH'.format(executable))
+
+    for temp in temperatures:
+      folder = 'PREBUILT/RunFiles/' + temp.temperature + 'K/'
+      if not os.path.isdir(folder):
+        report.Error('missing directory: ' + folder)
+        continue
+      filenames = set(filename for filename, _, _ in sample)
+      filenames.add('in.conf')
+      for filename in sorted(filenames):
+        text = report.Render(folder + filename,
+                             [(pattern, val) for name, pattern, val in sample
+                              if name == filename],
+                             all_patterns)
+        # in.conf restarts from files that must already be in RunFiles
+        if filename == 'in.conf' and text is not None:
+          for name in DryRunReport.ConfFiles(text):
+            report.CheckFile(folder + name)
+          if (config.reweighting.enabled
+              and not DryRunReport.ConfEnabled(text, 'CoordinatesFreq')):
+            report.Error('reweighting needs CoordinatesFreq true in '
+                         + folder + 'in.conf')
+
+    number_of_temperatures = len(temperatures)
+    number_of_candidates = len(range(0, nPop, number_of_temperatures))
+    total = (numIt + 1) * number_of_candidates * number_of_temperatures
+    report.Info('Parameters: {}'.format(
+      ', '.join(par.name for par in parameters)))
+    report.Info('Temperatures: {}'.format(
+      ', '.join(temp.temperature for temp in temperatures)))
+    report.Info('Optimizer: {}, {} candidates, up to {} iterations'.format(
+      config.optparameters.kind, number_of_candidates, numIt))
+    report.Info('Estimated simulations: {}'.format(total))
+    return report.Print()
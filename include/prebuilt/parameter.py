@@ -1,5 +1,3 @@
-import xml.etree.ElementTree
-
 class Parameter:
   def __init__(self, pars):
     self.filename = pars['filename']
@@ -8,6 +6,7 @@ class Parameter:
     self.start = float(pars['start'])
     self.end = float(pars['end'])
     self.pattern = pars['pattern']
+    self.reference = pars['reference']
 
   def __str__(self):
     return '{} {} {} {} {} {}'.format(self.filename, self.name, self.kind,
@@ -15,11 +14,10 @@ class Parameter:
                                       self.pattern)
 
 class Parameters:
-  def __init__(self, inputfile):
+  def __init__(self, root):
     self.parameters = []
         
-    e = xml.etree.ElementTree.parse(inputfile).getroot()
-    for par in e.find('parameters').findall('parameter'):
+    for par in root.find('parameters').findall('parameter'):
       pars = {}
       pars['filename'] = par.find('filename').text
       pars['name'] = par.find('name').text
@@ -27,6 +25,11 @@ class Parameters:
       pars['start'] = par.find('start').text
       pars['end'] = par.find('end').text
       pars['pattern'] = par.find('pattern').text
+      # reference is optional and only used for reference initialization
+      if par.find('reference') is not None:
+        pars['reference'] = par.find('reference').text
+      else:
+        pars['reference'] = None
       
       self.parameters.append(Parameter(pars))
 
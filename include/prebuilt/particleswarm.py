@@ -1,9 +1,10 @@
-import xml.etree.ElementTree
-
 class ParticleSwarmParameters:
-  def __init__(self, inputfile):
-    e = xml.etree.ElementTree.parse(inputfile).getroot()
-    
-    self.w = float(e.find('pso').find('w').text)
-    self.c1 = float(e.find('pso').find('c1').text)
-    self.c2 = float(e.find('pso').find('c2').text)
\ No newline at end of file
+  def __init__(self, root):
+    # Only required by the pso optimizer
+    if root.find('pso') is None:
+      self.w = self.c1 = self.c2 = None
+      return
+
+    self.w = float(root.find('pso').find('w').text)
+    self.c1 = float(root.find('pso').find('c1').text)
+    self.c2 = float(root.find('pso').find('c2').text)
\ No newline at end of file
@@ -1,8 +1,5 @@
 import numpy as np
-import xml.etree.ElementTree
 
 class Simulation:
-  def __init__(self, inputfile):
-    e = xml.etree.ElementTree.parse(inputfile).getroot()
-    
-    self.executable = e.find('simulation').find('executable').text
\ No newline at end of file
+  def __init__(self, root):
+    self.executable = root.find('simulation').find('executable').text
\ No newline at end of file
@@ -1,6 +1,5 @@
 import numpy as np
 from mpi4py import MPI
-import xml.etree.ElementTree
 
 
 comm = MPI.COMM_WORLD
@@ -13,11 +12,10 @@ class Temperature:
     self.expt_dens = pars['expt_dens']
 
 class Temperatures:
-  def __init__(self, inputfile):
+  def __init__(self, root):
     self.temperatures = []
     
-    e = xml.etree.ElementTree.parse(inputfile).getroot()
-    for temp in e.find('data').findall('temperature'):
+    for temp in root.find('data').findall('temperature'):
       pars = {}
       pars['temperature'] = temp.find('temp').text
       pars['expt_dens'] = temp.find('expt_dens').text
@@ -1,14 +1,21 @@
 import numpy as np
 from mpi4py import MPI
 import os
+import sys
 import datetime
+import re
 import fileinput
 from pathlib import Path
 
+from accounting import ResourceUsage
+
 comm = MPI.COMM_WORLD
 size = comm.Get_size()
 rank = comm.Get_rank()
 
+# Absolute path of log.txt in the directory the campaign was started from
+logfile = os.path.join(os.getcwd(), 'log.txt')
+
 class Utility:
   @staticmethod
   def MakeDirectory(directory):
@@ -22,9 +29,15 @@ class Utility:
   def ReplaceText(filename, text_to_search, replacement_text):
     filename = os.getcwd() + '/' + filename
 
+    found = False
     with fileinput.FileInput(filename, inplace=True) as file:
       for line in file:
+        if text_to_search in line:
+          found = True
         print(line.replace(text_to_search, replacement_text), end='')
+    if not found:
+      Utility.LogMessage('Pattern {} not found in {}'.format(text_to_search,
+                                                            filename))
   
   @staticmethod
   def ReplaceParameters(particle, directory, tempinfo):
@@ -51,17 +64,48 @@ class Utility:
     return scale_pos
 
   @staticmethod
-  def RunSimulation(temperatures, directory, executable, number_of_temperatures):
+  def SimulationFolder(temp, directory):
+    return directory + '/' + temp.temperature + 'K/'
+
+  @staticmethod
+  def RunSimulation(temp, directory, executable):
     loadmodule = 'module swap gnu7/7.3.0 intel/2019;'
-    cd = 'cd ' + directory
+    cd = 'cd ' + Utility.SimulationFolder(temp, directory) + ';'
     end_part = executable + ' in.conf > out.log 2>&1'
-    temp = temperatures[int(rank % number_of_temperatures)]
-    folder = '/' + temp.temperature + 'K/;'
-    command = loadmodule + cd + folder + end_part
-    ret = os.system(command)
+    command = loadmodule + cd + end_part
+    ret, usage = ResourceUsage.Run(command)
     if ret != 0:
       Utility.LogMessage('Simulation ' + directory + ' returned with ' + str(ret) + ' return code!')
+    return ret, usage
           
+  @staticmethod
+  def ReadDensity(directory, folder):
+    # Mean density of the last 20% of the blocks and its standard error
+    filename = directory + folder + 'Blk_SPCE_BOX_0.dat'
+    my_file = Path(filename)
+    if(not my_file.is_file()): # simulation failed for some reason
+      Utility.LogMessage('Error reading file ' + filename)
+      return 9999, 0.0           # return 9999 as the density
+    with open(filename, 'r') as file:
+      lines = []
+      numlines = 0
+      for line in file:
+        lines.append(line)
+        numlines += 1
+      if numlines < 10:
+        Utility.LogMessage('File exists but doesn\'t have enough data: ' + filename)
+        return 9999, 0.0
+      start_line = int(numlines * 0.8)
+      length = numlines - start_line
+      blocks = []
+      for i in range(length):
+        index = i + start_line
+        line = lines[index]
+        line = re.sub(' +', ' ', line).strip()
+        columns = line.split(' ')
+        blocks.append(float(columns[10]))
+    return np.mean(blocks), np.std(blocks, ddof=1) / np.sqrt(length)
+
   @staticmethod
   def GetCost(particle, directory, tempinfo):
     temperatures = tempinfo.temperatures
@@ -71,35 +115,49 @@ class Utility:
       folders.append('/' + temp.temperature + 'K/')
       target_densities.append(float(temp.expt_dens))
     densities = []
+    errors = []
     for folder in folders:
-      filename = directory + folder + 'Blk_SPCE_BOX_0.dat'
-      density = 0
-      my_file = Path(filename)
-      if(not my_file.is_file()): # simulation failed for some reason
-        Utility.LogMessage('Error reading file ' + filename)
-        densities.append(9999)   # return 9999 as the density
-        continue                 # continue to the next folder
-      with open(filename, 'r') as file:
-        lines = []
-        numlines = 0
-        for line in file:
-          lines.append(line)
-          numlines += 1
-        if numlines < 10:
-          Utility.LogMessage('File exists but doesn\'t have enough data: ' + filename)
-          density = 9999
-        else:
-          start_line = int(numlines * 0.8)
-          length = numlines - start_line
-          for i in range(length):
-            index = i + start_line
-            line = lines[index]
-            line = re.sub(' +', ' ', line).strip()
-            columns = line.split(' ')
-            density += float(columns[10])
-          density = density / length
+      density, error = Utility.ReadDensity(directory, folder)
       densities.append(density)
+      errors.append(error)
     np.copyto(particle.dens, densities)
+    np.copyto(particle.dens_err, errors)
+    particle.cost_err = Utility.CostError(target_densities, errors,
+                                          temperatures)
+    return Utility.CostFunction(target_densities, densities, temperatures)
+
+  @staticmethod
+  def CostError(target_densities, errors, temperatures):
+    # The cost is linear in the relative error at every temperature; its
+    # coefficient is the cost of a relative error of one
+    variance = 0.0
+    for i in range(len(errors)):
+      worse = list(target_densities)
+      worse[i] = 2 * target_densities[i]
+      coefficient = Utility.CostFunction(target_densities, worse, temperatures)
+      variance += (coefficient * errors[i] / target_densities[i]) ** 2
+    return np.sqrt(variance)
+
+  @staticmethod
+  def GetCostBound(particle, directory, tempinfo, indices):
+    # Lower bound of GetCost from the temperatures in `indices` only. The
+    # other densities are set to their targets, which minimizes the cost
+    # as long as it grows with the error at every temperature.
+    temperatures = tempinfo.temperatures
+    target_densities = [float(temp.expt_dens) for temp in temperatures]
+    densities = list(target_densities)
+    measured = np.full(len(temperatures), np.nan)
+    for i in indices:
+      folder = '/' + temperatures[i].temperature + 'K/'
+      densities[i], _ = Utility.ReadDensity(directory, folder)
+      measured[i] = densities[i]
+    np.copyto(particle.dens, measured)
+    for i in range(len(temperatures)):
+      if i not in indices:
+        worse = list(target_densities)
+        worse[i] = 2 * target_densities[i]
+        if Utility.CostFunction(target_densities, worse, temperatures) < 0:
+          return -np.inf
     return Utility.CostFunction(target_densities, densities, temperatures)
   
   @staticmethod
@@ -121,6 +179,44 @@ class Utility:
     final = np.sum(errors) * liq_coeff + sum_of_slops * slope_coeff
     return final
   
+  @staticmethod
+  def ReweightCandidates(swarm, num_of_temps, estimator, best_cost):
+    # Candidates whose densities at every temperature can be reweighted
+    # from earlier simulations are scored without simulating. An estimate
+    # better than the global best is confirmed by simulating.
+    estimator.Load()
+    temperatures = swarm[0].tempinfo.temperatures
+    target_densities = [float(temp.expt_dens) for temp in temperatures]
+    scored = []
+    for i in range(0, len(swarm), num_of_temps):
+      particle = swarm[i]
+      particle.ConvertPosToPars()
+      estimates = []
+      for temp in temperatures:
+        estimate = estimator.Estimate(particle.pos, particle.pars,
+                                      temp.temperature)
+        if estimate is None:
+          break
+        estimates.append(estimate)
+      # Replicates exist to be simulated
+      reweighted = (len(estimates) == len(temperatures)
+                    and not particle.replicate)
+      if reweighted:
+        densities = [density for density, _ in estimates]
+        cost = Utility.CostFunction(target_densities, densities, temperatures)
+        reweighted = cost >= best_cost
+      for j in range(i, i + num_of_temps):
+        swarm[j].reweighted = reweighted
+      if reweighted:
+        np.copyto(particle.dens, densities)
+        particle.cost = cost
+        scored.append('{} (effective samples {:.0f})'.format(
+          i // num_of_temps, min(n for _, n in estimates)))
+    if len(scored) > 0:
+      Utility.LogMessage('Candidates scored by reweighting: {}'.format(
+        ', '.join(scored)))
+    return len(scored)
+
   @staticmethod
   def GetBestParticle(swarm, num_of_temps):
     best_particle = swarm[0]
@@ -132,9 +228,23 @@ class Utility:
           best_particle = particle
     return best_particle
 
+  @staticmethod
+  def AssignPositions(swarm, positions, num_of_temps):
+    # Every rank sharing a particle directory gets the same position
+    for i in range(len(swarm)):
+      swarm[i].MoveTo(positions[int(i / num_of_temps)])
+
+  @staticmethod
+  def GetCosts(swarm, num_of_temps):
+    costs = []
+    for i in range(len(swarm)):
+      if i % num_of_temps == 0:
+        costs.append(swarm[i].cost)
+    return np.array(costs)
+
   @staticmethod
   def LogMessage(message):
-    with open('log.txt', 'a') as file:
+    with open(logfile, 'a') as file:
       out = str(datetime.datetime.now()) + ' - '
       out += str(rank) + ' - '
       out += message + '\n'
@@ -143,9 +253,12 @@ class Utility:
   
   @staticmethod
   def PrintCoordinates(it, p):
+    # One line per particle; str() wraps long arrays over several lines
+    arrays = [np.array2string(np.asarray(a), max_line_width=np.inf,
+                              threshold=sys.maxsize)
+              for a in [p.pos, p.pars, p.dens, p.vel, p.best_pos]]
     with open('data.csv', 'a') as file:
-      file.write('{},{},{},{},{},{},{}\n'
-                 .format(it, p.pos, p.pars, p.dens, p.vel, p.best_pos, p.cost))
+      file.write('{},{},{},{},{},{},{}\n'.format(it, *arrays, p.cost))
       file.flush()
       
   @staticmethod
@@ -15,6 +15,14 @@ size = comm.Get_size()
 rank = comm.Get_rank()
 
 sys.path.append("./include/automated/")
+sys.path.append("./include/common/")
 from pso import PSO
 
+# Check the configuration, templates and input files without running
+if '--dry-run' in sys.argv:
+  if rank == 0:
+    from dryrun import DryRun
+    sys.exit(DryRun.Run(30, 80, 'par.xml'))
+  sys.exit(0)
+
 pso = PSO(30, 80, 'par.xml')